@@ -0,0 +1,100 @@
+"""
+    Benchmark of loading large boatswain files
+
+    Writes a synthetic boatswain file and compares parsing it with the
+    pure python yaml loader, the libyaml loader and loading it from the
+    description cache.
+
+    Usage:
+        python benchmarks/bench_loader.py [--images 10000] [--repeat 3]
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import yaml
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+
+from boatswain.description import load_description  # noqa: E402
+
+
+def synthesize(count, width=10):
+    """
+        A boatswain description of count images, every image is built
+        from one of the width images before it
+    """
+    images = {}
+    for index in range(count):
+        definition = {
+            'context': 'images/{}'.format(index),
+            'before': 'make -C images/{} prepare'.format(index),
+        }
+        if index:
+            definition['from'] = 'image{}:bench'.format(
+                max(0, index - 1 - index % width))
+        images['image{}:bench'.format(index)] = definition
+    return {'version': 1.0, 'organisation': 'bench', 'images': images}
+
+
+def best_of(repeat, function):
+    """
+        The fastest of repeat calls of function in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.time()
+        function()
+        times.append(time.time() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--images', type=int, default=10000,
+                        help='Number of images in the boatswain file')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs, the fastest run is reported')
+    arguments = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'boatswain.yml')
+        with open(path, 'w') as yamlfile:
+            yaml.safe_dump(synthesize(arguments.images), yamlfile,
+                           default_flow_style=False)
+        cache = os.path.join(directory, 'description.json')
+
+        def parse(loader):
+            def load():
+                with open(path) as yamlfile:
+                    return yaml.load(yamlfile, Loader=loader)
+            return load
+
+        loaders = [('python', parse(yaml.SafeLoader))]
+        if hasattr(yaml, 'CSafeLoader'):
+            loaders.append(('libyaml', parse(yaml.CSafeLoader)))
+        else:
+            print('pyyaml was built without libyaml')
+        # Fill the cache once, the runs only read it
+        load_description(path, cache=cache)
+        loaders.append(('cached', lambda: load_description(path,
+                                                           cache=cache)))
+
+        size = os.path.getsize(path) / 1024.0 / 1024.0
+        for name, load in loaders:
+            print('{:6} images {:5.1f} MB  {:8} {:8.3f} s'.format(
+                arguments.images, size, name,
+                best_of(arguments.repeat, load)))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+"""
+    Benchmark of boatswain against a fake docker daemon
+
+    Builds, pushes and cleans synthetic graphs of images with Boatswain
+    (or AsyncBoatswain) against the fake daemon of the test suite, which
+    streams realistic build and push responses over a unix socket. The
+    daemon takes a fixed time per build or push, so the difference with
+    the ideal schedule is the overhead of boatswain itself. The images
+    are pushed to the fake registry of the test suite, which forgets
+    them before every push, so every push pushes all of its images.
+
+    Usage:
+        python benchmarks/bench_scheduler.py [--sizes 100 1000 10000]
+            [--jobs 8] [--latency 0.01] [--engine sync|async]
+            [--save results.json] [--compare results.json]
+
+    With --compare the run fails when an action got slower than the
+    saved result by more than the tolerance.
+"""
+from __future__ import print_function
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'test'))
+
+from boatswain import Boatswain  # noqa: E402
+from boatswain.aio import AsyncBoatswain  # noqa: E402
+from fake_daemon import FakeDaemon, FakeRegistry  # noqa: E402
+
+DOCKERFILE = u"""FROM {parent}
+ENV IMAGE={name}
+RUN make
+RUN make install
+CMD ["run"]
+"""
+
+
+def synthesize(count, directory, organisation='bench', width=10, roots=0.05,
+               seed=42):
+    """
+        A boatswain description of count images, every image is built
+        from one of the width images before it, or from a base image
+
+        :param roots: The fraction of images built from a base image
+        :type roots: float
+    """
+    random.seed(seed)
+    images = {}
+    for index in range(count):
+        name = 'image{}:bench'.format(index)
+        context = os.path.join(directory, str(index))
+        os.mkdir(context)
+
+        definition = {'context': context}
+        parent = 'alpine:latest'
+        if index and random.random() >= roots:
+            parent = 'image{}:bench'.format(
+                random.randrange(max(0, index - width), index))
+            definition['from'] = parent
+            parent = organisation + '/' + parent
+
+        with open(os.path.join(context, 'Dockerfile'), 'w') as dockerfile:
+            dockerfile.write(DOCKERFILE.format(parent=parent, name=name))
+        images[name] = definition
+
+    return {'version': 1.0, 'organisation': organisation, 'images': images}
+
+
+def depth(images):
+    """
+        The number of images on the longest chain of parents
+    """
+    depths = {}
+    for name in images:
+        chain = []
+        while name in images and name not in depths:
+            chain.append(name)
+            name = images[name].get('from')
+        known = depths.get(name, 0)
+        for name in reversed(chain):
+            known += 1
+            depths[name] = known
+    return max(depths.values()) if depths else 0
+
+
+def ancestors(name, images):
+    """
+        The image and the images it is built from
+    """
+    chain = []
+    while name in images:
+        chain.append(name)
+        name = images[name].get('from')
+    return chain
+
+
+def ideal(count, chain, jobs, latency):
+    """
+        The time the daemon needs at least for count builds or pushes
+        with a longest chain of chain images and jobs workers
+    """
+    if not chain:
+        return 0.0
+    return max(chain, -(-count // jobs)) * latency
+
+
+def actions(description, jobs):
+    """
+        The benchmarked actions with the number of images and the
+        longest chain of images they process, removing images does
+        not take the daemon any time
+    """
+    images = description['images']
+    longest = depth(images)
+    # The image with the longest chain of parents
+    chain = max((ancestors(name, images) for name in images), key=len)
+    leaf = chain[0]
+    return [
+        ('build', lambda bosun: bosun.build(), len(images), longest),
+        ('push', lambda bosun: bosun.push(), len(images), longest),
+        ('clean', lambda bosun: bosun.clean(), len(images), 0),
+        ('build_up_to', lambda bosun: bosun.build_up_to(leaf),
+         len(chain), len(chain)),
+        ('push_up_to', lambda bosun: bosun.push_up_to(leaf),
+         len(chain), len(chain)),
+        ('clean_up_to', lambda bosun: bosun.clean_up_to(leaf),
+         len(chain), 0),
+    ]
+
+
+def run_sync(description, jobs, measure, prepare):
+    with Boatswain(description, verbose=0, jobs=jobs) as bosun:
+        for name, action, count, chain in actions(description, jobs):
+            prepare(name, bosun)
+            start = time.time()
+            result = action(bosun)
+            measure(name, count, chain, result, time.time() - start)
+
+
+def run_async(description, jobs, measure, prepare):
+    async def run_all():
+        async with AsyncBoatswain(description, verbose=0, jobs=jobs) as bosun:
+            for name, action, count, chain in actions(description, jobs):
+                prepare(name, bosun)
+                start = time.time()
+                result = await action(bosun)
+                measure(name, count, chain, result, time.time() - start)
+
+    loop = asyncio.new_event_loop()
+    try:
+        loop.run_until_complete(run_all())
+    finally:
+        loop.close()
+
+
+def benchmark(size, arguments):
+    """
+        Run all actions on a graph of size images and return the
+        elapsed seconds per action
+    """
+    directory = tempfile.mkdtemp()
+    results = {}
+    try:
+        with FakeDaemon(latency=arguments.latency, output=arguments.output,
+                        layers=arguments.layers) as daemon, \
+                FakeRegistry(daemon) as registry:
+            os.environ['DOCKER_HOST'] = daemon.url
+            description = synthesize(size, directory,
+                                     organisation=registry.host + '/bench',
+                                     width=arguments.width)
+
+            def prepare(name, bosun):
+                if name.startswith('push'):
+                    # The registry forgets the pushed images, so a push
+                    # does not skip the images of an earlier row
+                    daemon.registry.clear()
+                    bosun.registry.digests.clear()
+
+            def measure(name, count, chain, result, elapsed):
+                if not result['success']:
+                    raise RuntimeError('{} failed: {}'.format(
+                        name, result['failed']))
+
+                skipped = len(result.get('skipped', []))
+                done = count - skipped
+                best = ideal(done, min(chain, done), arguments.jobs,
+                             arguments.latency)
+                overhead = (elapsed - best) / count * 1000
+                print('{:>6} {:12} {:6} images {:6} skipped {:8.3f} s  '
+                      'ideal {:8.3f} s  overhead {:6.2f} ms/image  '
+                      'daemon concurrency {}'.format(
+                          size, name, count, skipped, elapsed, best,
+                          overhead, daemon.most_running))
+                daemon.most_running = 0
+                results[name] = elapsed
+
+            if arguments.engine == 'async':
+                run_async(description, arguments.jobs, measure, prepare)
+            else:
+                run_sync(description, arguments.jobs, measure, prepare)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+        The actions that got slower than the baseline
+    """
+    slower = []
+    for size, timings in results.items():
+        for name, elapsed in timings.items():
+            before = baseline.get(size, {}).get(name)
+            if before is not None and elapsed > before * (1 + tolerance):
+                slower.append('{} images {}: {:.3f} s, was {:.3f} s'.format(
+                    size, name, elapsed, before))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[100, 1000, 10000],
+                        help='Numbers of images in the synthetic graphs')
+    parser.add_argument('-j', '--jobs', type=int, default=8,
+                        help='Number of images processed in parallel')
+    parser.add_argument('--latency', type=float, default=0.01,
+                        help='Seconds the daemon takes per build or push')
+    parser.add_argument('--output', type=int, default=10,
+                        help='Lines of output of every RUN instruction')
+    parser.add_argument('--layers', type=int, default=3,
+                        help='Layers of every pushed image')
+    parser.add_argument('--width', type=int, default=10,
+                        help='Images are built from one of this many '
+                             'images before them')
+    parser.add_argument('--engine', choices=['sync', 'async'],
+                        default='sync', help='Boatswain or AsyncBoatswain')
+    parser.add_argument('--save', help='Write the results to a json file')
+    parser.add_argument('--compare',
+                        help='Fail when slower than the results in this file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed slowdown with --compare')
+    arguments = parser.parse_args()
+
+    results = {}
+    for size in arguments.sizes:
+        results[str(size)] = benchmark(size, arguments)
+
+    if arguments.save:
+        with open(arguments.save, 'w') as resultfile:
+            json.dump(results, resultfile, indent=2, sort_keys=True)
+
+    if arguments.compare:
+        with open(arguments.compare) as resultfile:
+            slower = compare(results, json.load(resultfile),
+                             arguments.tolerance)
+        for line in slower:
+            print('Slower: ' + line)
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
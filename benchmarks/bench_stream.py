@@ -0,0 +1,123 @@
+"""
+    Micro-benchmark of decoding the docker progress stream
+
+    Replays a recorded docker build log through the line splitting
+    decoder boatswain used before and through JsonStreamDecoder.
+    Without a recorded log a verbose build log is synthesized.
+
+    Usage:
+        python benchmarks/bench_stream.py [--log build.log] [--size 50]
+
+    A recorded log is the raw response body of POST /build, for example:
+        curl --unix-socket /var/run/docker.sock -X POST \\
+            -H 'Content-Type: application/x-tar' --data-binary @context.tar \\
+            http://localhost/build > build.log
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from boatswain.stream import JsonStreamDecoder  # noqa: E402
+
+
+def synthesize(size):
+    """
+        A verbose build log of about size bytes, as a list of messages
+    """
+    random.seed(42)
+    messages = []
+    total = 0
+    step = 0
+    while total < size:
+        step += 1
+        lines = [{'stream': 'Step {}/1000 : RUN make -j8 target{}'.format(step, step)},
+                 {'stream': '\n'},
+                 {'stream': ' ---> Running in 816abeca3961\n'}]
+        for _ in range(random.randint(10, 200)):
+            length = random.choice([40, 80, 120, 4000])
+            lines.append({'stream': 'x' * length + '\n'})
+        lines.append({'stream': 'Removing intermediate container 816abeca3961\n'})
+        for line in lines:
+            message = json.dumps(line).encode('utf-8') + b'\r\n'
+            messages.append(message)
+            total += len(message)
+    messages.append(b'{"stream":"Successfully built ad8402983js9\\n"}\r\n')
+    return messages
+
+
+def split(data, size):
+    """
+        Split data in http chunks of at most size bytes
+    """
+    return [data[index:index + size] for index in range(0, len(data), size)]
+
+
+def line_decoder(chunks):
+    """
+        The decoder boatswain used before, it only works when every
+        chunk holds whole json objects
+    """
+    count = 0
+    for response in chunks:
+        lines = response.rstrip().decode('utf-8')
+        lines = lines.replace('\r', '')
+        for response_line in lines.split('\n'):
+            json.loads(response_line)
+            count += 1
+    return count
+
+
+def stream_decoder(chunks):
+    count = 0
+    for _ in JsonStreamDecoder().decode(chunks):
+        count += 1
+    return count
+
+
+def measure(label, function, chunks, size):
+    start = time.time()
+    try:
+        count = function(chunks)
+    except ValueError as error:
+        print('{:40} failed: {}'.format(label, error))
+        return
+    elapsed = time.time() - start
+    print('{:40} {:8.3f} s {:8.1f} MB/s {:8d} messages'.format(
+        label, elapsed, size / elapsed / 1e6, count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--log', help='Recorded docker build log')
+    parser.add_argument('--size', type=int, default=50,
+                        help='Size of the synthesized log in MB')
+    arguments = parser.parse_args()
+
+    if arguments.log:
+        with open(arguments.log, 'rb') as logfile:
+            messages = logfile.read().splitlines(True)
+    else:
+        messages = synthesize(arguments.size * 1000 * 1000)
+    data = b''.join(messages)
+    size = len(data)
+    print('Replaying {:.1f} MB in {} messages'.format(size / 1e6, len(messages)))
+
+    measure('line decoder, aligned chunks', line_decoder, messages, size)
+    measure('stream decoder, aligned chunks', stream_decoder, messages, size)
+    for chunk_size in (4096, 32768):
+        chunks = split(data, chunk_size)
+        measure('line decoder, {} byte chunks'.format(chunk_size),
+                line_decoder, chunks, size)
+        measure('stream decoder, {} byte chunks'.format(chunk_size),
+                stream_decoder, chunks, size)
+
+
+if __name__ == '__main__':
+    main()
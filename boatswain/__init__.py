@@ -3,6 +3,7 @@ from .boatswain import Boatswain
 from .util import find_dependencies, extract_id, extract_step
 from .cli import argparser
 from .display import Node, Tree
+from .graph import ImageGraph
 
 __all__ = [
     "Boatswain",
@@ -11,5 +12,6 @@ __all__ = [
     "extract_id",
     "extract_step",
     "Node",
-    "Tree"
+    "Tree",
+    "ImageGraph"
 ]
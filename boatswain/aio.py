@@ -0,0 +1,691 @@
+"""
+    Asyncio engine for boatswain
+
+    AsyncBoatswain offers the same actions as Boatswain, but talks to
+    the docker daemon socket directly with asyncio instead of using
+    docker-py. Build and push responses are streamed on the event loop,
+    so a single thread can drive many daemon operations at once.
+
+    Example:
+        async with AsyncBoatswain(description, jobs=8) as bosun:
+            result = await bosun.build()
+"""
+from __future__ import absolute_import, print_function
+
+import asyncio
+import functools
+import json
+import os
+import sys
+import time
+
+try:
+    from urllib.parse import quote, urlencode, urlparse
+except ImportError:  # pragma: no cover
+    from urllib import quote, urlencode
+    from urlparse import urlparse
+
+from .bcolors import bcolors
+from .boatswain import Boatswain
+from .context import CHUNK_SIZE
+from .errors import BuildError, DaemonError, ParseError
+from .scheduler import ScheduleState
+from .stream import JsonStreamDecoder
+from .util import split_tag
+
+DEFAULT_DOCKER_HOST = 'unix:///var/run/docker.sock'
+
+
+class DockerSocket(object):
+    """
+        Minimal asyncio HTTP client for the docker engine API
+
+        Every request uses its own connection, so any number of
+        requests can be streamed at the same time.
+
+        :param url: The address of the daemon, either
+                    unix:///path/to/socket or tcp://host:port
+        :type url: string
+    """
+
+    def __init__(self, url=DEFAULT_DOCKER_HOST):
+        address = urlparse(url)
+        if address.scheme not in ('unix', 'tcp', 'http'):
+            raise ValueError("Unsupported docker host: " + url)
+        self.url = url
+        self.address = address
+
+    @classmethod
+    def from_env(cls):
+        """
+            The daemon given by the DOCKER_HOST environment variable
+        """
+        return cls(os.environ.get('DOCKER_HOST') or DEFAULT_DOCKER_HOST)
+
+    def _connect(self):
+        if self.address.scheme == 'unix':
+            return asyncio.open_unix_connection(self.address.path)
+        return asyncio.open_connection(self.address.hostname,
+                                       self.address.port or 2375)
+
+    async def request(self, method, path, params=None, body=None,
+                      headers=None):
+        """
+            Send a request and return the response once its headers
+            arrived. Error responses raise a DaemonError.
+
+            :param body: The request body, either bytes or a file-like
+                         object with a length, such as a ContextArchive
+        """
+        if params:
+            path += '?' + urlencode(params)
+
+        head = ['{} {} HTTP/1.1'.format(method, path),
+                'Host: docker',
+                'Connection: close',
+                'Content-Length: {}'.format(len(body) if body else 0)]
+        for key, value in (headers or {}).items():
+            head.append('{}: {}'.format(key, value))
+
+        reader, writer = await self._connect()
+        try:
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+            if isinstance(body, bytes):
+                writer.write(body)
+            elif body is not None:
+                await self._send_file(writer, body)
+            await writer.drain()
+
+            response = Response(reader, writer)
+            await response.read_head()
+        except BaseException:
+            writer.close()
+            raise
+
+        if response.status >= 400:
+            content = await response.read()
+            try:
+                message = json.loads(content.decode('utf-8'))['message']
+            except (ValueError, KeyError, TypeError):
+                message = content.decode('utf-8', 'replace')
+            raise DaemonError("{} {}: {}".format(response.status,
+                                                 response.reason,
+                                                 message.strip()))
+        return response
+
+    @staticmethod
+    async def _send_file(writer, body):
+        """
+            Send a file-like body, reading it outside of the event loop
+        """
+        loop = asyncio.get_event_loop()
+        try:
+            while True:
+                chunk = await loop.run_in_executor(None, body.read, CHUNK_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                await writer.drain()
+        finally:
+            body.close()
+
+    async def get_json(self, path, params=None):
+        """
+            The json content of a GET request
+        """
+        response = await self.request('GET', path, params)
+        return json.loads((await response.read()).decode('utf-8'))
+
+
+class Response(object):
+    """
+        A response of the docker daemon whose body is read on demand
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.status = None
+        self.reason = None
+        self.headers = {}
+        # Bytes left of a body with a known length
+        self.remaining = None
+        self.chunked = False
+        self.finished = False
+
+    async def read_head(self):
+        line = (await self.reader.readline()).decode('latin-1')
+        parts = line.split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise ParseError("Invalid docker response: " + line.strip())
+        self.status = int(parts[1])
+        self.reason = parts[2].strip() if len(parts) > 2 else ''
+
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            key, _, value = line.partition(':')
+            self.headers[key.strip().lower()] = value.strip()
+
+        self.chunked = self.headers.get('transfer-encoding') == 'chunked'
+        if not self.chunked and 'content-length' in self.headers:
+            self.remaining = int(self.headers['content-length'])
+
+    async def read_chunk(self):
+        """
+            The next part of the body, b'' at the end of the body
+        """
+        if self.finished:
+            return b''
+
+        if self.chunked:
+            size = int((await self.reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await self.reader.readline()
+                return self._finish()
+            chunk = await self.reader.readexactly(size)
+            await self.reader.readline()
+            return chunk
+
+        if self.remaining is None:
+            chunk = await self.reader.read(CHUNK_SIZE)
+        elif self.remaining:
+            chunk = await self.reader.read(min(CHUNK_SIZE, self.remaining))
+            self.remaining -= len(chunk)
+        else:
+            chunk = b''
+
+        if not chunk:
+            return self._finish()
+        return chunk
+
+    async def read(self):
+        """
+            The rest of the body
+        """
+        chunks = []
+        chunk = await self.read_chunk()
+        while chunk:
+            chunks.append(chunk)
+            chunk = await self.read_chunk()
+        return b''.join(chunks)
+
+    def _finish(self):
+        self.finished = True
+        self.close()
+        return b''
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncScheduler(object):
+    """
+        Runs coroutines over a dependency graph on the event loop,
+        the asyncio counterpart of the Scheduler
+    """
+
+    def __init__(self, jobs=1, keep_going=False, limits=None):
+        self.jobs = max(1, int(jobs))
+        self.keep_going = keep_going
+        self.limits = limits or {}
+
+    async def run(self, names, dependencies, task, callback=None,
+                  resources=None, priorities=None):
+        """
+            Await task(name) for all names in dependency order,
+            see Scheduler.run for the parameters and result
+        """
+        state = ScheduleState(names, dependencies, resources, self.limits,
+                              priorities)
+        running = {}
+
+        while True:
+            while not state.stopped and len(running) < self.jobs:
+                name = state.start()
+                if name is None:
+                    break
+                running[asyncio.ensure_future(task(name))] = name
+
+            if not running:
+                break
+
+            finished, _ = await asyncio.wait(
+                list(running), return_when=asyncio.FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                succeeded = bool(future.result())
+                state.finish(name, succeeded, self.keep_going)
+                if callback is not None:
+                    callback(name, succeeded)
+
+        return state.result()
+
+
+class AsyncBoatswain(Boatswain):
+    """
+        Boatswain on asyncio, all actions are coroutines that return
+        the same dictionaries as their Boatswain counterparts
+
+        The images of the daemon are listed when the object is
+        entered with async with, or on the first action.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.opened = False
+        super(AsyncBoatswain, self).__init__(*args, **kwargs)
+        if len(self.hosts) > 1:
+            raise ValueError("AsyncBoatswain builds on a single docker host")
+
+    def _docker_client(self, host=None, streaming=False):
+        if host is None:
+            return DockerSocket.from_env()
+        return DockerSocket(host)
+
+    def _load_cache(self):
+        # The daemon images are only listed in open()
+        pass
+
+    async def open(self):
+        """
+            List the daemon images and load the cache
+        """
+        if self.opened:
+            return
+        images = await self.client.get_json('/images/json')
+        self.index.update((image['Id'], image.get('RepoTags') or [],
+                           image.get('RepoDigests') or [])
+                          for image in images)
+        self.cache.load(self.index)
+        self.opened = True
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        return self.__exit__(exc_type, exc_value, traceback)
+
+    async def _action(self, result):
+        """
+            Await the result of a synchronous entry point, which is a
+            coroutine unless there was nothing to do
+        """
+        if asyncio.iscoroutine(result):
+            result = await result
+        return result
+
+    async def build(self, dryrun=False, force=False):
+        await self.open()
+        return await self._action(super(AsyncBoatswain, self).build(
+            dryrun=dryrun, force=force))
+
+    async def clean(self, dryrun=False, prune=False):
+        await self.open()
+        return await self._action(super(AsyncBoatswain, self).clean(
+            dryrun=dryrun, prune=prune))
+
+    async def push(self, dryrun=False):
+        await self.open()
+        return await self._action(super(AsyncBoatswain, self).push(
+            dryrun=dryrun))
+
+    async def build_dict(self, images, dryrun=False, force=False):
+        await self.open()
+        return await self._action(super(AsyncBoatswain, self).build_dict(
+            images, dryrun=dryrun, force=force))
+
+    async def clean_dict(self, images, dryrun=False, prune=False):
+        await self.open()
+        return await self._action(super(AsyncBoatswain, self).clean_dict(
+            images, dryrun=dryrun, prune=prune))
+
+    async def push_dict(self, images, dryrun=False):
+        await self.open()
+        return await self._action(super(AsyncBoatswain, self).push_dict(
+            images, dryrun=dryrun))
+
+    async def build_up_to(self, name, dryrun=False, force=False):
+        await self.open()
+        return await self._action(super(AsyncBoatswain, self).build_up_to(
+            name, dryrun=dryrun, force=force))
+
+    async def clean_up_to(self, name, dryrun=False, prune=False):
+        await self.open()
+        return await self._action(super(AsyncBoatswain, self).clean_up_to(
+            name, dryrun=dryrun, prune=prune))
+
+    async def push_up_to(self, name, dryrun=False):
+        await self.open()
+        return await self._action(super(AsyncBoatswain, self).push_up_to(
+            name, dryrun=dryrun))
+
+    async def build_up_to_dict(self, name, images, dryrun=False, force=False):
+        await self.open()
+        return await self._action(
+            super(AsyncBoatswain, self).build_up_to_dict(
+                name, images, dryrun=dryrun, force=force))
+
+    async def clean_up_to_dict(self, name, images, dryrun=False,
+                               prune=False):
+        await self.open()
+        return await self._action(
+            super(AsyncBoatswain, self).clean_up_to_dict(
+                name, images, dryrun=dryrun, prune=prune))
+
+    async def push_up_to_dict(self, name, images, dryrun=False):
+        await self.open()
+        return await self._action(
+            super(AsyncBoatswain, self).push_up_to_dict(
+                name, images, dryrun=dryrun))
+
+    async def build_changed(self, ref, dryrun=False, force=False,
+                            boatswain_file=None):
+        await self.open()
+        return await self._action(super(AsyncBoatswain, self).build_changed(
+            ref, dryrun=dryrun, force=force, boatswain_file=boatswain_file))
+
+    async def build_downstream(self, names, dryrun=False, force=False):
+        await self.open()
+        return await self._action(
+            super(AsyncBoatswain, self).build_downstream(
+                names, dryrun=dryrun, force=force))
+
+    async def clean_downstream(self, names, dryrun=False, prune=False):
+        await self.open()
+        return await self._action(
+            super(AsyncBoatswain, self).clean_downstream(
+                names, dryrun=dryrun, prune=prune))
+
+    async def push_downstream(self, names, dryrun=False):
+        await self.open()
+        return await self._action(
+            super(AsyncBoatswain, self).push_downstream(
+                names, dryrun=dryrun))
+
+    async def build_list(self, names, images, dryrun=False, force=False):
+        self.logger.debug("build_list: %s", names)
+
+        graph, order, dependencies, aliases = self._plan_build(names, images)
+        tagged = {}
+
+        async def build(name):
+            start = time.time()
+            with self.trace.span(name, 'build', image=name):
+                if not await self.build_one(name, images[name],
+                                            dryrun=dryrun, force=force):
+                    return False
+                self._record_duration(name, start, dryrun)
+                self._parent_built(before, name, images, priorities)
+                key = self.manifest.recorded_key(name)
+                for alias in aliases[name]:
+                    tagged[alias] = await self.tag_one(
+                        alias, images[alias], self.cache[name], dryrun=dryrun,
+                        key=key)
+                return True
+
+        self.skipped.difference_update(names)
+        priorities = self._build_priorities(graph, aliases)
+        before = None
+        if not dryrun:
+            before = self._start_before_commands(order, images,
+                                                 dependencies, priorities)
+            self._start_pulls(order, images, priorities, aliases)
+        try:
+            result = await self._run_list(order, dependencies, build,
+                                          self.jobs, priorities=priorities)
+        finally:
+            self._stop_before_commands(before)
+            self._stop_pulls(None)
+            if not dryrun:
+                self.manifest.save()
+                self.cache.save()
+
+        return self._build_summary(graph, aliases, tagged, result)
+
+    async def clean_list(self, names, images, dryrun=False, prune=False):
+        order, dependencies = self._plan_clean(names, images)
+        missing = []
+        self.image_sizes = {} if dryrun else await self._image_sizes()
+        self.freed = []
+
+        async def clean(name):
+            with self.trace.span(name, 'clean', image=name):
+                removed = await self.clean_one(name, images[name],
+                                               dryrun=dryrun)
+            return self._cleaned(name, removed, missing)
+
+        result = await self._run_list(order, dependencies, clean, self.jobs)
+        if prune and not dryrun:
+            try:
+                pruned = await self.client.request('POST', '/images/prune')
+                pruned = json.loads((await pruned.read()).decode('utf-8'))
+            except DaemonError as error:
+                print(bcolors.fail("Could not prune the images: " +
+                                   str(error)), file=sys.stderr)
+            else:
+                self.freed.append(pruned.get('SpaceReclaimed') or 0)
+        return self._clean_summary(result, missing, sum(self.freed))
+
+    async def _image_sizes(self):
+        try:
+            listed = await self.client.get_json('/images/json', {'all': '1'})
+        except DaemonError as error:
+            print(bcolors.warning("Could not list the images: " + str(error)),
+                  file=sys.stderr)
+            listed = []
+        return {self.host: dict((image['Id'], (image.get('Size') or 0,
+                                               image.get('ParentId')))
+                                for image in listed)}
+
+    async def push_list(self, names, images, dryrun=False):
+        order, dependencies, registries = self._plan_push(names, images)
+        self.skipped.difference_update(names)
+        if not dryrun:
+            await self._in_executor(self._fetch_digests, names, images)
+
+        async def push(name):
+            with self.trace.span(name, 'push', image=name):
+                return await self.push_one(name, images[name], dryrun=dryrun)
+
+        result = await self._run_list(order, dependencies, push, self.jobs,
+                                      limits=self.registry_limits,
+                                      resources=registries)
+        return self._push_summary(result)
+
+    async def _run_list(self, names, dependencies, task, jobs=1, limits=None,
+                        resources=None, priorities=None):
+        self._start_total_progress(len(names))
+        scheduler = AsyncScheduler(jobs, keep_going=self.continue_building,
+                                   limits=limits)
+        try:
+            return await scheduler.run(names, dependencies, task,
+                                       callback=self._step_progress,
+                                       resources=resources,
+                                       priorities=priorities)
+        finally:
+            self._stop_total_progress()
+
+    async def _in_executor(self, function, *args, **kwargs):
+        """
+            Run blocking work, such as hashing contexts or running
+            before commands, outside of the event loop
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(function, *args, **kwargs))
+
+    async def build_one(self, name, definition, dryrun=False, force=False):
+        started = await self._in_executor(self._start_build, name, definition,
+                                          dryrun=dryrun, force=force)
+        if isinstance(started, bool):
+            return started
+        tag, directory, key = started
+
+        tags = self.cache_from_tags.get(name, [])
+        pulls = [self.pulls[tag] for tag in tags if tag in self.pulls]
+        if pulls:
+            await asyncio.wait(pulls)
+        cache_from = self._pulled(tags)
+
+        params = {'t': tag, 'rm': 'true', 'nocache': str(bool(force)).lower()}
+        if cache_from:
+            params['cachefrom'] = json.dumps(cache_from)
+        try:
+            with self.trace.span('upload context', 'context', image=name):
+                archive = await self._in_executor(self._context_stream,
+                                                  directory)
+                response = await self.client.request(
+                    'POST', '/build', params, body=archive,
+                    headers={'Content-Type': 'application/x-tar'})
+            ident = await self._stream_progress(name, response)
+        except (ParseError, BuildError, DaemonError) as error:
+            self._build_failed(name, error)
+            return False
+        except (IOError, OSError) as error:
+            self._build_failed(name, "could not send the context: " +
+                               str(error))
+            return False
+
+        self._finish_build(name, tag, key, ident)
+        return True
+
+    async def tag_one(self, name, definition, ident, dryrun=False,
+                      key=None):
+        tag = self._get_full_tag(name, definition)
+
+        if self._start_tag(name, tag, ident, dryrun=dryrun) and not dryrun:
+            repository, version = split_tag(tag)
+            try:
+                response = await self.client.request(
+                    'POST', '/images/{}/tag'.format(quote(ident, safe='/:')),
+                    {'repo': repository, 'tag': version})
+                await response.read()
+            except DaemonError as error:
+                self._tag_failed(name, error)
+                return False
+
+        self._finish_tag(name, tag, ident, dryrun=dryrun, key=key)
+        return True
+
+    async def clean_one(self, name, definition, dryrun=False):
+        tag = self._get_full_tag(name, definition)
+        if not self._check_if_exists(tag):
+            return False
+
+        if self.verbose > 1:
+            print("removing image with tag: " + bcolors.blue(tag))
+        if not dryrun:
+            response = await self.client.request(
+                'DELETE', '/images/' + quote(tag, safe='/:'))
+            self._record_freed(json.loads(
+                (await response.read()).decode('utf-8')))
+            self.index.remove(tag)
+            self._forget(name)
+        return True
+
+    async def push_one(self, name, definition, dryrun=False):
+        tag = self._get_full_tag(name, definition)
+        if not self._check_if_exists(tag):
+            return False
+        # The digests were fetched by push_list, this does not block
+        if not dryrun and self._in_registry(name, tag):
+            return True
+
+        if self.verbose > 1:
+            print("Pushing image with tag: " + bcolors.blue(tag))
+        if dryrun:
+            return True
+
+        repository, version = split_tag(tag)
+        headers = {}
+        auth = self._auth_header(repository)
+        if auth:
+            headers['X-Registry-Auth'] = auth
+        try:
+            response = await self.client.request(
+                'POST', '/images/{}/push'.format(quote(repository, safe='/:')),
+                {'tag': version}, headers=headers)
+            digest = await self._stream_progress(name, response,
+                                                 has_step=False)
+            self._pushed(tag, digest)
+            return digest
+        except (ParseError, BuildError, DaemonError) as error:
+            print(bcolors.fail("An error occurred during build: " +
+                               str(error)) + "\n", file=sys.stderr)
+            return False
+
+    def _start_pulls(self, order, images, priorities, aliases):
+        limit = asyncio.Semaphore(max(1, self.jobs))
+        for tag in self._missing_cache_tags(order, images, priorities,
+                                            aliases):
+            self.pulls[tag] = asyncio.ensure_future(self._pull(tag, limit))
+
+    def _stop_pulls(self, executor):
+        for pull in self.pulls.values():
+            pull.cancel()
+        self.pulls.clear()
+        self.cache_from_tags.clear()
+
+    async def _pull(self, tag, limit):
+        repository, version = split_tag(tag)
+        headers = {}
+        auth = self._auth_header(repository)
+        if auth:
+            headers['X-Registry-Auth'] = auth
+        decoder = JsonStreamDecoder()
+        try:
+            async with limit:
+                with self.trace.span('pull ' + tag, 'pull'):
+                    response = await self.client.request(
+                        'POST', '/images/create',
+                        {'fromImage': repository, 'tag': version},
+                        headers=headers)
+                    try:
+                        chunk = await response.read_chunk()
+                        while chunk:
+                            for message in decoder.feed(chunk):
+                                if 'error' in message:
+                                    raise DaemonError(message['error'])
+                            chunk = await response.read_chunk()
+                    finally:
+                        response.close()
+        except DaemonError as error:
+            self._pull_failed(tag, error)
+            return False
+        return True
+
+    @staticmethod
+    def _auth_header(repository):
+        """
+            The X-Registry-Auth header for pushing repository, from the
+            credentials docker login stored
+        """
+        import docker
+        registry = docker.auth.resolve_repository_name(repository)[0]
+        config = docker.auth.resolve_authconfig(docker.auth.load_config(),
+                                                registry)
+        if not config:
+            return None
+        return docker.auth.encode_header(config).decode('ascii')
+
+    async def _stream_progress(self, name, response, has_step=True):
+        """
+            The asyncio counterpart of _docker_progress
+        """
+        progress = self._start_progress(name, has_step)
+        decoder = JsonStreamDecoder()
+        try:
+            chunk = await response.read_chunk()
+            while chunk:
+                for json_response in decoder.feed(chunk):
+                    self._handle_progress(progress, json_response)
+                chunk = await response.read_chunk()
+            for json_response in decoder.close():
+                self._handle_progress(progress, json_response)
+
+            return progress['ident'] or False
+        finally:
+            response.close()
+            self._stop_progress(progress)
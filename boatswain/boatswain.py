@@ -21,6 +21,9 @@
 """
 from __future__ import absolute_import, print_function
 
+import collections
+import contextlib
+import functools
 import json
 import logging
 import os
@@ -28,14 +31,30 @@ import posixpath
 import shlex
 import subprocess
 import sys
-import traceback
-
-import docker
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 from .bcolors import bcolors
+from .cache import ImageCache
+from .changes import changed_images
+from .client import DEFAULT_TIMEOUT, api_error, \
+    pool_size as client_pool_size, shared_client
+from .context import CHUNK_SIZE, ContextCache, stream_context
 from .errors import BuildError, ParseError
-from .util import extract_id, extract_step, find_dependencies
-from .timed_progress_bar import TimedProgressBar
+from .graph import ImageGraph
+from .hosts import assign_hosts, transfer_image
+from .index import ImageIndex
+from .manifest import BuildManifest
+from .util import extract_id, extract_step, registry_host, split_tag
+from .scheduler import Scheduler
+from .stream import JsonStreamDecoder
+from .progress import ProgressRenderer
+from .registry import RegistryDigests
+from .trace import Trace
+
+# Number of output lines of a before command shown when it fails
+COMMAND_OUTPUT_LINES = 50
 
 
 class Boatswain(object):
@@ -55,21 +74,90 @@ class Boatswain(object):
             context: example/docker3
     """
 
-    def __init__(self, description, continue_building=False, verbose=1):
+    def __init__(self, description, continue_building=False, verbose=1,
+                 jobs=1, state_dir=None, persistent_cache=False,
+                 registry_limits=None, trace=None, cache_from=False,
+                 hosts=None, pool_size=None, timeout=DEFAULT_TIMEOUT,
+                 cache_contexts=False):
         self.logger = logging.getLogger('boatswain')
 
-        # Docker interaction
-        self.client = docker.from_env(version="auto")
+        # Docker interaction, the daemon is only contacted when an
+        # action needs it, so dry runs and the tree work without docker
+        self.clients = {}
+        self.indexes = {}
+        self.client_lock = threading.Lock()
+        # Connections kept open per daemon and seconds to wait for it
+        self.pool_size = pool_size or client_pool_size(jobs)
+        self.timeout = timeout
         self.description = description
 
-        # Cache of images built by boatswain
-        self.cache = {}
-
-        # Progress
-        self.progress_bar = None
+        # Builds are spread over these docker hosts, every thread
+        # talks to the host of the image it is working on
+        self.hosts = list(hosts or [])
+        self.local = threading.local()
+        self.transfers = {}
+
+        # Inputs of earlier builds, to skip images that did not change
+        self.state_dir = state_dir
+        manifest = None
+        # The state is never part of a context, even when it is kept
+        # inside of one
+        self.excludes = []
+        if state_dir is not None:
+            manifest = os.path.join(state_dir, 'manifest.json')
+            self.excludes.append(state_dir)
+        self.manifest = BuildManifest(manifest, self.excludes)
+        self.skipped = set()
+        # Before commands that were started ahead of their build, and
+        # those that start once the image they wait for is built
+        self.before_futures = {}
+        self.before_waiting = {}
+        # host -> image id -> (size, parent id) before a clean, and the
+        # bytes freed by the images it removed
+        self.image_sizes = {}
+        self.freed = []
+
+        # Pull earlier pushed images to use their layers as build cache,
+        # for all images or as set per image with cache_from
+        self.cache_from = cache_from or description.get('cache_from', False)
+        # name -> tags to use as build cache, tag -> pull in progress
+        self.cache_from_tags = {}
+        self.pulls = {}
+
+        # Tar archives of unchanged contexts are reused. A cached
+        # archive is a full copy of its context, so it is opt-in.
+        self.contexts = None
+        if cache_contexts and state_dir is not None:
+            self.contexts = ContextCache(os.path.join(state_dir, 'contexts'),
+                                         self.excludes)
+
+        # Cache of images built by boatswain, optionally kept
+        # between runs so earlier builds can be reused as parents
+        cache = None
+        if persistent_cache and state_dir is not None:
+            cache = os.path.join(state_dir, 'cache.json')
+        self.cache = ImageCache(cache)
+        self.cache_loaded = False
+
+        # Timing of images, steps and phases, written on exit
+        self.trace = Trace(trace)
+
+        # Progress of all images and of the images in flight
+        self.progress = ProgressRenderer(enabled=verbose >= 1)
         self.continue_building = continue_building
         self.verbose = verbose
 
+        # Number of images that are processed in parallel
+        self.jobs = jobs
+
+        # Digests of the images in their registries, pushes of images
+        # the registry already has are skipped
+        self.registry = RegistryDigests()
+
+        # Maximum number of concurrent pushes per registry host
+        self.registry_limits = dict(self.description.get('registries') or {})
+        self.registry_limits.update(registry_limits or {})
+
         if 'organisation' in self.description:
             self.organisation = self.description['organisation']
         else:
@@ -82,14 +170,108 @@ class Boatswain(object):
             self.images = {}
             self.logger.warning("No images defined in the boatswain description")
 
+    @property
+    def host(self):
+        """
+            The docker host the current thread works on, None for the
+            host of the environment
+        """
+        host = getattr(self.local, 'host', None)
+        if host is None and self.hosts:
+            return self.hosts[0]
+        return host
+
+    @contextlib.contextmanager
+    def _on_host(self, host):
+        """
+            Talk to host in the with block
+        """
+        previous = getattr(self.local, 'host', None)
+        self.local.host = host
+        try:
+            yield
+        finally:
+            self.local.host = previous
+
+    @property
+    def client(self):
+        """
+            The client used to talk to the docker daemon of the current
+            host, it is created on first use
+        """
+        return self._host_client(self.host)
+
+    @property
+    def stream_client(self):
+        """
+            The client for builds, pushes and pulls of the current host,
+            which wait as long as the daemon takes
+        """
+        return self._host_client(self.host, streaming=True)
+
+    @property
+    def index(self):
+        """
+            The images of the current host
+        """
+        return self._host_index(self.host)
+
+    def _host_client(self, host, streaming=False):
+        client = self.clients.get((host, streaming))
+        if client is None:
+            with self.client_lock:
+                client = self.clients.get((host, streaming))
+                if client is None:
+                    client = self._docker_client(host, streaming)
+                    self.clients[(host, streaming)] = client
+        return client
+
+    def _host_index(self, host):
+        index = self.indexes.get(host)
+        if index is None:
+            with self.client_lock:
+                index = self.indexes.get(host)
+                if index is None:
+                    index = self.indexes[host] = ImageIndex(
+                        connect=functools.partial(self._host_client, host))
+        return index
+
+    def _docker_client(self, host=None, streaming=False):
+        """
+            The client used to talk to the docker daemon at host, or the
+            daemon of the environment, streams have no timeout
+        """
+        return shared_client(host, pool_size=self.pool_size,
+                             timeout=None if streaming else self.timeout)
+
+    def _hosts_with(self, tag):
+        """
+            The hosts that have an image with the given tag
+        """
+        return [host for host in self.hosts
+                if self._host_index(host).exists(tag)]
+
+    def _host_of(self, tag):
+        """
+            The first host that has an image with the given tag,
+            the current host when none has it
+        """
+        return next(iter(self._hosts_with(tag)), self.host)
+
+    def _load_cache(self):
+        """
+            Load the images of earlier runs into the cache
+        """
+        if not self.cache_loaded:
+            self.cache_loaded = True
+            self.cache.load(self.index)
+
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        if self.progress_bar is not None:
-            self.progress_bar.stop()
-            self.progress_bar = None
-
+        self.progress.stop()
+        self.trace.save()
         return False
 
     def build(self, dryrun=False, force=False):
@@ -98,11 +280,12 @@ class Boatswain(object):
         """
         return self._do_action('build', dryrun=dryrun, force=force)
 
-    def clean(self, dryrun=False):
+    def clean(self, dryrun=False, prune=False):
         """
-            Removes all images defined in the dictionary
+            Removes all images defined in the dictionary, with prune
+            also the dangling images left on the daemon
         """
-        return self._do_action('clean', dryrun=dryrun)
+        return self._do_action('clean', dryrun=dryrun, prune=prune)
 
     def push(self, dryrun=False):
         """
@@ -124,11 +307,12 @@ class Boatswain(object):
         return self._do_action_dict('build', images, dryrun=dryrun,
                                     force=force)
 
-    def clean_dict(self, images, dryrun=False):
+    def clean_dict(self, images, dryrun=False, prune=False):
         """
             Remove all images in the dictionary
         """
-        return self._do_action_dict('clean', images, dryrun=dryrun)
+        return self._do_action_dict('clean', images, dryrun=dryrun,
+                                    prune=prune)
 
     def push_dict(self, images, dryrun=False):
         """
@@ -151,12 +335,13 @@ class Boatswain(object):
             elif action == 'push':
                 return self.push_list(names, images, **kwargs)
 
-    def clean_up_to(self, name, dryrun=False):
+    def clean_up_to(self, name, dryrun=False, prune=False):
         """
             Cleans the image with the given name and all of
             the images it depends on recursively
         """
-        return self.clean_up_to_dict(name, self.images, dryrun=dryrun)
+        return self.clean_up_to_dict(name, self.images, dryrun=dryrun,
+                                     prune=prune)
 
     def build_up_to(self, name, dryrun=False, force=False):
         """
@@ -173,13 +358,13 @@ class Boatswain(object):
         """
         return self.push_up_to_dict(name, self.images, dryrun=dryrun)
 
-    def clean_up_to_dict(self, name, images, dryrun=False):
+    def clean_up_to_dict(self, name, images, dryrun=False, prune=False):
         """
             Cleans the image with the given name and all of
             the images it depends on recursively
         """
         return self._process_up_to_dict('clean', name, images,
-                                        dryrun=dryrun)
+                                        dryrun=dryrun, prune=prune)
 
     def build_up_to_dict(self, name, images, dryrun=False, force=False):
         """
@@ -198,7 +383,7 @@ class Boatswain(object):
                                         dryrun=dryrun)
 
     def _process_up_to_dict(self, action, name, images, dryrun=False,
-                            force=False):
+                            force=False, prune=False):
         """
            Build image name and all its dependencies from a dictionary
         """
@@ -207,174 +392,879 @@ class Boatswain(object):
             self.logger.warning('No images defined')
             return {'success': True, 'images': [], 'failed': []}
         elif name not in images:
-            print(bcolors.fail("Cannot build undefined image " + name))
+            print(bcolors.fail("Cannot " + action + " undefined image " +
+                               name), file=sys.stderr)
+            return {'success': False, 'images': [], 'failed': [name]}
         else:
-            names = find_dependencies(name, images)
+            names = ImageGraph(images).ancestors([name])
             self.logger.debug(names)
+            chain = ImageGraph(images, names)
+            # Raises a DependencyError when the images form a cycle
+            chain.order()
+            undefined = chain.undefined()
+            if undefined:
+                # Every image in the chain is built from the missing one
+                for child, parent in undefined.items():
+                    print(bcolors.fail("Error: could not find a recipe for"),
+                          bcolors.blue(parent),
+                          bcolors.fail("which is needed for"),
+                          bcolors.blue(child) + "\n", file=sys.stderr)
+                return {'success': False, 'images': [], 'failed': names}
+
             if action == 'build':
+                if not dryrun:
+                    self._load_cache()
+                if not force:
+                    names = self._uncached_dependencies(names)
                 return self.build_list(names, images, dryrun=dryrun,
                                        force=force)
             elif action == 'clean':
-                return self.clean_list(names, images, dryrun=dryrun)
+                return self.clean_list(names, images, dryrun=dryrun,
+                                       prune=prune)
             elif action == 'push':
                 return self.push_list(names, images, dryrun=dryrun)
 
+    def build_changed(self, ref, dryrun=False, force=False,
+                      boatswain_file=None):
+        """
+            Builds the images whose context changed since the git ref
+            and all images built from them
+
+            Images whose definition changed are built as well when the
+            boatswain file is given. The other images are expected to
+            exist, those that do not are built too.
+        """
+        return self._build_descendants(
+            changed_images(ref, self.images, boatswain_file, self.excludes),
+            dryrun=dryrun, force=force)
+
+    def build_downstream(self, names, dryrun=False, force=False):
+        """
+            Builds the images with the given names and all images
+            built from them, directly or indirectly
+
+            Their other ancestors are expected to exist, those that
+            do not are built too.
+        """
+        return self._process_downstream('build', names, dryrun=dryrun,
+                                        force=force)
+
+    def clean_downstream(self, names, dryrun=False, prune=False):
+        """
+            Removes the images with the given names and all images
+            built from them, directly or indirectly
+        """
+        return self._process_downstream('clean', names, dryrun=dryrun,
+                                        prune=prune)
+
+    def push_downstream(self, names, dryrun=False):
+        """
+            Pushes the images with the given names and all images
+            built from them, directly or indirectly
+        """
+        return self._process_downstream('push', names, dryrun=dryrun)
+
+    def _process_downstream(self, action, names, dryrun=False, force=False,
+                            prune=False):
+        undefined = [name for name in names if name not in self.images]
+        if undefined:
+            print(bcolors.fail("Cannot " + action + " undefined image " +
+                               ", ".join(undefined)), file=sys.stderr)
+            return {'success': False, 'images': [], 'failed': undefined}
+
+        if action == 'build':
+            return self._build_descendants(names, dryrun=dryrun, force=force)
+        names = ImageGraph(self.images).descendants(names)
+        if action == 'clean':
+            return self.clean_list(names, self.images, dryrun=dryrun,
+                                   prune=prune)
+        elif action == 'push':
+            return self.push_list(names, self.images, dryrun=dryrun)
+
+    def _build_descendants(self, names, dryrun=False, force=False):
+        """
+            Build names and their descendants, and the ancestors of
+            names that do not exist
+        """
+        names = ImageGraph(self.images).descendants(names)
+        if not names:
+            return {'success': True, 'images': [], 'failed': []}
+
+        if not dryrun:
+            self._load_cache()
+        names.extend(self._missing_parents(names, self.images, dryrun))
+        return self.build_list(names, self.images, dryrun=dryrun,
+                               force=force)
+
+    def _missing_parents(self, names, images, dryrun=False):
+        """
+            The ancestors of names that do not exist and have to be built,
+            the existing ancestors are put in the cache to build from
+        """
+        missing = []
+        for parent in ImageGraph(images, names).external().values():
+            while parent in images and parent not in self.cache \
+                    and parent not in missing:
+                if dryrun:
+                    ident = 'testidentifier'
+                else:
+                    tag = self._get_full_tag(parent, images[parent])
+                    ident = self._host_index(self._host_of(tag)).get(tag)
+                if ident:
+                    self.cache[parent] = ident
+                    if not dryrun:
+                        self.cache.tags[parent] = tag
+                    break
+                missing.append(parent)
+                parent = images[parent].get('from')
+        return missing
+
+    def _uncached_dependencies(self, names):
+        """
+            Cut a chain of dependencies, as returned by
+            ImageGraph.ancestors, at the first image that is already in
+            the cache
+        """
+        for index, ancestor in enumerate(names[1:], 1):
+            if ancestor in self.cache:
+                self.logger.debug("Reusing cached %s", ancestor)
+                return names[:index]
+        return names
+
     def build_list(self, names, images, dryrun=False, force=False):
         """
             Builds the all images given in names and all the dependencies
             of these images
+
+            Images are built in parallel by self.jobs workers, an image
+            is started as soon as the image it is built from is done.
+            Images that only differ in their tag are built once and
+            tagged with the other tags afterwards.
         """
-        built = []
-        failed = []
-        success = True
         self.logger.debug("build_list: %s", names)
+        if not dryrun:
+            self._load_cache()
 
-        if self.verbose == 1:
-            self.progress_bar = TimedProgressBar(0, len(names), "Total")
-            self.progress_bar.start()
-        while len(names):
-            name = names.pop(0)  # get the first image name
-            definition = images[name]
-
-            # Make sure all the dependencies have been built
-            if 'from' in definition and definition['from'] not in self.cache:
-                if definition['from'] not in names:
-                    print(bcolors.fail("Error: could not find a recipe to build"),
-                          bcolors.blue(definition['from']),
-                          bcolors.fail("which is needed for"),
-                          bcolors.blue(name) + "\n", file=sys.stderr)
-                    # do not append this image
-                else:
-                    # Move this one to the back, because it from on another
-                    # image
-                    names.append(name)
-            else:
-                if self.build_one(name, definition, dryrun=dryrun, force=force):
-                    built.append(name)
-                elif not self.continue_building:
-                    return {'success': False, 'images': built, 'failed': [name]}
-                else:
-                    failed.append(name)
-                    success = False
+        graph, order, dependencies, aliases = self._plan_build(names, images)
+        assignment = self._assign_hosts(order, images, dryrun)
+        tagged = {}
+
+        def build(name):
+            start = time.time()
+            with self.trace.span(name, 'build', image=name), \
+                    self._on_host(assignment.get(name)):
+                if not dryrun and not self._move_parent(name, images):
+                    return False
+                if not self.build_one(name, images[name], dryrun=dryrun,
+                                      force=force):
+                    return False
+                self._record_duration(name, start, dryrun)
+                self._parent_built(before, name, images, priorities)
+                key = self.manifest.recorded_key(name)
+                for alias in aliases[name]:
+                    tagged[alias] = self.tag_one(alias, images[alias],
+                                                 self.cache[name],
+                                                 dryrun=dryrun, key=key)
+                return True
+
+        self.skipped.difference_update(names)
+        priorities = self._build_priorities(graph, aliases)
+        before = pulls = None
+        if not dryrun:
+            before = self._start_before_commands(order, images,
+                                                 dependencies, priorities)
+            if not self.hosts:
+                pulls = self._start_pulls(order, images, priorities,
+                                          aliases)
+        try:
+            # Every host builds self.jobs images at a time
+            result = self._run_list(
+                order, dependencies, build, self.jobs * max(1, len(self.hosts)),
+                limits=dict((host, self.jobs) for host in self.hosts),
+                resources=assignment, priorities=priorities)
+        finally:
+            self._stop_before_commands(before)
+            self._stop_pulls(pulls)
+            if not dryrun:
+                self.manifest.save()
+                self.cache.save()
 
-                if self.verbose == 1:
-                    self.progress_bar.step += 1
-                    self.progress_bar.imagename = name
-                    self.progress_bar.update()
+        return self._build_summary(graph, aliases, tagged, result)
+
+    def _plan_build(self, names, images):
+        """
+            Work out what build_list should build: returns the graph of
+            the images, the images to build in order, the images each of
+            them waits for and the images that are only tagged after an
+            identical build
+        """
+        graph = ImageGraph(images, names)
+        order = graph.order()
+
+        aliases = self._identical_builds(order, images)
+        representative = dict((alias, name) for name, group in aliases.items()
+                              for alias in group)
+        order = [name for name in order if name not in representative]
+
+        # A parent that is built in this run is always waited for, its
+        # new id is part of the inputs of the image. A parent outside of
+        # the graph is only waited for when it is not cached.
+        dependencies = {}
+        for name in order:
+            parent = graph.parents.get(name)
+            if parent is not None and (parent in graph.children or
+                                       parent not in self.cache):
+                dependencies[name] = [representative.get(parent, parent)]
+
+        # Report the images we cannot build before building anything
+        for name, parent in graph.external().items():
+            if parent not in self.cache:
+                print(bcolors.fail("Error: could not find a recipe to build"),
+                      bcolors.blue(parent),
+                      bcolors.fail("which is needed for"),
+                      bcolors.blue(name) + "\n", file=sys.stderr)
+
+        return graph, order, dependencies, aliases
+
+    def _assign_hosts(self, order, images, dryrun=False):
+        """
+            The host every image in order is built on, empty when
+            building on a single host
+        """
+        if len(self.hosts) < 2:
+            return {}
 
-        if self.verbose == 1:
-            self.progress_bar.stop()
-            self.progress_bar = None
+        def located(parent):
+            if dryrun or parent not in images:
+                return self.hosts
+            return self._hosts_with(self._get_full_tag(parent,
+                                                       images[parent]))
 
-        return {'success': success, 'images': built, 'failed': failed}
+        assignment = assign_hosts(ImageGraph(images, order), self.hosts,
+                                  self.manifest.durations, located)
+        if self.verbose > 1 or dryrun:
+            for name in order:
+                print("Building " + bcolors.blue(name) + " on " +
+                      bcolors.blue(assignment[name]))
+        return assignment
 
-    def clean_list(self, names, images, dryrun=False):
+    def _move_parent(self, name, images):
         """
-            Removes all images defined in the list
+            Make sure the parent of an image is on the host the image is
+            built on, by moving it from another host when needed
+        """
+        parent = images[name].get('from')
+        if len(self.hosts) < 2 or parent not in images:
+            return True
+
+        tag = self._get_full_tag(parent, images[parent])
+        host = self.host
+        with self.client_lock:
+            lock = self.transfers.setdefault((host, tag), threading.Lock())
+        with lock:
+            sources = self._hosts_with(tag)
+            if not sources or host in sources:
+                # The daemon pulls parents that no host has
+                return True
+
+            if self.verbose > 1:
+                print("Moving " + bcolors.blue(tag) + " from " +
+                      bcolors.blue(sources[0]) + " to " + bcolors.blue(host))
+            try:
+                with self.trace.span('move ' + parent, 'transfer', image=name):
+                    transfer_image(self._host_client(sources[0], True),
+                                   self.stream_client, tag)
+            except (api_error(), BuildError) as error:
+                print(bcolors.fail("Could not move ") + bcolors.blue(tag) +
+                      bcolors.fail(" to " + host + ": " + str(error)),
+                      file=sys.stderr)
+                return False
+            self.index.add(tag, self._host_index(sources[0]).get(tag))
+        return True
+
+    def _build_priorities(self, graph, aliases):
+        """
+            Prioritize the images on the longest remaining chain of
+            builds, so the critical path is started as early as possible
+
+            The chains are weighted by the durations of earlier builds.
+            Without any recorded duration images are prioritized by the
+            number of images built from them.
+        """
+        durations = self.manifest.durations
+        known = [durations[name] for name in graph.names if name in durations]
+        if known:
+            # Images that were never built take an average build
+            average = sum(known) / len(known)
+            weights = dict((name, durations.get(name, average))
+                           for name in graph.names)
+            priorities = graph.critical_paths(weights)
+        else:
+            priorities = graph.subtree_sizes()
+
+        # An image that is only tagged is started with its build
+        for name, group in aliases.items():
+            for alias in group:
+                priorities[name] = max(priorities[name], priorities[alias])
+        return priorities
+
+    def _record_duration(self, name, start, dryrun=False):
         """
-        cleaned = []
-        failed = []
-        success = True
-        if self.verbose == 1:
-            self.progress_bar = TimedProgressBar(0, len(names), "Total")
-            self.progress_bar.start()
-        while len(names):
-            name = names.pop(0)  # get the first image name
-            definition = images[name]
-
-            # Make sure all the dependencies have been built
-            if 'from' in definition and definition['from'] in names:
-                # Move this one to the back, because we first need to
-                # remove another image that this one depends on
-                names.append(name)
+            Record how long building an image took, unless it was skipped
+        """
+        if not dryrun and name not in self.skipped:
+            self.manifest.record_duration(name, time.time() - start)
+
+    def _build_summary(self, graph, aliases, tagged, result):
+        """
+            Convert the scheduler result of build_list to a boatswain
+            result dictionary
+        """
+        # The outcome of a build holds for all its aliases
+        for name in list(result['done']):
+            for alias in aliases[name]:
+                result['done' if tagged[alias] else 'failed'].append(alias)
+        for outcome in ('failed', 'blocked'):
+            for name in list(result[outcome]):
+                result[outcome].extend(aliases.get(name, []))
+
+        for name in result['blocked']:
+            if graph.parents[name] in graph.children:
+                print(bcolors.fail("Error: not building"),
+                      bcolors.blue(name),
+                      bcolors.fail("because"),
+                      bcolors.blue(graph.parents[name]),
+                      bcolors.fail("was not built") + "\n", file=sys.stderr)
+
+        summary = self._summarize(result)
+        summary['images'] = [name for name in result['done']
+                             if name not in self.skipped]
+        summary['skipped'] = [name for name in result['done']
+                              if name in self.skipped]
+        return summary
+
+    @staticmethod
+    def _identical_builds(names, images):
+        """
+            Group the names whose builds are identical: they have the
+            same context, parent and build parameters, only their tag
+            differs. Returns the first name of each group with the list
+            of the other names in its group.
+        """
+        groups = collections.OrderedDict()
+        for name in names:
+            definition = dict(images[name])
+            definition.pop('tag', None)
+            if 'context' in definition:
+                definition['context'] = os.path.abspath(definition['context'])
             else:
-                if self.clean_one(name, definition, dryrun=dryrun):
-                    cleaned.append(name)
-                elif not self.continue_building:
-                    return {'success': False, 'images': cleaned, 'failed': [name]}
-                else:
-                    failed.append(name)
-                    success = False
+                # build_one reports the missing context for each image
+                definition['name'] = name
+            key = json.dumps(definition, sort_keys=True, default=str)
+            groups.setdefault(key, []).append(name)
 
-                if self.verbose == 1:
-                    self.progress_bar.step += 1
-                    self.progress_bar.imagename = name
-                    self.progress_bar.update()
+        return collections.OrderedDict((group[0], group[1:])
+                                       for group in groups.values())
 
-        if self.verbose == 1:
-            self.progress_bar.stop()
-            self.progress_bar = None
-        return {'success': success, 'images': cleaned, 'failed': failed}
+    def clean_list(self, names, images, dryrun=False, prune=False):
+        """
+            Removes all images defined in the list
+
+            Images are removed in parallel by self.jobs workers, every
+            image after the images built from it, so removing it frees
+            its layers instead of only untagging it. With prune all the
+            dangling images of the daemon are removed as well, not only
+            those left by boatswain. The result reports the disk space
+            that was reclaimed in bytes.
+        """
+        order, dependencies = self._plan_clean(names, images)
+        hosts = self.hosts or [None]
+        missing = []
+        self.image_sizes = {} if dryrun else self._image_sizes(hosts)
+        self.freed = []
+
+        def clean(name):
+            # The image is removed from every host that has it
+            having = [None]
+            if self.hosts:
+                tag = self._get_full_tag(name, images[name])
+                having = self._hosts_with(tag) or having
+            with self.trace.span(name, 'clean', image=name):
+                cleaned = []
+                for host in having:
+                    with self._on_host(host):
+                        cleaned.append(self.clean_one(name, images[name],
+                                                      dryrun=dryrun))
+            return self._cleaned(name, all(cleaned), missing)
+
+        result = self._run_list(order, dependencies, clean, self.jobs)
+        if prune and not dryrun:
+            for host in hosts:
+                with self._on_host(host):
+                    self._prune()
+        return self._clean_summary(result, missing, sum(self.freed))
+
+    def _plan_clean(self, names, images):
+        """
+            Work out what clean_list should remove: returns the images
+            with children first and the images each of them waits for
+        """
+        graph = ImageGraph(images, names)
+        dependencies = dict((name, children)
+                            for name, children in graph.children.items()
+                            if children)
+        return list(reversed(graph.order())), dependencies
+
+    def _cleaned(self, name, removed, missing):
+        """
+            The outcome of cleaning name for the scheduler
+        """
+        if not removed and self.continue_building:
+            # A missing image holds no layers of its parent, so the
+            # parent is still removed. It is reported as failed.
+            missing.append(name)
+            return True
+        return removed
+
+    def _clean_summary(self, result, missing, reclaimed):
+        """
+            The boatswain result dictionary of clean_list
+        """
+        result['done'] = [name for name in result['done']
+                          if name not in missing]
+        # The parents of images that were not removed are kept
+        result['failed'].extend(missing + result['blocked'])
+        summary = self._summarize(result)
+        summary['reclaimed'] = reclaimed
+        return summary
+
+    def _image_sizes(self, hosts):
+        """
+            The size and parent of every image on the hosts, including
+            the intermediate images of builds. Listing the images is
+            cheap, unlike asking the daemon for its disk usage.
+        """
+        sizes = {}
+        for host in hosts:
+            with self._on_host(host):
+                try:
+                    listed = self.client.api.images(all=True)
+                except api_error() as error:
+                    # The clean goes on, its freed space is not known
+                    print(bcolors.warning("Could not list the images: " +
+                                          str(error)), file=sys.stderr)
+                    listed = []
+            sizes[host] = dict((image['Id'], (image.get('Size') or 0,
+                                              image.get('ParentId')))
+                               for image in listed)
+        return sizes
+
+    def _record_freed(self, deleted):
+        """
+            Record the bytes freed on the current host by the images the
+            daemon reported as deleted: each image holds the layers on
+            top of the image it was built from
+        """
+        sizes = self.image_sizes.get(self.host, {})
+        freed = 0
+        for entry in deleted or []:
+            size, parent = sizes.get(entry.get('Deleted'), (0, None))
+            freed += max(0, size - sizes.get(parent, (0, None))[0])
+        self.freed.append(freed)
+
+    def _prune(self):
+        """
+            Remove the dangling images of the current host
+        """
+        try:
+            pruned = self.client.images.prune()
+        except api_error() as error:
+            print(bcolors.fail("Could not prune the images: " + str(error)),
+                  file=sys.stderr)
+            return
+        self.freed.append(pruned.get('SpaceReclaimed') or 0)
 
     def push_list(self, names, images, dryrun=False):
         """
-            Removes all images defined in the list
+            Push all images defined in the list
+
+            Images are pushed in parallel by self.jobs workers, with no
+            more concurrent pushes to a registry than its limit. An image
+            is pushed after the image it is built from, so their shared
+            layers are only uploaded once. Images the registry already
+            has are skipped.
         """
-        pushed = []
-        failed = []
-        success = True
-        if self.verbose == 1:
-            self.progress_bar = TimedProgressBar(0, len(names), "Total")
-            self.progress_bar.start()
-        while len(names):
-            name = names.pop(0)  # get the first image name
-            definition = images[name]
-
-            # Make sure all the dependencies have been built
-            if 'from' in definition and definition['from'] in names:
-                # Move this one to the back, because we first need to
-                # remove another image that this one depends on
-                names.append(name)
-            else:
-                if self.push_one(name, definition, dryrun=dryrun):
-                    pushed.append(name)
-                elif not self.continue_building:
-                    return {'success': False, 'images': pushed, 'failed': [name]}
-                else:
-                    failed.append(name)
-                    success = False
-
-                if self.verbose == 1:
-                    self.progress_bar.step += 1
-                    self.progress_bar.imagename = name
-                    self.progress_bar.update()
-        if self.verbose == 1:
-            self.progress_bar.stop()
-            self.progress_bar = None
-        return {'success': success, 'images': pushed, 'failed': failed}
+        order, dependencies, registries = self._plan_push(names, images)
+        self.skipped.difference_update(names)
+        if not dryrun:
+            # A dry run does not contact the registries
+            self._fetch_digests(names, images)
+
+        def push(name):
+            tag = self._get_full_tag(name, images[name])
+            with self.trace.span(name, 'push', image=name), \
+                    self._on_host(self._host_of(tag) if self.hosts else None):
+                return self.push_one(name, images[name], dryrun=dryrun)
+
+        result = self._run_list(order, dependencies, push, self.jobs,
+                                limits=self.registry_limits,
+                                resources=registries)
+        return self._push_summary(result)
+
+    def _plan_push(self, names, images):
+        """
+            Work out what push_list should push: returns the images in
+            order, the images each of them waits for and the registry
+            each of them is pushed to
+        """
+        graph = ImageGraph(images, names)
+        dependencies = dict((name, [parent])
+                            for name, parent in graph.parents.items()
+                            if parent in graph.children)
+        registries = dict(
+            (name, registry_host(self._get_full_tag(name, images[name])))
+            for name in names)
+        return graph.order(), dependencies, registries
+
+    def _fetch_digests(self, names, images):
+        """
+            Ask the registries in parallel for the digests of the images
+            that were pushed before, push_one skips the unchanged ones
+        """
+        tags = []
+        for name in names:
+            tag = self._get_full_tag(name, images[name])
+            with self._on_host(self._host_of(tag) if self.hosts else None):
+                if self.index.digest(tag) is not None:
+                    tags.append(tag)
+        self.registry.fetch(tags, self.jobs)
+
+    def _push_summary(self, result):
+        """
+            The boatswain result dictionary of push_list
+        """
+        # Images whose parent failed to push have not been pushed either
+        result['failed'].extend(result['blocked'])
+        summary = self._summarize(result)
+        summary['images'] = [name for name in result['done']
+                             if name not in self.skipped]
+        summary['skipped'] = [name for name in result['done']
+                              if name in self.skipped]
+        return summary
+
+    def _run_list(self, names, dependencies, task, jobs=1, limits=None,
+                  resources=None, priorities=None):
+        """
+            Run task for all names using the scheduler while showing
+            the total progress
+        """
+        self._start_total_progress(len(names))
+        scheduler = Scheduler(jobs, keep_going=self.continue_building,
+                              limits=limits)
+        try:
+            return scheduler.run(names, dependencies, task,
+                                 callback=self._step_progress,
+                                 resources=resources,
+                                 priorities=priorities)
+        finally:
+            self._stop_total_progress()
+
+    def _start_total_progress(self, total):
+        """
+            Show the total progress bar for processing total images
+        """
+        self.progress.start(total)
+
+    def _stop_total_progress(self):
+        self.progress.stop()
+
+    @staticmethod
+    def _summarize(result):
+        """
+            Convert a scheduler result to a boatswain result dictionary
+        """
+        return {'success': not result['failed'], 'images': result['done'],
+                'failed': result['failed']}
+
+    def _step_progress(self, name, succeeded):
+        """
+            Advance the total progress bar after processing an image
+        """
+        self.progress.advance(name)
 
     def before_command(self, name, definition, verbose=1, dryrun=False):
+        """
+            Run the before commands of an image
+
+            When the before commands declare their inputs, they are
+            skipped if their commands, inputs and outputs did not change
+            since they last succeeded.
+        """
+        before = definition['before']
         if verbose > 1:
             print(bcolors.blue("Pre-build staging"))
-        commands = definition['before']['command']
-        for command in commands:
-            output = None
 
+        key = None
+        if not dryrun and 'inputs' in before:
+            key = self.manifest.before_key(before)
+            if self.manifest.before.get(name) == key:
+                if verbose > 1:
+                    print("Skipping unchanged before commands of " +
+                          bcolors.blue(name))
+                return True
+
+        for command in before['command']:
             args = shlex.split(command)
-            if verbose > 2:
-                output = sys.stdout
             if not dryrun:
                 if verbose > 1:
                     print("Running: ", args, " from directory ", os.getcwd())
-                try:
-                    subprocess.check_call(args, stdout=output, stderr=subprocess.PIPE)
-                except subprocess.CalledProcessError:
-                    failure_string = "\n{} from directory {}\n".format(args, os.getcwd())
+                with self.trace.span(command, 'before', image=name):
+                    returncode, output = self._run_command(args,
+                                                           echo=verbose >= 1)
+                if returncode:
+                    failure_string = "\n{} from directory {} exited with {}\n".format(
+                        args, os.getcwd(), returncode)
                     print(bcolors.fail("An exception occured during before command for ") +
                           bcolors.blue(name) +
                           bcolors.fail(":" + failure_string))
-                    print(bcolors.fail(traceback.format_exc()))
+                    print(bcolors.fail("\n".join(output)))
                     return False
             else:
                 print(os.getcwd(), "> ", args)
+
+        if key is not None:
+            # The outputs changed, so the key is computed again
+            self.manifest.record_before(name, self.manifest.before_key(before))
         return True
 
+    def _run_command(self, args, echo=False):
+        """
+            Run a command, printing its output line by line as it comes
+
+            Only the last lines of the output are kept, to report why
+            the command failed.
+
+            :returns: (exit code, list of the last lines)
+        """
+        output = collections.deque(maxlen=COMMAND_OUTPUT_LINES)
+        process = subprocess.Popen(args, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+        with process.stdout:
+            # Lines are read in bounded chunks, a command writing
+            # without newlines does not fill up memory
+            for line in iter(lambda: process.stdout.readline(CHUNK_SIZE), b''):
+                line = line.decode('utf-8', 'replace').rstrip('\n')
+                output.append(line)
+                if echo:
+                    print(line)
+        return process.wait(), list(output)
+
+    def _start_before_commands(self, order, images, dependencies,
+                               priorities):
+        """
+            Start the before commands of the images in order in the
+            background, so they run while unrelated images are built
+
+            The commands of an image start once the image it is built
+            from is built, so they never run for an image that is not
+            built because its parent failed.
+
+            :returns: The executor running the before commands
+        """
+        names = [name for name in order
+                 if 'command' in (images[name].get('before') or {})]
+        if not names:
+            return None
+
+        executor = ThreadPoolExecutor(max_workers=max(1, self.jobs))
+        ready = []
+        for name in names:
+            if dependencies.get(name):
+                self.before_waiting.setdefault(dependencies[name][0],
+                                               []).append(name)
+            else:
+                ready.append(name)
+        self._submit_before_commands(executor, ready, images, priorities)
+        return executor
+
+    def _submit_before_commands(self, executor, names, images, priorities):
+        """
+            Run the before commands of names in the background
+        """
+        # The commands of the images on the critical path go first
+        for name in sorted(names, key=lambda name: -priorities.get(name, 0)):
+            self.before_futures[name] = executor.submit(
+                self.before_command, name, images[name], verbose=self.verbose)
+
+    def _parent_built(self, executor, name, images, priorities):
+        """
+            Start the before commands of the images waiting for name
+        """
+        waiting = self.before_waiting.pop(name, None)
+        if executor is not None and waiting:
+            self._submit_before_commands(executor, waiting, images,
+                                         priorities)
+
+    def _stop_before_commands(self, executor):
+        """
+            Cancel the before commands that did not start and wait
+            for the others
+        """
+        if executor is None:
+            return
+        for future in self.before_futures.values():
+            future.cancel()
+        self.before_futures.clear()
+        self.before_waiting.clear()
+        executor.shutdown()
+
     def build_one(self, name, definition, dryrun=False, force=False):
         """
             Builds a single docker image.
             The image this docker image depends on should already be built!
         """
+        started = self._start_build(name, definition, dryrun=dryrun,
+                                    force=force)
+        if isinstance(started, bool):
+            return started
+        tag, directory, key = started
+
+        cache_from = self._pulled(self.cache_from_tags.get(name, []))
+        try:
+            # The request returns once the context is sent
+            with self.trace.span('upload context', 'context', image=name):
+                generator = self.stream_client.api.build(
+                    fileobj=self._context_stream(directory),
+                    custom_context=True, tag=tag, rm=True, nocache=force,
+                    cache_from=cache_from or None)
+            ident = self._docker_progress(name, generator)
+        except (ParseError, BuildError) as error:
+            self._build_failed(name, error)
+            return False
+        except (IOError, OSError) as error:
+            # A context file could not be read, or changed while sent
+            self._build_failed(name, "could not send the context: " +
+                               str(error))
+            return False
+
+        self._finish_build(name, tag, key, ident)
+        return True
+
+    def _cache_from(self, name, images):
+        """
+            The tags whose layers can be used as cache to build an image:
+            the earlier pushed image itself, its parent and the extra
+            tags listed in its cache_from option
+        """
+        definition = images[name]
+        option = definition.get('cache_from', self.cache_from)
+        if not option:
+            return []
+
+        tags = [self._get_full_tag(name, definition)]
+        parent = definition.get('from')
+        if parent in images:
+            tags.append(self._get_full_tag(parent, images[parent]))
+        if isinstance(option, list):
+            tags.extend(option)
+        return list(collections.OrderedDict.fromkeys(tags))
+
+    def _missing_cache_tags(self, order, images, priorities, aliases):
+        """
+            Collect the build cache tags of the images in order and
+            return those that do not exist locally, in the order they
+            should be pulled
+
+            A pull finishing after the build of its tag would replace
+            the new image with the pushed one. So the tags built or
+            tagged in this run are not pulled, except for the own tag
+            of an image: its build waits for the pull before it starts.
+        """
+        built = dict((self._get_full_tag(name, images[name]), name)
+                     for name in order)
+        for group in aliases.values():
+            for alias in group:
+                built[self._get_full_tag(alias, images[alias])] = alias
+
+        names = sorted(order, key=lambda name: -priorities.get(name, 0))
+        missing = []
+        for name in names:
+            self.cache_from_tags[name] = self._cache_from(name, images)
+            for tag in self.cache_from_tags[name]:
+                if built.get(tag, name) != name:
+                    # Used as cache once this run built it
+                    continue
+                if tag not in missing and not self.index.exists(tag):
+                    missing.append(tag)
+        return missing
+
+    def _start_pulls(self, order, images, priorities, aliases):
+        """
+            Start pulling the missing build cache tags in the background
 
+            :returns: The executor running the pulls
+        """
+        missing = self._missing_cache_tags(order, images, priorities,
+                                           aliases)
+        if not missing:
+            return None
+
+        executor = ThreadPoolExecutor(max_workers=max(1, self.jobs))
+        for tag in missing:
+            self.pulls[tag] = executor.submit(self._pull, tag)
+        return executor
+
+    def _stop_pulls(self, executor):
+        """
+            Cancel the pulls that did not start and wait for the others
+        """
+        self.cache_from_tags.clear()
+        if executor is None:
+            return
+        for future in self.pulls.values():
+            future.cancel()
+        self.pulls.clear()
+        executor.shutdown()
+
+    def _pull(self, tag):
+        """
+            Pull an image, returns whether it could be pulled
+        """
+        repository, version = split_tag(tag)
+        try:
+            with self.trace.span('pull ' + tag, 'pull'):
+                for message in self.stream_client.api.pull(
+                        repository, tag=version, stream=True, decode=True):
+                    if 'error' in message:
+                        raise BuildError(message['error'])
+        except (api_error(), BuildError) as error:
+            self._pull_failed(tag, error)
+            return False
+        return True
+
+    def _pull_failed(self, tag, error):
+        # Images that were never pushed are common, it is not an error
+        if self.verbose > 1:
+            print("Could not pull " + bcolors.blue(tag) +
+                  " to use as build cache: " + str(error))
+
+    def _pulled(self, tags):
+        """
+            Wait for the pulls of tags and return the tags that exist
+        """
+        available = []
+        for tag in tags:
+            pull = self.pulls.get(tag)
+            if pull.result() if pull is not None else self.index.exists(tag):
+                available.append(tag)
+        return available
+
+    def _start_build(self, name, definition, dryrun=False, force=False):
+        """
+            Everything build_one does before sending the context to
+            the daemon. Returns whether the build already finished, or
+            the tag, context directory and manifest key to build with.
+        """
         self.logger.debug("build_one: Building %s", name)
         self.logger.debug("build_one: definition: %s", definition)
 
@@ -391,40 +1281,118 @@ class Boatswain(object):
                   " and tagging as " + bcolors.blue(tag))
 
         if 'before' in definition and 'command' in definition['before']:
-            if not self.before_command(name, definition, dryrun=dryrun):
+            future = self.before_futures.get(name)
+            if future is not None:
+                succeeded = future.result()
+            else:
+                succeeded = self.before_command(name, definition,
+                                                verbose=self.verbose,
+                                                dryrun=dryrun)
+            if not succeeded:
                 return False
 
         if not os.path.exists(directory):
             print(bcolors.fail("Context directory: {} does not exist!".format(directory)))
             return False
 
-        if not dryrun:
-            try:
-                generator = self.client.api.build(path=directory, tag=tag,
-                                                  rm=True, nocache=force)
-                ident = self._docker_progress(name, generator)
-            except (ParseError, BuildError) as error:
+        if dryrun:
+            self.cache[name] = 'testidentifier'
+            self._finish_build(name, tag, None, 'testidentifier', dryrun=True)
+            return True
+
+        parent_id = None
+        if 'from' in definition:
+            parent_id = self.cache.get(definition['from'])
+        with self.trace.span('hash context', 'context', image=name):
+            key = self.manifest.key(definition, parent_id)
+
+        if not force:
+            ident = self._unchanged(name, tag, key)
+            if ident:
                 if self.verbose > 1:
-                    self.progress_bar.stop()
-                    self.progress_bar = None
-                print(bcolors.fail("An error occurred while building ") +
-                      bcolors.green(bcolors.blue(name)) +
-                      bcolors.fail(": " + str(error)) + "\n", file=sys.stderr)
-                return False
-            except (KeyboardInterrupt, SystemExit):
-                self.progress_bar.stop()
-                self.progress_bar = None
-                raise
-        else:
-            ident = 'testidentifier'
-            self.cache[name] = ident
+                    print("Skipping unchanged image " + bcolors.blue(name) +
+                          " docker id is: " + bcolors.blue(ident))
+                self.cache[name] = ident
+                self.cache.tags[name] = tag
+                self.skipped.add(name)
+                return True
+
+        return tag, directory, key
+
+    def _finish_build(self, name, tag, key, ident, dryrun=False):
+        """
+            Record the image a build produced
+        """
+        if ident and not dryrun:
+            self.manifest.record(name, key, ident)
+            self.cache.tags[name] = tag
+            self.index.add(tag, ident)
 
         if self.verbose > 1 or dryrun:
             print("Successfully built image with tag:" + bcolors.blue(tag) +
                   " docker id is: " + bcolors.blue(ident))
 
+    @staticmethod
+    def _build_failed(name, error):
+        print(bcolors.fail("An error occurred while building ") +
+              bcolors.green(bcolors.blue(name)) +
+              bcolors.fail(": " + str(error)) + "\n", file=sys.stderr)
+
+    def tag_one(self, name, definition, ident, dryrun=False, key=None):
+        """
+            Tags an image that was already built under another name
+
+            :param key: The manifest key of the build of the image, it
+                        is recorded for name as well
+        """
+        tag = self._get_full_tag(name, definition)
+
+        if self._start_tag(name, tag, ident, dryrun=dryrun) and not dryrun:
+            repository, version = split_tag(tag)
+            try:
+                self.client.api.tag(ident, repository, version)
+            except api_error() as error:
+                self._tag_failed(name, error)
+                return False
+
+        self._finish_tag(name, tag, ident, dryrun=dryrun, key=key)
+        return True
+
+    def _start_tag(self, name, tag, ident, dryrun=False):
+        """
+            Whether tag should be added to the image, it is skipped
+            when the tag already refers to the image
+        """
+        if not dryrun and self.index.matches(tag, ident):
+            if self.verbose > 1:
+                print("Skipping unchanged image " + bcolors.blue(name) +
+                      " docker id is: " + bcolors.blue(ident))
+            self.skipped.add(name)
+            return False
+
+        if self.verbose > 1 or dryrun:
+            print("Tagging image " + bcolors.blue(ident) +
+                  " as " + bcolors.blue(tag))
         return True
 
+    def _finish_tag(self, name, tag, ident, dryrun=False, key=None):
+        """
+            Record that tag refers to the image, with the key of its
+            build so a later build of name alone is skipped as well
+        """
+        if not dryrun:
+            self.index.add(tag, ident)
+            self.cache.tags[name] = tag
+            if key is not None:
+                self.manifest.record(name, key, ident)
+        self.cache[name] = ident
+
+    @staticmethod
+    def _tag_failed(name, error):
+        print(bcolors.fail("An error occurred while tagging ") +
+              bcolors.blue(name) +
+              bcolors.fail(": " + str(error)) + "\n", file=sys.stderr)
+
     def clean_one(self, name, definition, dryrun=False):
         """
             Removes the specified image if it exists
@@ -435,10 +1403,19 @@ class Boatswain(object):
             if self.verbose > 1:
                 print("removing image with tag: " + bcolors.blue(tag))
             if not dryrun:
-                self.client.images.remove(tag)
+                self._record_freed(self.client.api.remove_image(tag))
+                self.index.remove(tag)
+                self._forget(name)
             return True
         return False
 
+    def _forget(self, name):
+        """
+            Drop a removed image from the cache, so it is built again
+        """
+        self.cache.pop(name, None)
+        self.cache.tags.pop(name, None)
+
     def push_one(self, name, definition, dryrun=False):
         """
             Push the specified image if it exists
@@ -446,37 +1423,70 @@ class Boatswain(object):
         tag = self._get_full_tag(name, definition)
         exists = self._check_if_exists(tag)
         if exists:
+            if not dryrun and self._in_registry(name, tag):
+                return True
             if self.verbose > 1:
                 print("Pushing image with tag: " + bcolors.blue(tag))
             if not dryrun:
                 try:
-                    generator = self.client.images.push(tag, stream=True)
-                    return self._docker_progress(name, generator,
-                                                 has_step=False)
+                    generator = self.stream_client.images.push(tag,
+                                                               stream=True)
+                    digest = self._docker_progress(name, generator,
+                                                   has_step=False)
+                    self._pushed(tag, digest)
+                    return digest
                 except (ParseError, BuildError) as error:
-                    if self.verbose > 1:
-                        self.progress_bar.stop()
-                        self.progress_bar = None
                     print(bcolors.fail("An error occurred during build: " +
                                        str(error)) + "\n", file=sys.stderr)
                     return False
-                except (KeyboardInterrupt, SystemExit):
-                    if self.verbose > 1:
-                        self.progress_bar.stop()
-                        self.progress_bar = None
-                    raise
             return True
         return False
 
+    def _in_registry(self, name, tag):
+        """
+            Whether the registry has the image of tag under that tag,
+            then pushing it is skipped
+        """
+        digest = self.index.digest(tag)
+        if digest is None or digest != self.registry.get(tag):
+            return False
+        if self.verbose > 1:
+            print("Image is up to date in the registry: " + bcolors.blue(tag))
+        self.skipped.add(name)
+        return True
+
+    def _pushed(self, tag, digest):
+        """
+            Record the digest of a pushed image
+        """
+        if digest:
+            digest = 'sha256:' + digest
+            self.index.add_digest(tag, digest)
+            self.registry.record(tag, digest)
+
+    def _context_stream(self, directory):
+        """
+            The tar archive of a context directory as a stream of chunks
+        """
+        if self.contexts is not None:
+            return self.contexts.stream(directory)
+        return stream_context(directory, excludes=self.excludes)
+
+    def _unchanged(self, name, tag, key):
+        """
+            The image id of tag if it was built from the same inputs
+            and still exists, None otherwise
+        """
+        ident = self.manifest.lookup(name, key)
+        if ident is not None and self.index.matches(tag, ident):
+            return ident
+        return None
+
     def _check_if_exists(self, tag):
         """
            Check whether this image exists.
         """
-        try:
-            self.client.images.get(tag)
-            return True
-        except docker.errors.ImageNotFound:
-            return False
+        return self.index.exists(tag)
 
     def _get_full_tag(self, name, definition):
         """
@@ -497,85 +1507,104 @@ class Boatswain(object):
         # are on (e.g. the layer)
         # and whether it was successfully built, although if it does not
         # build successfully we will get an Exception
+        progress = self._start_progress(name, has_step)
+        try:
+            # Docker does not align its chunks with the json objects
+            for json_response in JsonStreamDecoder().decode(generator):
+                self._handle_progress(progress, json_response)
+
+            return progress['ident'] or False
+        except api_error() as error:
+            raise BuildError(str(error))
+        finally:
+            self._stop_progress(progress)
+
+    def _start_progress(self, name, has_step=True):
+        """
+            The state of the progress of a single docker stream
+        """
         if self.verbose > 2:
             print(bcolors.warning(name + ": "))
 
-        try:
-            if self.verbose > 1:
-                step = 0
-                total = 0
-
-            for response in generator:
-                lines = response.rstrip().decode('utf-8')
-                lines = lines.replace('\r', '')
-
-                lines = lines.split('\n')
-
-                for response_line in lines:
-                    json_response = json.loads(response_line)
-                    self.logger.debug(json_response)
-                    if 'error' in json_response:
-                        raise BuildError(json_response['error'])
-                    if not ('stream' in json_response or     # Sent when building
-                            'status' in json_response or     # Sent when building
-                            'aux' in json_response):         # Sent when pushing
-                        raise ParseError(
-                            "Unsupported docker response: " + str(json_response))
-
-                    if 'status' in json_response:
-                        line = json_response['status'].rstrip()
-                        # if line.endswith("\n"):
-                        #     print(bcolors.bold(line), end="")
-                        # else:
-                        #     print(bcolors.bold(line))
-                    elif 'stream' in json_response:
-                        line = json_response['stream'].rstrip()
-                    elif 'aux' in json_response:
-                        # Docker 1.13 push gives aux when push is done
-                        aux = json_response['aux']
-                        from_index = len('sha256:')
-                        if 'Digest' in aux:
-                            id_line = aux['Digest'].rstrip()
-                            ident = id_line[from_index:]
-                        elif 'ID' in aux:
-                            # sometimes you get an ID key instead of a Digest key
-                            # (we're not sure why at the moment)
-                            id_line = aux['ID'].rstrip()
-                            ident = id_line[from_index:]
-                        else:
-                            raise Exception("No 'Digest' or 'ID' key in JSON response. Aborting.")
-
-                    if self.verbose > 2 and 'status' not in json_response:
-                        print(bcolors.warning(name + ": "), end="")
-                        print(bcolors.blue(line))
-
-                    if self.verbose > 1:
-                        if has_step and line.startswith('Step'):
-                            step, total = extract_step(line)
-                        elif not has_step:
-                            step += 1
-
-                        if self.progress_bar is None:
-                            self.progress_bar = TimedProgressBar(step, total, name)
-                            self.progress_bar.start()
-                        else:
-                            self.progress_bar.step = step
-                            self.progress_bar.update()
-
-                    if line.startswith('Successfully built'):
-                        ident = extract_id(line)
-                        self.cache[name] = ident
+        # Each image gets its own progress line, so images that are
+        # built in parallel do not share one
+        self.progress.add(name)
+        return {'name': name, 'has_step': has_step,
+                'step': 0, 'total': 0, 'ident': None,
+                # The step that is running and when it started
+                'line': None, 'start': None}
 
-            if self.verbose > 1:
-                self.progress_bar.stop()
-                self.progress_bar = None
-
-            if ident:
-                return ident
+    def _handle_progress(self, progress, json_response):
+        """
+            Process a single json object of a docker stream
+        """
+        name = progress['name']
+        self.logger.debug(json_response)
+        if 'error' in json_response:
+            raise BuildError(json_response['error'])
+        if not ('stream' in json_response or     # Sent when building
+                'status' in json_response or     # Sent when building
+                'aux' in json_response):         # Sent when pushing
+            raise ParseError(
+                "Unsupported docker response: " + str(json_response))
+
+        if 'status' in json_response:
+            line = json_response['status'].rstrip()
+            # if line.endswith("\n"):
+            #     print(bcolors.bold(line), end="")
+            # else:
+            #     print(bcolors.bold(line))
+        elif 'stream' in json_response:
+            line = json_response['stream'].rstrip()
+        elif 'aux' in json_response:
+            # Docker 1.13 push gives aux when push is done
+            line = ''
+            aux = json_response['aux']
+            from_index = len('sha256:')
+            if 'Digest' in aux:
+                id_line = aux['Digest'].rstrip()
+                progress['ident'] = id_line[from_index:]
+            elif 'ID' in aux:
+                # sometimes you get an ID key instead of a Digest key
+                # (we're not sure why at the moment)
+                id_line = aux['ID'].rstrip()
+                progress['ident'] = id_line[from_index:]
             else:
-                return False
-        except docker.errors.APIError as error:
-            if self.verbose > 1:
-                self.progress_bar.stop()
-                self.progress_bar = None
-            raise BuildError(str(error))
+                raise Exception("No 'Digest' or 'ID' key in JSON response. Aborting.")
+
+        if self.verbose > 2 and 'status' not in json_response:
+            print(bcolors.warning(name + ": "), end="")
+            print(bcolors.blue(line))
+
+        if progress['has_step'] and line.startswith('Step'):
+            self._trace_step(progress, line)
+
+        if self.progress.enabled:
+            if progress['has_step'] and line.startswith('Step'):
+                progress['step'], progress['total'] = extract_step(line)
+                self.progress.update(name, progress['step'],
+                                     progress['total'], line)
+            elif not progress['has_step']:
+                progress['step'] += 1
+                self.progress.update(name, progress['step'], None, line)
+
+        if line.startswith('Successfully built'):
+            progress['ident'] = extract_id(line)
+            self.cache[name] = progress['ident']
+
+    def _trace_step(self, progress, line=None):
+        """
+            End the span of the running step and start one for line
+        """
+        if not self.trace.enabled:
+            return
+        now = self.trace.now()
+        if progress['line'] is not None:
+            self.trace.complete(progress['line'], 'step', progress['start'],
+                                now, image=progress['name'])
+        progress['line'] = line
+        progress['start'] = now
+
+    def _stop_progress(self, progress):
+        self._trace_step(progress)
+        self.progress.remove(progress['name'])
@@ -0,0 +1,61 @@
+"""
+    Cache of the images built by boatswain
+
+    The cache maps image names to the docker id they were built as.
+    It can be stored on disk, so a later run can reuse images built
+    earlier as parents instead of building them again. Entries are
+    checked against the docker daemon when they are loaded.
+"""
+from __future__ import absolute_import
+
+import logging
+
+from .util import load_json, save_json
+
+
+class ImageCache(dict):
+    """
+        Dictionary of image name to docker image id
+
+        :param path: The json file the cache is stored in, when it is
+                     None the cache only lives as long as the object
+        :type path: string
+    """
+
+    def __init__(self, path=None):
+        super(ImageCache, self).__init__()
+        self.logger = logging.getLogger('boatswain')
+        self.path = path
+        # The full tag of each cached image
+        self.tags = {}
+
+    def load(self, index):
+        """
+            Load the cache from its file, keeping only the images
+            whose tag still refers to the cached image id
+
+            :param index: The images in the docker daemon
+            :type index: ImageIndex
+        """
+        if not self.path:
+            return
+
+        entries = load_json(self.path, {})
+        for name, entry in entries.items():
+            if index.matches(entry['tag'], entry['id']):
+                self[name] = entry['id']
+                self.tags[name] = entry['tag']
+            else:
+                self.logger.debug("Dropping %s from cache, %s was removed "
+                                  "or rebuilt", name, entry['tag'])
+
+    def save(self):
+        """
+            Write the cached images that have a tag to the cache file
+        """
+        if not self.path:
+            return
+
+        entries = dict((name, {'tag': self.tags[name], 'id': ident})
+                       for name, ident in self.items() if name in self.tags)
+        save_json(self.path, entries)
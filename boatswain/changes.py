@@ -0,0 +1,108 @@
+"""
+    Images affected by changes in a git repository
+
+    The files that changed since a git ref are mapped to the images
+    whose context directory contains them. Images whose definition in
+    the boatswain file changed are affected as well.
+"""
+from __future__ import absolute_import
+
+import os
+import subprocess
+
+from .description import parse_description
+from .errors import GitError
+
+
+def git(arguments, directory='.'):
+    """
+    Run git in directory and return its output
+
+    :raises GitError: when git fails or is not installed
+    """
+    try:
+        return subprocess.check_output(['git'] + arguments, cwd=directory,
+                                       stderr=subprocess.PIPE)
+    except OSError as error:
+        raise GitError("Could not run git: " + str(error))
+    except subprocess.CalledProcessError as error:
+        raise GitError("git {} failed: {}".format(
+            ' '.join(arguments), error.stderr.decode('utf-8', 'replace').strip()))
+
+
+def _paths(output, root):
+    return [os.path.join(root, os.fsdecode(path))
+            for path in output.split(b'\0') if path]
+
+
+def changed_paths(ref, directory='.'):
+    """
+    The absolute paths of the files that differ from ref in the work
+    tree, including untracked files that are not ignored
+
+    :param ref: The git ref to compare with, e.g. origin/master
+    :type ref: string
+    """
+    root = os.fsdecode(
+        git(['rev-parse', '--show-toplevel'], directory).strip())
+    changed = _paths(git(['diff', '--name-only', '-z', ref, '--'], root), root)
+    untracked = git(['ls-files', '--others', '--exclude-standard', '-z'], root)
+    return changed + _paths(untracked, root)
+
+
+def _inside(path, directory):
+    return path == directory or path.startswith(directory.rstrip(os.sep) + os.sep)
+
+
+def changed_definitions(ref, images, boatswain_file):
+    """
+    The names of the images whose definition in boatswain_file
+    differs from the one in ref
+    """
+    path = os.path.abspath(boatswain_file)
+    directory = os.path.dirname(path)
+    try:
+        old = parse_description(git(['show', '{}:./{}'.format(
+            ref, os.path.basename(path))], directory))
+    except GitError:
+        # The boatswain file is new since ref
+        return list(images)
+
+    old_images = (old or {}).get('images') or {}
+    return [name for name in images
+            if old_images.get(name) != images[name]]
+
+
+def changed_images(ref, images, boatswain_file=None, excludes=()):
+    """
+    The names of the images whose context or definition changed since
+    the git ref, the images built from them are not included
+
+    :param images: The dictionary of images, contexts are relative
+                   to the current directory
+    :type images: dict(string: image_definition)
+
+    :param boatswain_file: The file the images were loaded from, to
+                           detect changed definitions
+    :type boatswain_file: string
+
+    :param excludes: Directories whose files are not part of any
+                     context, such as the state directory of boatswain
+    :type excludes: list(string)
+    """
+    excludes = [os.path.realpath(exclude) for exclude in excludes]
+    paths = [path for path in map(os.path.realpath, changed_paths(ref))
+             if not any(_inside(path, exclude) for exclude in excludes)]
+    changed = set()
+    if boatswain_file is not None and \
+            os.path.realpath(boatswain_file) in paths:
+        changed.update(changed_definitions(ref, images, boatswain_file))
+
+    for name, definition in images.items():
+        if 'context' not in definition:
+            continue
+        context = os.path.realpath(definition['context'])
+        if any(_inside(path, context) for path in paths):
+            changed.add(name)
+
+    return [name for name in images if name in changed]
@@ -1,15 +1,39 @@
 """
     Boatswain command line interface
 """
-from __future__ import absolute_import
+from __future__ import absolute_import, print_function
 
 import argparse
+import os
 import sys
 import logging
-import yaml
 from .boatswain import Boatswain
 from .bcolors import bcolors
+from .description import load_description
 from .display import Tree
+from .errors import DependencyError, GitError
+from .util import size_text
+
+
+def positive_int(value):
+    """
+        Parse a positive number argument, like the number of jobs
+    """
+    if not value.isdigit() or int(value) < 1:
+        raise argparse.ArgumentTypeError(
+            "expected a positive number, got " + value)
+    return int(value)
+
+
+def registry_limit(value):
+    """
+        Parse a HOST=N registry limit argument
+    """
+    host, _, limit = value.rpartition('=')
+    if not host or not limit.isdigit() or int(limit) < 1:
+        raise argparse.ArgumentTypeError(
+            "expected HOST=N with a positive N, got " + value)
+    return host, int(limit)
 
 
 def argparser():
@@ -57,6 +81,17 @@ def argparser():
         '-b', '--boatswain_file', help='Override the default boatswain file',
         default='boatswain.yml'
     )
+    common.add_argument(
+        '-H', '--host', metavar='URL', dest='hosts',
+        help="Docker host to work on, repeat to spread builds over "
+             "several hosts",
+        action='append', default=[]
+    )
+    common.add_argument(
+        '--trace', metavar='FILE',
+        help="Write the timing of images and build steps to FILE "
+             "as Chrome trace event json"
+    )
 
     #
     # Build parser
@@ -70,6 +105,36 @@ def argparser():
         help="Force building images even if they already exists",
         action='store_true'
     )
+    buildparser.add_argument(
+        '-j', '--jobs', help="Number of images to build in parallel",
+        type=positive_int, default=1
+    )
+    buildparser.add_argument(
+        '-c', '--cache',
+        help="Reuse images built in earlier runs instead of rebuilding their parents",
+        action='store_true'
+    )
+    buildparser.add_argument(
+        '--cache-contexts',
+        help="Keep a tar archive of every context in the .boatswain "
+             "directory and send it again while the context is unchanged",
+        action='store_true'
+    )
+    buildparser.add_argument(
+        '--cache-from',
+        help="Pull the earlier pushed images and their parents to use "
+             "their layers as build cache",
+        action='store_true'
+    )
+    buildparser.add_argument(
+        '--changed-since', metavar='REF',
+        help="Only build the images whose context changed since the git "
+             "ref REF and the images built from them"
+    )
+    buildparser.add_argument(
+        '--downstream', metavar='NAME', action='append',
+        help="Only build the image NAME and the images built from it, can be repeated"
+    )
     buildparser.add_argument(
         'imagename', help="Name of the image to build",
         nargs='?'
@@ -82,6 +147,20 @@ def argparser():
         'clean', help='Clean the images specified in the boatswain.yml file',
         parents=[common]
     )
+    cleanparser.add_argument(
+        '-j', '--jobs', help="Number of images to remove in parallel",
+        type=positive_int, default=1
+    )
+    cleanparser.add_argument(
+        '--prune',
+        help="Also remove all dangling images of the docker daemon, "
+             "not only those left by boatswain",
+        action='store_true'
+    )
+    cleanparser.add_argument(
+        '--downstream', metavar='NAME', action='append',
+        help="Only clean the image NAME and the images built from it, can be repeated"
+    )
     cleanparser.add_argument(
         'imagename', help="Name of the image to clean",
         nargs='?'
@@ -94,6 +173,19 @@ def argparser():
         'push', help='Push the images specified in the boatswain.yml file to dockerhub',
         parents=[common]
     )
+    pushparser.add_argument(
+        '-j', '--jobs', help="Number of images to push in parallel",
+        type=positive_int, default=1
+    )
+    pushparser.add_argument(
+        '--registry-limit', metavar='HOST=N', dest='registry_limits',
+        help="Push at most N images in parallel to registry HOST",
+        type=registry_limit, action='append', default=[]
+    )
+    pushparser.add_argument(
+        '--downstream', metavar='NAME', action='append',
+        help="Only push the image NAME and the images built from it, can be repeated"
+    )
     pushparser.add_argument(
         'imagename', help="Name of the image to push",
         nargs='?'
@@ -102,14 +194,27 @@ def argparser():
     #
     # Tree parser
     #
-    subparsers.add_parser(
+    treeparser = subparsers.add_parser(
         'tree', help='Print the tree of the boatswain.yml file',
         parents=[common]
     )
+    treeparser.add_argument(
+        '--format', help="Print the tree as text, as json or as a graphviz dot graph",
+        choices=Tree.formats, default='text'
+    )
 
     return parser
 
 
+def state_directory(boatswain_file):
+    """
+        The directory next to the boatswain file where boatswain
+        keeps its state between runs
+    """
+    directory = os.path.dirname(os.path.abspath(boatswain_file))
+    return os.path.join(directory, '.boatswain')
+
+
 def print_summary(result, command):
 
     print(bcolors.header("\nBuild summary"))
@@ -122,6 +227,14 @@ def print_summary(result, command):
     for image in result['images']:
         print('    ' + image)
 
+    if result.get('skipped'):
+        print(bcolors.blue('skipped (unchanged):'))
+        for image in result['skipped']:
+            print('    ' + image)
+
+    if result.get('reclaimed'):
+        print(bcolors.blue('reclaimed: ') + size_text(result['reclaimed']))
+
     if not result['success']:
         print(bcolors.fail('Failed to ' + command + ':'))
         for image in result['failed']:
@@ -144,18 +257,26 @@ def main():
         sys.exit(1)
 
     arguments = parser.parse_args()
+    if getattr(arguments, 'changed_since', None) and arguments.imagename:
+        parser.error("--changed-since can not be combined with an image name")
+    if getattr(arguments, 'downstream', None) and \
+            (arguments.imagename or getattr(arguments, 'changed_since', None)):
+        parser.error("--downstream can not be combined with an image name or --changed-since")
 
-    if not arguments.quiet:
+    # json and dot trees are read by other programs
+    if not arguments.quiet and getattr(arguments, 'format', 'text') == 'text':
         print(bcolors.header("Welcome to Boatswain"))
 
     if arguments.debug:
         logging.basicConfig(level=logging.DEBUG)
 
     command = arguments.command
+    state_dir = state_directory(arguments.boatswain_file)
     try:
-        with open(arguments.boatswain_file) as yamlfile:
-            bsfile = yaml.safe_load(yamlfile)
-    except IOError as error:
+        bsfile = load_description(
+            arguments.boatswain_file,
+            cache=os.path.join(state_dir, 'description.json'))
+    except (IOError, OSError) as error:
         print(bcolors.fail(error.filename + ": " + error.strerror))
         sys.exit(-error.errno)
 
@@ -167,30 +288,51 @@ def main():
     elif arguments.verboseverbose:
         verbosity_level = 3
 
-    with Boatswain(bsfile,
-                   verbose=verbosity_level,
-                   continue_building=arguments.keep_building) as bosun:
-        if command == 'tree':
-            tree = Tree()
-            tree.print_boatswain_tree(bsfile)
-            sys.exit(0)
-        elif command == 'build':
-            if arguments.imagename:
-                result = bosun.build_up_to(arguments.imagename, dryrun=arguments.dryrun, force=arguments.force)
-            else:
-                result = bosun.build(dryrun=arguments.dryrun, force=arguments.force)
-
-        elif command == 'clean':
-            if arguments.imagename:
-                result = bosun.clean_up_to(arguments.imagename, dryrun=arguments.dryrun)
-            else:
-                result = bosun.clean(dryrun=arguments.dryrun)
-
-        elif command == 'push':
-            if arguments.imagename:
-                result = bosun.push_up_to(arguments.imagename, dryrun=arguments.dryrun)
-            else:
-                result = bosun.push(dryrun=arguments.dryrun)
+    try:
+        with Boatswain(bsfile,
+                       verbose=verbosity_level,
+                       continue_building=arguments.keep_building,
+                       jobs=getattr(arguments, 'jobs', 1),
+                       state_dir=state_dir,
+                       persistent_cache=getattr(arguments, 'cache', False),
+                       registry_limits=dict(getattr(arguments, 'registry_limits', [])),
+                       trace=arguments.trace,
+                       cache_from=getattr(arguments, 'cache_from', False),
+                       cache_contexts=getattr(arguments, 'cache_contexts', False),
+                       hosts=arguments.hosts) as bosun:
+            if command == 'tree':
+                tree = Tree()
+                tree.print_boatswain_tree(bsfile, output_format=arguments.format)
+                sys.exit(0)
+            elif command == 'build':
+                if arguments.changed_since:
+                    result = bosun.build_changed(arguments.changed_since, dryrun=arguments.dryrun, force=arguments.force,
+                                                 boatswain_file=arguments.boatswain_file)
+                elif arguments.downstream:
+                    result = bosun.build_downstream(arguments.downstream, dryrun=arguments.dryrun, force=arguments.force)
+                elif arguments.imagename:
+                    result = bosun.build_up_to(arguments.imagename, dryrun=arguments.dryrun, force=arguments.force)
+                else:
+                    result = bosun.build(dryrun=arguments.dryrun, force=arguments.force)
+
+            elif command == 'clean':
+                if arguments.downstream:
+                    result = bosun.clean_downstream(arguments.downstream, dryrun=arguments.dryrun, prune=arguments.prune)
+                elif arguments.imagename:
+                    result = bosun.clean_up_to(arguments.imagename, dryrun=arguments.dryrun, prune=arguments.prune)
+                else:
+                    result = bosun.clean(dryrun=arguments.dryrun, prune=arguments.prune)
+
+            elif command == 'push':
+                if arguments.downstream:
+                    result = bosun.push_downstream(arguments.downstream, dryrun=arguments.dryrun)
+                elif arguments.imagename:
+                    result = bosun.push_up_to(arguments.imagename, dryrun=arguments.dryrun)
+                else:
+                    result = bosun.push(dryrun=arguments.dryrun)
+    except (DependencyError, GitError) as error:
+        print(bcolors.fail(str(error)), file=sys.stderr)
+        sys.exit(1)
 
     if verbosity_level >= 1:
         print_summary(result, command)
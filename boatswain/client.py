@@ -0,0 +1,83 @@
+"""
+    Docker clients shared within a process
+
+    Every client keeps a pool of connections to its daemon. Clients are
+    shared by all Boatswain objects that talk to the same daemon with
+    the same settings, so concurrent actions reuse connections instead
+    of opening new ones.
+"""
+from __future__ import absolute_import
+
+import os
+import threading
+
+# Seconds a request may wait for the daemon, see shared_client
+DEFAULT_TIMEOUT = 60
+# The connection pool size of docker-py
+DEFAULT_POOL_SIZE = 10
+# The first docker-py release whose clients take a max_pool_size
+POOL_SIZE_VERSION = (4, 4)
+
+# The docker-py settings taken from the environment by docker.from_env
+ENVIRONMENT = ('DOCKER_HOST', 'DOCKER_TLS_VERIFY', 'DOCKER_CERT_PATH')
+
+_clients = {}
+_lock = threading.Lock()
+
+
+def pool_size(jobs):
+    """
+    The connection pool size for processing jobs images at a time
+
+    Every job holds a connection for its build or push stream, and
+    about as many connections are in use for the pulls and for the
+    short requests in between.
+    """
+    return max(DEFAULT_POOL_SIZE, 2 * jobs + 2)
+
+
+def api_error():
+    """
+    The exception docker-py raises for the error responses of a daemon
+
+    docker is only imported when an error is handled, like the clients
+    are only created on first use.
+    """
+    from docker.errors import APIError
+    return APIError
+
+
+def shared_client(host=None, pool_size=DEFAULT_POOL_SIZE,
+                  timeout=DEFAULT_TIMEOUT):
+    """
+    The docker client of host, created on the first request for it
+
+    :param host: The url of the docker daemon, None for the daemon
+                 the environment points to
+    :type host: string
+
+    :param pool_size: The number of connections kept open, docker-py
+                      releases before 4.4 keep DEFAULT_POOL_SIZE
+    :type pool_size: int
+
+    :param timeout: Seconds to wait for data from the daemon, None
+                    for streams that can be quiet for a long time
+    :type timeout: float
+    """
+    environment = tuple(os.environ.get(name) for name in ENVIRONMENT)
+    key = (host, environment, pool_size, timeout)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            # Importing docker is slow, commands without a daemon skip it
+            import docker
+            settings = {'version': 'auto', 'timeout': timeout}
+            # Older clients always keep DEFAULT_POOL_SIZE connections
+            if docker.version_info >= POOL_SIZE_VERSION:
+                settings['max_pool_size'] = pool_size
+            if host is None:
+                client = docker.from_env(**settings)
+            else:
+                client = docker.DockerClient(base_url=host, **settings)
+            _clients[key] = client
+    return client
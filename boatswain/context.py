@@ -0,0 +1,439 @@
+"""
+    Helpers for docker build context directories
+
+    Docker sends every file in the context directory that is not
+    excluded by the .dockerignore file to the daemon. These helpers
+    list and hash exactly those files, so boatswain can tell whether
+    the input of a build changed, and stream them as a tar archive,
+    so the upload to the daemon can start while files are still read.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import io
+import json
+import os
+import stat
+import tarfile
+import sys
+import tempfile
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def read_dockerignore(directory):
+    """
+    Read the .dockerignore patterns of a context directory
+
+    :param directory: The context directory
+    :type directory: string
+    """
+    dockerignore = os.path.join(directory, '.dockerignore')
+    if not os.path.exists(dockerignore):
+        return []
+
+    with open(dockerignore, 'r') as ignorefile:
+        lines = [line.strip() for line in ignorefile.read().splitlines()]
+    return [line for line in lines if line and line[0] != '#']
+
+
+def context_files(directory, excludes=()):
+    """
+    List the paths docker sends for a context directory
+
+    The paths are relative to the context directory, sorted and
+    include directories as well as files.
+
+    :param directory: The context directory
+    :type directory: string
+
+    :param excludes: Directories that are left out of the context
+                     even when .dockerignore does not exclude them,
+                     such as the state directory of boatswain
+    :type excludes: list(string)
+    """
+    # Imported here, importing docker slows down commands that do not
+    # need the contexts
+    from docker.utils.build import exclude_paths
+
+    root = os.path.abspath(directory)
+    patterns = read_dockerignore(directory)
+    for exclude in excludes:
+        relative = os.path.relpath(os.path.abspath(exclude), root)
+        if relative == os.curdir or relative == os.pardir or \
+                relative.startswith(os.pardir + os.sep):
+            # The context is inside the excluded directory, or the
+            # directory is not part of the context
+            continue
+        patterns.append(relative.replace(os.sep, '/'))
+    return sorted(exclude_paths(root, patterns))
+
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    """
+    Compute the sha256 hex digest of the content of a file
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as contentfile:
+        chunk = contentfile.read(chunk_size)
+        while chunk:
+            digest.update(chunk)
+            chunk = contentfile.read(chunk_size)
+    return digest.hexdigest()
+
+
+def hash_context(directory, digests=None, excludes=()):
+    """
+    Compute a hash over the names, modes and contents of all files
+    docker would send for a context directory
+
+    Modification times are not part of the hash, as they do not
+    influence the docker build cache either.
+
+    :param directory: The context directory
+    :type directory: string
+
+    :param digests: Digests of files from an earlier run, keyed by their
+                    absolute path. A digest is reused when the size and
+                    modification time of the file did not change.
+                    The dictionary is updated with the new digests.
+    :type digests: dict(string: [size, mtime, digest])
+
+    :param excludes: Directories left out of the context, as for
+                     context_files
+    :type excludes: list(string)
+    """
+    root = os.path.abspath(directory)
+    context = hashlib.sha256()
+    _hash_entries(context, root, context_files(directory, excludes), digests)
+    return context.hexdigest()
+
+
+def hash_paths(paths, digests=None):
+    """
+    Compute a hash over the names, modes and contents of files and
+    of all files in directories, paths that do not exist are part
+    of the hash as well
+
+    :param paths: The files and directories
+    :type paths: list(string)
+
+    :param digests: Digests of files from an earlier run, as for
+                    hash_context
+    :type digests: dict(string: [size, mtime, digest])
+    """
+    combined = hashlib.sha256()
+    for path in paths:
+        root = os.path.abspath(path)
+        combined.update(u'{}\0'.format(path).encode('utf-8', 'surrogateescape'))
+        if not os.path.lexists(root):
+            combined.update(b'missing\0')
+        elif os.path.isdir(root) and not os.path.islink(root):
+            _hash_entries(combined, root, _walk(root), digests)
+        else:
+            _hash_entries(combined, os.path.dirname(root),
+                          [os.path.basename(root)], digests)
+    return combined.hexdigest()
+
+
+def _walk(root):
+    """
+        The sorted paths of all files and directories below root,
+        relative to root
+    """
+    paths = []
+    for directory, directories, files in os.walk(root):
+        relative = os.path.relpath(directory, root)
+        for name in directories + files:
+            paths.append(os.path.normpath(os.path.join(relative, name)))
+    return sorted(paths)
+
+
+def _hash_entries(digest, root, paths, digests):
+    """
+        Add the names, modes and contents of paths below root to digest
+    """
+    for path in paths:
+        full_path = os.path.join(root, path)
+        info = os.lstat(full_path)
+
+        if stat.S_ISREG(info.st_mode):
+            content = _cached_digest(full_path, info, digests)
+        elif stat.S_ISLNK(info.st_mode):
+            content = os.readlink(full_path)
+        else:
+            content = ''
+
+        entry = u'{}\0{:o}\0{}\0'.format(path.replace(os.sep, '/'),
+                                         stat.S_IMODE(info.st_mode),
+                                         content)
+        digest.update(entry.encode('utf-8', 'surrogateescape'))
+
+
+def _cached_digest(path, info, digests):
+    """
+        Digest of a file, reused from digests when the file did not change
+    """
+    if digests is None:
+        return hash_file(path)
+
+    signature = [info.st_size, info.st_mtime_ns]
+    cached = digests.get(path)
+    if cached is not None and cached[:2] == signature:
+        return cached[2]
+
+    digest = hash_file(path)
+    digests[path] = signature + [digest]
+    return digest
+
+
+def context_signature(directory, excludes=()):
+    """
+    Compute a hash over the names, sizes, modes and modification
+    times of all files docker would send for a context directory
+
+    The signature is cheap to compute, it only changes when a file
+    was added, removed or touched.
+
+    :param directory: The context directory
+    :type directory: string
+
+    :param excludes: Directories left out of the context, as for
+                     context_files
+    :type excludes: list(string)
+    """
+    root = os.path.abspath(directory)
+    signature = hashlib.sha256()
+    for path in context_files(directory, excludes):
+        info = os.lstat(os.path.join(root, path))
+        entry = u'{}\0{}\0{}\0{:o}\0'.format(path, info.st_size,
+                                             info.st_mtime_ns, info.st_mode)
+        signature.update(entry.encode('utf-8', 'surrogateescape'))
+    return signature.hexdigest()
+
+
+def stream_context(directory, chunk_size=CHUNK_SIZE, excludes=()):
+    """
+    The tar archive of a context directory as a file-like object
+
+    The archive holds the same entries docker-py would send for the
+    directory, but it is produced while it is being uploaded instead
+    of being written to a temporary file first.
+
+    :param directory: The context directory
+    :type directory: string
+
+    :param excludes: Directories left out of the context, as for
+                     context_files
+    :type excludes: list(string)
+    """
+    entries = []
+    length = 2 * tarfile.BLOCKSIZE
+    for header, path, size in _archive_entries(directory, excludes):
+        entries.append((header, path, size))
+        length += len(header) + _padded(size)
+    return ContextArchive(_archive_chunks(entries, chunk_size), length)
+
+
+def _archive_entries(directory, excludes):
+    """
+        Generate the tar header, path and size of all files in a context
+    """
+    root = os.path.abspath(directory)
+    # Only used to create the tar headers of the files
+    archive = tarfile.open(fileobj=io.BytesIO(), mode='w')
+
+    for path in context_files(directory, excludes):
+        full_path = os.path.join(root, path)
+        info = archive.gettarinfo(full_path, arcname=path)
+        if info is None:
+            # Sockets can not be archived, docker-py skips them as well
+            continue
+
+        # Workaround https://bugs.python.org/issue32713
+        if info.mtime < 0 or info.mtime > 8**11 - 1:
+            info.mtime = int(info.mtime)
+
+        if sys.platform == 'win32':
+            # Windows doesn't keep track of the execute bit, so we make files
+            # and directories executable by default.
+            info.mode = info.mode & 0o755 | 0o111
+
+        header = info.tobuf(archive.format, archive.encoding, archive.errors)
+        yield header, full_path, info.size if info.isfile() else 0
+
+
+def _padded(size):
+    """
+        The size of a file in a tar archive, padded to whole blocks
+    """
+    blocks = (size + tarfile.BLOCKSIZE - 1) // tarfile.BLOCKSIZE
+    return blocks * tarfile.BLOCKSIZE
+
+
+def _archive_chunks(entries, chunk_size):
+    """
+        Generate the chunks of a tar archive of the given entries
+    """
+    for header, path, size in entries:
+        yield header
+        if size:
+            for chunk in _read_exactly(path, size, chunk_size):
+                yield chunk
+            if _padded(size) != size:
+                yield tarfile.NUL * (_padded(size) - size)
+
+    # End of archive marker
+    yield tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+
+
+def _read_exactly(path, size, chunk_size):
+    """
+        Generate size bytes of a file in chunks
+    """
+    with open(path, 'rb') as contentfile:
+        remaining = size
+        while remaining:
+            chunk = contentfile.read(min(chunk_size, remaining))
+            if not chunk:
+                raise IOError('Context file changed while reading: ' + path)
+            remaining -= len(chunk)
+            yield chunk
+
+
+def _read_file(path, chunk_size):
+    """
+        Generate all bytes of a file in chunks
+    """
+    with open(path, 'rb') as contentfile:
+        chunk = contentfile.read(chunk_size)
+        while chunk:
+            yield chunk
+            chunk = contentfile.read(chunk_size)
+
+
+class ContextArchive(object):
+    """
+        File-like tar archive that is produced while it is read
+
+        The length of the archive is known up front, so it is uploaded
+        with a Content-Length header. The docker-py unix socket adapter
+        cannot send chunked request bodies.
+
+        :param chunks: The chunks of the archive
+        :type chunks: iterable(bytes)
+
+        :param length: The total length of the archive
+        :type length: int
+    """
+
+    def __init__(self, chunks, length):
+        self.chunks = iter(chunks)
+        self.length = length
+        self.chunk = b''
+        self.offset = 0
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        if self.offset < len(self.chunk):
+            yield self.chunk[self.offset:]
+        self.chunk = b''
+        self.offset = 0
+        for chunk in self.chunks:
+            yield chunk
+
+    def read(self, size=-1):
+        """
+            Read at most size bytes, or everything when size is negative
+        """
+        if size is None or size < 0:
+            return b''.join(self)
+
+        while self.offset >= len(self.chunk):
+            self.chunk = next(self.chunks, None)
+            self.offset = 0
+            if self.chunk is None:
+                self.chunk = b''
+                return b''
+
+        data = self.chunk[self.offset:self.offset + size]
+        self.offset += len(data)
+        return data
+
+    def close(self):
+        """
+            Stop producing the archive
+        """
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+class ContextCache(object):
+    """
+        Cache of the tar archives of context directories
+
+        An archive is reused as long as the signature of its context
+        directory did not change. Otherwise a new archive is written
+        to the cache while it is being streamed.
+
+        :param directory: The directory to keep the archives in
+        :type directory: string
+
+        :param excludes: Directories left out of the contexts, as for
+                         context_files
+        :type excludes: list(string)
+    """
+
+    def __init__(self, directory, excludes=()):
+        self.directory = directory
+        self.excludes = list(excludes)
+
+    def stream(self, context, chunk_size=CHUNK_SIZE):
+        """
+            The tar archive of a context directory as a file-like object
+        """
+        key = hashlib.sha256(
+            os.path.abspath(context).encode('utf-8', 'surrogateescape')).hexdigest()
+        archive = os.path.join(self.directory, key + '.tar')
+        signature_file = os.path.join(self.directory, key + '.json')
+        signature = context_signature(context, self.excludes)
+
+        if self._read_signature(signature_file) == signature and \
+                os.path.exists(archive):
+            return ContextArchive(_read_file(archive, chunk_size),
+                                  os.path.getsize(archive))
+
+        stream = stream_context(context, chunk_size, self.excludes)
+        chunks = self._store(stream, archive, signature_file, signature)
+        return ContextArchive(chunks, len(stream))
+
+    def _store(self, stream, archive, signature_file, signature):
+        """
+            Generate the chunks of stream while writing them to the cache
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        handle, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as tarball:
+                for chunk in stream:
+                    tarball.write(chunk)
+                    yield chunk
+            os.replace(temporary, archive)
+            with open(signature_file, 'w') as signaturefile:
+                json.dump({'signature': signature}, signaturefile)
+        finally:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+
+    @staticmethod
+    def _read_signature(path):
+        try:
+            with open(path) as signaturefile:
+                return json.load(signaturefile)['signature']
+        except (IOError, OSError, ValueError, KeyError):
+            return None
@@ -0,0 +1,73 @@
+"""
+    Loading of boatswain files
+
+    Boatswain files are parsed with the libyaml based loader when
+    pyyaml was built with it, which is many times faster than the pure
+    python loader on large files. The parsed description can be cached
+    as json, keyed by the path, size and modification time of the file,
+    so repeated runs on an unchanged file skip parsing the yaml.
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import os
+
+import yaml
+
+from .util import load_json, save_json
+
+# The C loader is only available when pyyaml was built with libyaml
+SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+def parse_description(stream):
+    """
+    Parse a boatswain description from a yaml string or file
+
+    :param stream: The yaml document
+    :type stream: string or file
+    """
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def load_description(path, cache=None):
+    """
+    Load the boatswain file at path
+
+    :param path: The path of the boatswain file
+    :type path: string
+
+    :param cache: The json file parsed descriptions are cached in,
+                  when it is None the file is always parsed
+    :type cache: string
+    """
+    status = os.stat(path)
+    path = os.path.abspath(path)
+    stamp = [status.st_size, status.st_mtime]
+
+    entries = load_json(cache, {}) if cache else {}
+    entry = entries.get(path)
+    if entry is not None and entry['stamp'] == stamp:
+        return entry['description']
+
+    with open(path) as yamlfile:
+        description = parse_description(yamlfile)
+
+    if cache and _json_compatible(description):
+        entries[path] = {'stamp': stamp, 'description': description}
+        try:
+            save_json(cache, entries)
+        except (IOError, OSError) as error:
+            logger = logging.getLogger("boatswain")
+            logger.warning("Not caching %s: %s", path, error)
+    return description
+
+
+def _json_compatible(description):
+    # Descriptions with yaml only types, like dates or numeric keys,
+    # would not come back the same from the json cache
+    try:
+        return json.loads(json.dumps(description)) == description
+    except (TypeError, ValueError):
+        return False
@@ -1,9 +1,12 @@
 # -*- coding: utf8 -*-
 from __future__ import print_function
 
+import collections
+import json
 import sys
 
 from .bcolors import bcolors
+from .graph import ImageGraph
 
 
 class Node(object):
@@ -35,73 +38,129 @@ class Tree(object):
     _dash = u'\u2500\u2500'    # ──
     _space = u'    '           # 4 spaces
 
+    # The output formats of print_boatswain_tree
+    formats = ('text', 'json', 'dot')
+
     def __init__(self):
         self.cache = []
         self.root = Node('root')
+        # Label to node, so parents are found without searching the tree
+        self.nodes = {}
+
+    def print_boatswain_tree(self, boatswain, output_format='text'):
+        """
+            Print the tree of the images in a single write
 
-    def print_boatswain_tree(self, boatswain):
+            :param output_format: One of Tree.formats
+            :type output_format: string
+        """
         self.cache = []
         self.extract_tree(boatswain)
-        self.print_tree()
+        if output_format == 'json':
+            text = self.render_json()
+        elif output_format == 'dot':
+            text = self.render_dot()
+        else:
+            text = self.render()
+        sys.stdout.write(text)
+        sys.stdout.flush()
 
     def extract_tree(self, yamlfile):
         images = yamlfile['images']
-        names = sorted(list(images))
-        while len(names) > 0:
-            name = names.pop(0)  # get the first image name
-            definition = images[name]
-
-            if 'from' in definition:
-                if definition['from'] not in self.cache:
-                    # We depend on another image that has
-                    # not been processed yet
-                    if definition['from'] not in names:
-                        # Zomg it doesn't exists :O
-                        print(
-                            bcolors.fail(
-                                "Error: could not find a recipe for "
-                            ) +
-                            bcolors.blue(definition['from']) +
-                            bcolors.fail(" which is needed for ") +
-                            bcolors.blue(name) + "\n", file=sys.stderr
-                        )
-                    else:
-                        # The parent image still needs to be processed
-                        names.append(name)
-                else:
-                    # The parent image has been processed, let's find it.
-                    child = self.root.find_child(definition['from'])
-                    child.children.append(Node(name))
-                    self.cache.append(name)
+        graph = ImageGraph(images, sorted(list(images)))
+
+        for name, parent in graph.undefined().items():
+            # Zomg it doesn't exists :O
+            print(
+                bcolors.fail(
+                    "Error: could not find a recipe for "
+                ) +
+                bcolors.blue(parent) +
+                bcolors.fail(" which is needed for ") +
+                bcolors.blue(name) + "\n", file=sys.stderr
+            )
+
+        self.root = Node('root')
+        self.nodes = {}
+        # Parents come before their children, so the parent of an
+        # image is in the index unless it could not be shown
+        for name in graph.order():
+            if name in graph.parents:
+                parent = self.nodes.get(graph.parents[name])
+                if parent is None:
+                    continue
             else:
                 # This is a root image
-                self.root.children.append(Node(name))
-                self.cache.append(name)
+                parent = self.root
+            node = Node(name)
+            parent.children.append(node)
+            self.nodes[name] = node
+            self.cache.append(name)
         return self.root
 
-    def print_tree(self):
-        self.print_recursive(self.root, [])
+    def find(self, label):
+        """
+            The node of the image with the given label, None if the
+            image is not in the tree
+        """
+        return self.nodes.get(label)
 
-    def print_recursive(self, node, last):
-        if not node:
-            return
-        else:
-            if node.label != 'root':
-                for l in last[:-1]:
-                    if l:
-                        print(self._space, end="")
-                    else:
-                        print(self._bar_space, end="")
-
-                if last[-1]:
-                    print(self._last_child, end="")
-                else:
-                    print(self._child, end="")
-
-                print(self._dash + " " + node.label)
-
-            if len(node.children) > 0:
-                for index, child in enumerate(node.children):
-                    last.append(index == (len(node.children) - 1))
-                    self.print_recursive(child, last)
-                    last.pop()
+    def print_tree(self):
+        sys.stdout.write(self.render())
+
+    def render(self):
+        """
+            The tree as text, one line per image
+        """
+        return u''.join(self._render_lines())
+
+    def _render_lines(self):
+        # Depth first without recursion, long chains of images would
+        # exceed the recursion limit. Every entry holds the prefix of
+        # the lines of its children and the children still to render.
+        stack = [(u'', iter(self.root.children), len(self.root.children))]
+        while stack:
+            prefix, children, remaining = stack.pop()
+            node = next(children, None)
+            if node is None:
+                continue
+            last = remaining == 1
+            stack.append((prefix, children, remaining - 1))
+            yield (prefix + (self._last_child if last else self._child) +
+                   self._dash + u' ' + node.label + u'\n')
+            if node.children:
+                stack.append((prefix + (self._space if last
+                                        else self._bar_space),
+                              iter(node.children), len(node.children)))
+
+    def render_json(self):
+        """
+            The tree as json: the parent and children of every image
+        """
+        images = collections.OrderedDict()
+        for name in self.cache:
+            images[name] = collections.OrderedDict([('parent', None),
+                                                    ('children', [])])
+        for name in self.cache:
+            for child in self.nodes[name].children:
+                images[child.label]['parent'] = name
+                images[name]['children'].append(child.label)
+        return json.dumps(images, indent=2) + '\n'
+
+    def render_dot(self):
+        """
+            The tree as a graphviz dot graph
+        """
+        lines = [u'digraph boatswain {']
+        for name in self.cache:
+            lines.append(u'    {};'.format(_dot_id(name)))
+        for name in self.cache:
+            for child in self.nodes[name].children:
+                lines.append(u'    {} -> {};'.format(_dot_id(name),
+                                                     _dot_id(child.label)))
+        lines.append(u'}')
+        return u'\n'.join(lines) + u'\n'
+
+
+def _dot_id(label):
+    return u'"' + label.replace('\\', '\\\\').replace('"', '\\"') + u'"'
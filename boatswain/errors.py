@@ -12,3 +12,24 @@ class ParseError(Exception):
         Error parsing docker stream
     """
     pass
+
+
+class DependencyError(Exception):
+    """
+        Error in the dependencies between images
+    """
+    pass
+
+
+class DaemonError(Exception):
+    """
+        Error response of the docker daemon
+    """
+    pass
+
+
+class GitError(Exception):
+    """
+        Error asking git what changed
+    """
+    pass
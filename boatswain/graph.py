@@ -0,0 +1,174 @@
+"""
+    Dependency graph of the images in a boatswain file
+
+    Images depend on each other through their 'from' key. The graph
+    indexes these relations once, so ordering the images is linear
+    in the number of images instead of requeueing names until their
+    parent has been processed.
+"""
+from __future__ import absolute_import
+
+import collections
+
+from .errors import DependencyError
+
+
+class ImageGraph(object):
+    """
+        Dependency graph of (a subset of) the images dictionary
+
+        :param images: The dictionary of images
+        :type images: dict(string: image_definition)
+
+        :param names: The names in the graph, defaults to all images.
+                      The order of the names is kept where the
+                      dependencies allow it.
+        :type names: list(string)
+    """
+
+    def __init__(self, images, names=None):
+        if names is None:
+            names = list(images)
+        self.images = images
+        self.names = list(names)
+
+        # Parent of each name that has a 'from' key
+        self.parents = {}
+        # Children of each name that are in the graph
+        self.children = collections.OrderedDict(
+            (name, []) for name in self.names)
+
+        for name in self.names:
+            definition = images[name]
+            if 'from' in definition:
+                parent = definition['from']
+                self.parents[name] = parent
+                if parent in self.children:
+                    self.children[parent].append(name)
+
+    def external(self):
+        """
+            The names whose parent is not part of the graph
+
+            :returns: dict(name: parent)
+        """
+        return collections.OrderedDict(
+            (name, self.parents[name]) for name in self.names
+            if name in self.parents and self.parents[name] not in self.children)
+
+    def undefined(self):
+        """
+            The names whose parent is not defined in the images at all
+
+            :returns: dict(name: parent)
+        """
+        return collections.OrderedDict(
+            (name, parent) for name, parent in self.external().items()
+            if parent not in self.images)
+
+    def order(self):
+        """
+            Order the names so every parent comes before its children
+
+            Parents that are not part of the graph are ignored, so
+            their children are ordered as if they had no parent.
+
+            :raises DependencyError: when the images depend on each other
+                                     in a cycle
+        """
+        order = self.roots()
+
+        # Every name has a single parent, so a parent-first walk over
+        # the children visits each name exactly once (Kahn's algorithm)
+        index = 0
+        while index < len(order):
+            order.extend(self.children[order[index]])
+            index += 1
+
+        if len(order) != len(self.names):
+            raise DependencyError(self._describe_cycle(set(order)))
+
+        return order
+
+    def roots(self):
+        """
+            The names that are not built from a name in the graph
+        """
+        return [name for name in self.names
+                if self.parents.get(name) not in self.children]
+
+    def leaves(self):
+        """
+            The names that no name in the graph is built from
+        """
+        return [name for name in self.names if not self.children[name]]
+
+    def ancestors(self, names):
+        """
+            The names and all names in the graph they are built from,
+            directly or indirectly
+        """
+        found = [name for name in collections.OrderedDict.fromkeys(names)
+                 if name in self.children]
+        seen = set(found)
+        for name in found:
+            parent = self.parents.get(name)
+            if parent in self.children and parent not in seen:
+                seen.add(parent)
+                found.append(parent)
+        return found
+
+    def descendants(self, names):
+        """
+            The names and all names in the graph that are built from
+            them, directly or indirectly
+        """
+        found = [name for name in collections.OrderedDict.fromkeys(names)
+                 if name in self.children]
+        seen = set(found)
+        index = 0
+        while index < len(found):
+            for child in self.children[found[index]]:
+                if child not in seen:
+                    seen.add(child)
+                    found.append(child)
+            index += 1
+        return found
+
+    def subtree_sizes(self):
+        """
+            The number of names in the graph that are built from each
+            name, directly or indirectly, including the name itself
+        """
+        sizes = {}
+        for name in reversed(self.order()):
+            sizes[name] = 1 + sum(sizes[child] for child in self.children[name])
+        return sizes
+
+    def critical_paths(self, weights=None):
+        """
+            The length of the longest chain of names that starts at each
+            name and continues through its children, in the graph
+
+            :param weights: The length of each name, names without
+                            a weight have length 1
+            :type weights: dict(string: float)
+        """
+        weights = weights or {}
+        lengths = {}
+        for name in reversed(self.order()):
+            below = [lengths[child] for child in self.children[name]]
+            lengths[name] = weights.get(name, 1) + max(below or [0])
+        return lengths
+
+    def _describe_cycle(self, ordered):
+        """
+            Describe one of the cycles among the names that could not be ordered
+        """
+        name = next(name for name in self.names if name not in ordered)
+        seen = []
+        while name not in seen:
+            seen.append(name)
+            name = self.parents[name]
+        cycle = seen[seen.index(name):] + [name]
+        return "Circular dependency between images: " + " -> ".join(cycle)
@@ -0,0 +1,134 @@
+"""
+    Distribution of a build over several docker hosts
+
+    The images are split in subtrees that are built on one host, so
+    an image is usually built on the host that has its parent. Only
+    subtrees that are too large for one host are split further, their
+    parent image is then moved to the other hosts with docker save
+    and docker load.
+"""
+from __future__ import absolute_import, division
+
+import tempfile
+
+from .errors import BuildError
+
+
+def subtree_weights(graph, weights=None):
+    """
+    The total weight of each name and the names built from it
+
+    :param weights: The weight of each name, names without a weight
+                    weigh 1
+    :type weights: dict(string: float)
+    """
+    weights = weights or {}
+    totals = {}
+    for name in reversed(graph.order()):
+        totals[name] = weights.get(name, 1) + sum(
+            totals[child] for child in graph.children[name])
+    return totals
+
+
+def assign_hosts(graph, hosts, weights=None, located=None):
+    """
+    Assign every name of the graph to one of the hosts
+
+    Subtrees are assigned as a whole, largest first, to the host with
+    the least work. A subtree weighing more than an equal share of the
+    work is split: its root is assigned on its own and the subtrees of
+    its children are assigned separately. A host that does not have
+    the parent of a subtree needs it moved, which counts as one more
+    image of work.
+
+    :param hosts: The docker hosts
+    :type hosts: list(string)
+
+    :param weights: The weight of each name, e.g. its build duration
+    :type weights: dict(string: float)
+
+    :param located: Function returning the hosts that have a parent
+                    outside of the graph
+    :type located: callable
+
+    :returns: dict(name: host)
+    """
+    hosts = list(hosts)
+    if len(hosts) < 2:
+        return dict((name, hosts[0] if hosts else None)
+                    for name in graph.names)
+
+    weights = weights or {}
+    totals = subtree_weights(graph, weights)
+    if not totals:
+        return {}
+    share = sum(totals[name] for name in graph.roots()) / len(hosts)
+    # Moving a parent costs about as much as an average image
+    penalty = sum(weights.get(name, 1) for name in totals) / len(totals)
+
+    # Split the graph in subtrees, level by level from the roots
+    level = graph.roots()
+    levels = []
+    roots = set()
+    while level:
+        levels.append(sorted(level, key=lambda name: -totals[name]))
+        roots.update(level)
+        level = [child for name in level if totals[name] > share
+                 for child in graph.children[name]]
+
+    load = dict((host, 0) for host in hosts)
+    assignment = {}
+    # The hosts each parent is on, or will be moved to
+    having = {}
+    for level in levels:
+        for root in level:
+            parent = graph.parents.get(root)
+            if parent is None:
+                on = set(hosts)
+            elif parent not in having:
+                if parent in assignment:
+                    on = set([assignment[parent]])
+                elif located is not None:
+                    on = set(located(parent))
+                else:
+                    on = set(hosts)
+                having[parent] = on
+            else:
+                on = having[parent]
+
+            host = min(hosts, key=lambda host: load[host] + (
+                0 if host in on else penalty))
+            if host not in on:
+                load[host] += penalty
+                on.add(host)
+
+            # The subtree up to the roots of other subtrees
+            names = [root]
+            for name in names:
+                assignment[name] = host
+                load[host] += weights.get(name, 1)
+                names.extend(child for child in graph.children[name]
+                             if child not in roots)
+    return assignment
+
+
+def transfer_image(source, target, tag):
+    """
+    Copy an image from one docker daemon to another with docker save
+    and docker load
+
+    The saved image is kept in a temporary file, docker-py cannot
+    upload a stream of unknown length over a unix socket.
+
+    :param source: The client of the daemon that has the image
+    :param target: The client of the daemon to copy the image to
+
+    :raises BuildError: when the daemon could not load the image
+    """
+    with tempfile.TemporaryFile() as archive:
+        for chunk in source.api.get_image(tag):
+            archive.write(chunk)
+        archive.seek(0)
+        for message in target.api.load_image(archive) or []:
+            if 'error' in message:
+                raise BuildError(message['error'])
@@ -0,0 +1,188 @@
+"""
+    Index of the images known to the docker daemon
+
+    Instead of asking the daemon about every tag separately, the index
+    lists all images once and answers existence checks from memory.
+    Boatswain keeps the index up to date as it builds and removes images.
+"""
+from __future__ import absolute_import
+
+import threading
+
+from .util import split_tag
+
+# The tag the daemon lists for an image without tags
+UNTAGGED = '<none>:<none>'
+
+
+def normalize_tag(tag):
+    """
+        Normalize a tag to the form the daemon lists it in
+
+        Tags without a version get ':latest' and images on
+        dockerhub are listed without the 'docker.io/' prefix.
+    """
+    for prefix in ('docker.io/library/', 'docker.io/'):
+        if tag.startswith(prefix):
+            tag = tag[len(prefix):]
+            break
+
+    if ':' not in tag.rsplit('/', 1)[-1]:
+        tag += ':latest'
+    return tag
+
+
+def short_id(ident):
+    """
+        The short form of an image id, as used by the docker cli
+
+        sha256:ad8402983js938... becomes ad8402983js9
+    """
+    return ident.split(':')[-1][:12]
+
+
+class ImageIndex(object):
+    """
+        Tag to image id and image id to tags index of the daemon images
+
+        The daemon is only asked for its images on the first lookup.
+        Image ids are kept in their short form.
+
+        :param client: The docker client
+        :param connect: Function that creates the client when the index
+                        is first used and no client was given
+        :type connect: callable
+    """
+
+    def __init__(self, client=None, connect=None):
+        self.client = client
+        self.connect = connect
+        self.lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self.ids = None
+        self.tags = None
+        # Image id to the repository@digest of its pushes and pulls
+        self.digests = {}
+
+    def refresh(self):
+        """
+            Take a new snapshot of the images in the daemon
+        """
+        if self.client is None:
+            self.client = self.connect()
+        # A single request, images.list() inspects every image as well
+        self.update((image['Id'],
+                     [tag for tag in image.get('RepoTags') or []
+                      if tag != UNTAGGED],
+                     image.get('RepoDigests') or [])
+                    for image in self.client.api.images())
+
+    def update(self, images):
+        """
+            Replace the snapshot with the given images
+
+            :param images: The id and list of tags of every image,
+                           optionally followed by its list of
+                           repository@digest
+            :type images: iterable((string, list(string)))
+        """
+        ids = {}
+        tags = {}
+        digests = {}
+        for image in images:
+            ident = short_id(image[0])
+            tags[ident] = set(image[1])
+            for tag in image[1]:
+                ids[tag] = ident
+            if len(image) > 2 and image[2]:
+                digests[ident] = set(image[2])
+
+        with self.lock:
+            self.ids = ids
+            self.tags = tags
+            self.digests = digests
+
+    def _ensure(self):
+        if self.ids is None:
+            with self.refresh_lock:
+                if self.ids is None:
+                    self.refresh()
+
+    def get(self, tag):
+        """
+            The id of the image with the given tag, None if it does not exist
+        """
+        self._ensure()
+        return self.ids.get(normalize_tag(tag))
+
+    def exists(self, tag):
+        """
+            Whether an image with the given tag exists
+        """
+        return self.get(tag) is not None
+
+    def matches(self, tag, ident):
+        """
+            Whether tag refers to the image with the given id
+        """
+        return self.get(tag) == short_id(ident)
+
+    def tags_of(self, ident):
+        """
+            The tags of the image with the given id
+        """
+        self._ensure()
+        with self.lock:
+            return set(self.tags.get(short_id(ident), ()))
+
+    def add(self, tag, ident):
+        """
+            Record that tag now refers to the image with the given id
+        """
+        self._ensure()
+        tag = normalize_tag(tag)
+        ident = short_id(ident)
+        with self.lock:
+            self._untag(tag)
+            self.ids[tag] = ident
+            self.tags.setdefault(ident, set()).add(tag)
+
+    def digest(self, tag):
+        """
+            The digest the image of tag has in the repository of tag,
+            None if it was not pushed to or pulled from it
+        """
+        ident = self.get(tag)
+        repository = split_tag(normalize_tag(tag))[0] + '@'
+        with self.lock:
+            for digest in self.digests.get(ident, ()):
+                if digest.startswith(repository):
+                    return digest[len(repository):]
+        return None
+
+    def add_digest(self, tag, digest):
+        """
+            Record that the image of tag was pushed with the given digest
+        """
+        ident = self.get(tag)
+        if ident is None:
+            return
+        repository = split_tag(normalize_tag(tag))[0]
+        with self.lock:
+            self.digests.setdefault(ident, set()).add(
+                repository + '@' + digest)
+
+    def remove(self, tag):
+        """
+            Record that tag was removed
+        """
+        self._ensure()
+        with self.lock:
+            self._untag(normalize_tag(tag))
+
+    def _untag(self, tag):
+        ident = self.ids.pop(tag, None)
+        if ident is not None:
+            self.tags[ident].discard(tag)
+            if not self.tags[ident]:
+                del self.tags[ident]
@@ -0,0 +1,128 @@
+"""
+    Build manifest of boatswain
+
+    The manifest records, for every image, a key computed from all
+    inputs of its build: the context directory, the definition in the
+    boatswain file and the id of the parent image. When the key of an
+    image did not change since the last build, and the image still
+    exists, the build can be skipped.
+"""
+from __future__ import absolute_import
+
+import hashlib
+import json
+import os
+import threading
+
+from .context import hash_context, hash_paths
+from .util import load_json, save_json
+
+
+class BuildManifest(object):
+    """
+        Keys and image ids of the last successful build of each image
+
+        :param path: The json file the manifest is stored in, when
+                     it is None the manifest is not persisted
+        :type path: string
+
+        :param excludes: Directories left out of the contexts, such as
+                         the state directory the manifest is kept in
+        :type excludes: list(string)
+    """
+
+    def __init__(self, path=None, excludes=()):
+        self.path = path
+        self.excludes = list(excludes)
+        self.lock = threading.Lock()
+
+        data = load_json(path, {}) if path else {}
+        # name -> {'key': build key, 'id': image id}
+        self.images = data.get('images', {})
+        # absolute path -> [size, mtime, digest] of context files
+        self.files = data.get('files', {})
+        # name -> seconds the last build took
+        self.durations = data.get('durations', {})
+        # name -> key of the last successful before commands
+        self.before = data.get('before', {})
+
+    def key(self, definition, parent_id=None):
+        """
+            Compute the key of all inputs of building an image
+
+            The tag is not an input of the build, so images that only
+            differ in their tag have the same key.
+        """
+        definition = dict(definition)
+        definition.pop('tag', None)
+        definition['context'] = os.path.abspath(definition['context'])
+        inputs = {
+            'context': hash_context(definition['context'], self.files,
+                                    self.excludes),
+            'definition': definition,
+            'parent': parent_id
+        }
+        encoded = json.dumps(inputs, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def before_key(self, before):
+        """
+            Compute the key of the commands, inputs and outputs of
+            the before commands of an image
+        """
+        inputs = {
+            'command': before.get('command'),
+            'inputs': hash_paths(before.get('inputs', []), self.files),
+            'outputs': hash_paths(before.get('outputs', []), self.files)
+        }
+        encoded = json.dumps(inputs, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def record_before(self, name, key):
+        """
+            Record successful before commands of name
+        """
+        with self.lock:
+            self.before[name] = key
+
+    def lookup(self, name, key):
+        """
+            The image id of the last build of name with the same key
+        """
+        entry = self.images.get(name)
+        if entry is not None and entry['key'] == key:
+            return entry['id']
+        return None
+
+    def recorded_key(self, name):
+        """
+            The key of the last recorded build of name, None if there is
+            none
+        """
+        with self.lock:
+            return (self.images.get(name) or {}).get('key')
+
+    def record(self, name, key, ident):
+        """
+            Record a successful build of name
+        """
+        with self.lock:
+            self.images[name] = {'key': key, 'id': ident}
+
+    def record_duration(self, name, seconds):
+        """
+            Record how long the last build of name took
+        """
+        with self.lock:
+            self.durations[name] = round(seconds, 3)
+
+    def save(self):
+        """
+            Write the manifest to its file
+        """
+        if self.path:
+            with self.lock:
+                save_json(self.path, {'images': self.images,
+                                      'files': self.files,
+                                      'durations': self.durations,
+                                      'before': self.before})
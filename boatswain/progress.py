@@ -0,0 +1,242 @@
+"""
+    Progress display of boatswain
+
+    A single renderer draws the total progress and a line for every
+    image that is being processed. It only redraws when something
+    changed, at most a few times per second, and does nothing at all
+    when the output is not a terminal.
+"""
+from __future__ import absolute_import, division
+
+import shutil
+import sys
+import threading
+import time
+
+BAR_WIDTH = 20
+
+
+def format_time(seconds):
+    """
+        Format a number of seconds as h:mm:ss
+    """
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '{}:{:02d}:{:02d}'.format(hours, minutes, seconds)
+
+
+def format_bar(step, total, width=BAR_WIDTH):
+    """
+        A bar of width characters that is step / total full
+    """
+    if not total:
+        return u'│' + u' ' * width + u'│'
+    filled = min(width, width * step // total)
+    return u'│' + u'█' * filled + u' ' * (width - filled) + u'│'
+
+
+class ProgressRenderer(object):
+    """
+        Draws the total progress bar with one line per in-flight image
+
+        While the renderer is active, output written to stdout and
+        stderr is printed above the progress lines.
+
+        :param enabled: Whether to show progress at all, progress is
+                        only shown when the stream is a terminal
+        :type enabled: bool
+
+        :param stream: The terminal to draw on, defaults to stderr
+        :type stream: file
+
+        :param interval: Minimum number of seconds between redraws
+        :type interval: float
+    """
+
+    def __init__(self, enabled=True, stream=None, interval=0.1):
+        self.stream = stream if stream is not None else sys.stderr
+        isatty = getattr(self.stream, 'isatty', None)
+        self.enabled = bool(enabled and isatty is not None and isatty())
+        self.interval = interval
+        self.lock = threading.RLock()
+        self.active = False
+        self.done = 0
+        self.total = 0
+        self.started = None
+        # name -> [start time, step, total, text], in order of starting
+        self.images = {}
+        self.order = []
+        self.drawn = 0
+        self.last_draw = 0
+        # The original output and its redirections
+        self.stdout = None
+        self.stderr = None
+        self.redirects = None
+
+    def start(self, total):
+        """
+            Start showing the progress of processing total images
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.done = 0
+            self.total = total
+            self.started = time.time()
+            if not self.active:
+                self.active = True
+                self.stdout, self.stderr = sys.stdout, sys.stderr
+                self.redirects = (RedirectedOutput(self, self.stdout),
+                                  RedirectedOutput(self, self.stderr))
+                sys.stdout, sys.stderr = self.redirects
+            self._draw(force=True)
+
+    def stop(self):
+        """
+            Draw the final progress and stop redirecting the output
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            if not self.active:
+                return
+            for redirect in self.redirects:
+                redirect.close()
+            if sys.stdout is self.redirects[0]:
+                sys.stdout = self.stdout
+            if sys.stderr is self.redirects[1]:
+                sys.stderr = self.stderr
+            self.redirects = None
+
+            self.images.clear()
+            del self.order[:]
+            self._draw(force=True)
+            self.stream.write('\n')
+            self.stream.flush()
+            self.drawn = 0
+            self.active = False
+
+    def add(self, name):
+        """
+            Show a line for an image that is being processed
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            if name not in self.images:
+                self.order.append(name)
+            self.images[name] = [time.time(), 0, None, '']
+            self._draw()
+
+    def update(self, name, step, total=None, text=''):
+        """
+            Update the line of an image
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            image = self.images.get(name)
+            if image is None:
+                return
+            image[1:] = [step, total, text]
+            self._draw()
+
+    def remove(self, name):
+        """
+            Remove the line of an image that is done
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            if self.images.pop(name, None) is not None:
+                self.order.remove(name)
+                self._draw()
+
+    def advance(self, name=None):
+        """
+            Count an image as processed
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.done += 1
+            self._draw()
+
+    def write(self, stream, text):
+        """
+            Write text to stream above the progress lines
+        """
+        with self.lock:
+            if self.drawn:
+                self._clear()
+            stream.write(text)
+            stream.flush()
+            self._draw(force=True)
+
+    def _clear(self):
+        # Move to the first progress line and clear everything below it
+        self.stream.write('\r\x1b[{}A\x1b[J'.format(self.drawn - 1)
+                          if self.drawn > 1 else '\r\x1b[J')
+        self.drawn = 0
+
+    def _draw(self, force=False):
+        if not self.active:
+            return
+        now = time.time()
+        if not force and now - self.last_draw < self.interval:
+            return
+        self.last_draw = now
+
+        width = max(20, shutil.get_terminal_size().columns - 1)
+        lines = [u'{:20} {} {}/{} {}'.format(
+            'Total', format_bar(self.done, self.total), self.done,
+            self.total, format_time(now - self.started))]
+        for name in self.order:
+            start, step, total, text = self.images[name]
+            progress = '{}/{}'.format(step, total) if total else str(step)
+            lines.append(u'  {:18} {} {:>7} {} {}'.format(
+                name, format_bar(step, total), progress,
+                format_time(now - start), text))
+
+        if self.drawn:
+            self._clear()
+        self.stream.write('\n'.join(line[:width] for line in lines))
+        self.stream.flush()
+        self.drawn = len(lines)
+
+
+class RedirectedOutput(object):
+    """
+        File-like object that prints above the progress lines
+    """
+
+    def __init__(self, renderer, stream):
+        self.renderer = renderer
+        self.stream = stream
+        self.buffer = ''
+
+    def write(self, text):
+        # Only whole lines are printed, so the progress is not
+        # redrawn in the middle of a line
+        self.buffer += text
+        if '\n' in self.buffer:
+            lines, _, self.buffer = self.buffer.rpartition('\n')
+            self.renderer.write(self.stream, lines + '\n')
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        """
+            Print what is left of an unfinished line
+        """
+        if self.buffer:
+            self.renderer.write(self.stream, self.buffer + '\n')
+            self.buffer = ''
+
+    def isatty(self):
+        return self.stream.isatty()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
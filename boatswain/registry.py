@@ -0,0 +1,214 @@
+"""
+    Manifest digests of the images in their registries
+
+    Asks a registry which manifest a tag refers to, so a push can be
+    skipped when the registry already has the image that would be
+    pushed. The registry is asked with a HEAD request of the manifest,
+    with the credentials of docker login and, when the registry asks
+    for one, a token of its token service, like dockerhub does. When a
+    registry cannot be asked no digest is known and the image is pushed.
+"""
+from __future__ import absolute_import
+
+import logging
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .util import registry_host, split_tag
+
+# Seconds to wait for a registry to answer
+REGISTRY_TIMEOUT = 10
+
+# Registries that docker talks to over plain http
+INSECURE_HOSTS = ('localhost', '127.0.0.1')
+
+# The manifests docker pushes and pulls, the registry answers with the
+# digest of the one it keeps for the tag
+MANIFEST_TYPES = ', '.join([
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.oci.image.index.v1+json',
+])
+
+# The key="value" parameters of a WWW-Authenticate challenge
+CHALLENGE_PARAMETER = re.compile(r'(\w+)="([^"]*)"')
+
+
+def registry_url(host):
+    """
+        The url of the registry api of a registry host
+    """
+    if host == 'docker.io':
+        return 'https://registry-1.docker.io'
+    if host.split(':')[0] in INSECURE_HOSTS:
+        return 'http://' + host
+    return 'https://' + host
+
+
+def repository_path(tag):
+    """
+        The repository and version of a tag in its registry
+
+        registry.example.com:5000/myorg/image:1.0 becomes
+        ('myorg/image', '1.0') and ubuntu becomes ('library/ubuntu',
+        'latest')
+    """
+    host = registry_host(tag)
+    repository, version = split_tag(tag)
+    if repository.startswith(host + '/'):
+        repository = repository[len(host) + 1:]
+    if host == 'docker.io' and '/' not in repository:
+        repository = 'library/' + repository
+    return repository, version
+
+
+def parse_challenge(header):
+    """
+        The scheme and parameters of a WWW-Authenticate header
+
+        Bearer realm="https://auth.docker.io/token",service="registry"
+        becomes ('bearer', {'realm': 'https://auth.docker.io/token',
+        'service': 'registry'})
+    """
+    scheme, _, parameters = header.strip().partition(' ')
+    return scheme.lower(), dict(CHALLENGE_PARAMETER.findall(parameters))
+
+
+class RegistryDigests(object):
+    """
+        The manifest digests of tags, each asked from its registry once
+        per run
+
+        :param timeout: Seconds to wait for a registry
+        :type timeout: float
+    """
+
+    def __init__(self, timeout=REGISTRY_TIMEOUT):
+        self.timeout = timeout
+        self.digests = {}
+        # host -> (username, password) of docker login, or None
+        self.credentials = {}
+        # (host, repository) -> token of the token service of the host
+        self.tokens = {}
+        self.lock = threading.Lock()
+
+    def get(self, tag):
+        """
+            The digest of the manifest tag refers to in its registry,
+            None when it is not known
+        """
+        with self.lock:
+            if tag in self.digests:
+                return self.digests[tag]
+        digest = self._lookup(tag)
+        with self.lock:
+            self.digests[tag] = digest
+        return digest
+
+    def fetch(self, tags, jobs=1):
+        """
+            Look up the digests of tags in parallel
+        """
+        tags = [tag for tag in tags if tag not in self.digests]
+        if not tags:
+            return
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            list(executor.map(self.get, tags))
+
+    def record(self, tag, digest):
+        """
+            Record that tag was pushed with the given digest
+        """
+        with self.lock:
+            self.digests[tag] = digest
+
+    def _lookup(self, tag):
+        # Imported here like docker, requests is installed with it
+        import requests
+        host = registry_host(tag)
+        repository, version = repository_path(tag)
+        url = '{}/v2/{}/manifests/{}'.format(registry_url(host), repository,
+                                             version)
+        logger = logging.getLogger('boatswain')
+        try:
+            response = self._head(url, host, repository)
+        except (requests.RequestException, ValueError) as error:
+            logger.debug("No digest of %s: %s", tag, error)
+            return None
+        if response.status_code != 200:
+            logger.debug("No digest of %s: %s answered %d", tag, host,
+                         response.status_code)
+            return None
+        return response.headers.get('Docker-Content-Digest')
+
+    def _head(self, url, host, repository):
+        """
+            Request the manifest at url, authenticating when the
+            registry asks for it
+        """
+        import requests
+        headers = {'Accept': MANIFEST_TYPES}
+        with self.lock:
+            token = self.tokens.get((host, repository))
+        if token is not None:
+            headers['Authorization'] = 'Bearer ' + token
+        response = requests.head(url, headers=headers, timeout=self.timeout)
+        if response.status_code != 401:
+            return response
+
+        scheme, parameters = parse_challenge(
+            response.headers.get('WWW-Authenticate', ''))
+        credentials = self._credentials(host)
+        if scheme == 'bearer' and 'realm' in parameters:
+            token = self._token(parameters, repository, credentials)
+            with self.lock:
+                self.tokens[(host, repository)] = token
+            headers['Authorization'] = 'Bearer ' + token
+            return requests.head(url, headers=headers, timeout=self.timeout)
+        if scheme == 'basic' and credentials is not None:
+            return requests.head(url, headers=headers, auth=credentials,
+                                 timeout=self.timeout)
+        return response
+
+    def _token(self, challenge, repository, credentials):
+        """
+            A token to pull repository from the token service named in
+            the challenge of a registry
+        """
+        import requests
+        params = {'scope': challenge.get('scope',
+                                         'repository:{}:pull'.format(repository))}
+        if 'service' in challenge:
+            params['service'] = challenge['service']
+        response = requests.get(challenge['realm'], params=params,
+                                auth=credentials, timeout=self.timeout)
+        response.raise_for_status()
+        answer = response.json()
+        token = answer.get('token') or answer.get('access_token')
+        if not token:
+            raise ValueError("No token in the answer of " + challenge['realm'])
+        return token
+
+    def _credentials(self, host):
+        """
+            The username and password docker login stored for host
+        """
+        import docker
+        with self.lock:
+            if host not in self.credentials:
+                try:
+                    config = docker.auth.resolve_authconfig(
+                        docker.auth.load_config(), host) or {}
+                except docker.errors.DockerException as error:
+                    # A credential helper that fails is like no login
+                    logging.getLogger('boatswain').debug(
+                        "No credentials for %s: %s", host, error)
+                    config = {}
+                credentials = None
+                if config.get('username'):
+                    credentials = (config['username'],
+                                   config.get('password') or '')
+                self.credentials[host] = credentials
+            return self.credentials[host]
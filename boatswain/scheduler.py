@@ -0,0 +1,194 @@
+"""
+    Dependency aware scheduling of boatswain actions
+
+    The scheduler runs a task for every name in a dependency graph
+    on a pool of worker threads. A name is started as soon as all
+    the names it depends on have finished successfully, so siblings
+    that share no dependency are processed at the same time.
+"""
+from __future__ import absolute_import
+
+import collections
+import heapq
+import itertools
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class Scheduler(object):
+    """
+        Runs tasks over a dependency graph using a pool of workers
+    """
+
+    def __init__(self, jobs=1, keep_going=False, limits=None):
+        self.jobs = max(1, int(jobs))
+        self.keep_going = keep_going
+        # Maximum number of running tasks per resource
+        self.limits = limits or {}
+
+    def run(self, names, dependencies, task, callback=None, resources=None,
+            priorities=None):
+        """
+            Run task(name) for all names in dependency order
+
+            :param names: The names to process, in order of preference
+            :type names: list(string)
+
+            :param dependencies: The names that should finish successfully
+                                 before a name can be started. Dependencies
+                                 that are not in names can never be
+                                 satisfied and block the name.
+            :type dependencies: dict(string: list(string))
+
+            :param task: Function that processes a single name and
+                         returns whether it succeeded
+            :type task: function(string) -> bool
+
+            :param callback: Called from the calling thread after each task
+            :type callback: function(string, bool)
+
+            :param resources: The resource each name uses, no more tasks
+                              than the limit of a resource run at once
+            :type resources: dict(string: string)
+
+            :param priorities: Ready names with a higher priority are
+                               started first, names without a priority
+                               have priority 0
+            :type priorities: dict(string: float)
+
+            :returns: dictionary with the 'done', 'failed' and 'blocked' names
+        """
+        state = ScheduleState(names, dependencies, resources, self.limits,
+                              priorities)
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            while True:
+                while not state.stopped and len(running) < self.jobs:
+                    name = state.start()
+                    if name is None:
+                        break
+                    running[executor.submit(task, name)] = name
+
+                if not running:
+                    break
+
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    succeeded = bool(future.result())
+                    state.finish(name, succeeded, self.keep_going)
+                    if callback is not None:
+                        callback(name, succeeded)
+
+        return state.result()
+
+
+class ScheduleState(object):
+    """
+        Bookkeeping of a single scheduler run: which names are ready,
+        which wait for their dependencies and how the others ended
+
+        :param names: The names to process, in order of preference
+        :type names: list(string)
+
+        :param dependencies: The names each name waits for
+        :type dependencies: dict(string: list(string))
+
+        :param resources: The resource each name uses
+        :type resources: dict(string: string)
+
+        :param limits: Maximum number of running names per resource
+        :type limits: dict(string: int)
+
+        :param priorities: The priority of each name
+        :type priorities: dict(string: float)
+    """
+
+    def __init__(self, names, dependencies, resources=None, limits=None,
+                 priorities=None):
+        self.names = names
+        self.resources = resources or {}
+        self.limits = limits or {}
+        self.priorities = priorities or {}
+        self.remaining = {}
+        self.dependents = collections.defaultdict(list)
+
+        # Ready names are queued per resource, by priority and
+        # then in order of preference
+        self.ready = collections.OrderedDict()
+        self.sequence = itertools.count()
+        self.in_use = collections.Counter()
+
+        self.done = []
+        self.failed = []
+        self.blocked = []
+        self.stopped = False
+
+        scheduled = set(names)
+        for name in names:
+            deps = dependencies.get(name, [])
+            if any(dep not in scheduled for dep in deps):
+                self.blocked.append(name)
+            elif deps:
+                self.remaining[name] = len(deps)
+                for dep in deps:
+                    self.dependents[dep].append(name)
+            else:
+                self._queue(name)
+
+    def _queue(self, name):
+        heapq.heappush(self.ready.setdefault(self.resources.get(name), []),
+                       (-self.priorities.get(name, 0), next(self.sequence),
+                        name))
+
+    def _available(self, resource):
+        return (resource not in self.limits or
+                self.in_use[resource] < self.limits[resource])
+
+    def start(self):
+        """
+            Take the most preferred ready name whose resource is
+            available, None if there is no such name
+        """
+        best = None
+        for resource, candidates in self.ready.items():
+            if candidates and self._available(resource) and \
+                    (best is None or candidates[0] < best[0]):
+                best = candidates
+        if best is None:
+            return None
+
+        name = heapq.heappop(best)[-1]
+        self.in_use[self.resources.get(name)] += 1
+        return name
+
+    def finish(self, name, succeeded, keep_going=False):
+        """
+            Record the outcome of a started name and queue the
+            dependents that are now ready
+        """
+        self.in_use[self.resources.get(name)] -= 1
+        if succeeded:
+            self.done.append(name)
+            for dependent in self.dependents[name]:
+                self.remaining[dependent] -= 1
+                if self.remaining[dependent] == 0:
+                    del self.remaining[dependent]
+                    self._queue(dependent)
+        else:
+            self.failed.append(name)
+            if not keep_going:
+                self.stopped = True
+
+    def result(self):
+        """
+            The 'done', 'failed' and 'blocked' names of the run
+        """
+        blocked = list(self.blocked)
+        if not self.stopped:
+            # Everything that is still waiting depends on a failed
+            # or blocked name
+            blocked.extend(name for name in self.names
+                           if name in self.remaining)
+
+        return {'done': self.done, 'failed': self.failed, 'blocked': blocked}
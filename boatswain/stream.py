@@ -0,0 +1,84 @@
+"""
+    Incremental decoding of the docker progress stream
+
+    The docker daemon reports progress as a stream of json objects,
+    each followed by a newline. The http chunks docker-py hands us do not
+    necessarily line up with these objects: large 'stream' messages are
+    split over several chunks and small ones are sent together.
+"""
+from __future__ import absolute_import
+
+import codecs
+import json
+
+from .errors import ParseError
+
+
+class JsonStreamDecoder(object):
+    """
+        Decodes json objects from a stream of byte chunks
+
+        Text is only joined and decoded once the newline ending an
+        object has arrived, so every object is parsed exactly once no
+        matter how many chunks it was split over.
+    """
+
+    def __init__(self):
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        # Text received after the last complete line
+        self.parts = []
+
+    def feed(self, chunk):
+        """
+            Feed the next chunk of the stream and return the list of
+            json objects it completes
+        """
+        text = self.utf8.decode(chunk)
+        end = text.rfind('\n')
+        if end < 0:
+            if text:
+                self.parts.append(text)
+            return []
+
+        self.parts.append(text[:end + 1])
+        complete = ''.join(self.parts)
+        rest = text[end + 1:]
+        self.parts = [rest] if rest else []
+        return self._decode(complete)
+
+    def close(self):
+        """
+            Decode whatever is left at the end of the stream
+        """
+        self.parts.append(self.utf8.decode(b'', final=True))
+        remaining = ''.join(self.parts)
+        self.parts = []
+        return self._decode(remaining)
+
+    def decode(self, chunks):
+        """
+            Generate all json objects in an iterable of byte chunks
+        """
+        for chunk in chunks:
+            for obj in self.feed(chunk):
+                yield obj
+        for obj in self.close():
+            yield obj
+
+    def _decode(self, text):
+        objects = []
+        position = 0
+        length = len(text)
+        while True:
+            # Skip the whitespace (usually '\r\n') between objects
+            while position < length and text[position] in ' \t\r\n':
+                position += 1
+            if position == length:
+                return objects
+
+            try:
+                obj, position = self.decoder.raw_decode(text, position)
+            except ValueError as error:
+                raise ParseError("Invalid docker response: " + str(error))
+            objects.append(obj)
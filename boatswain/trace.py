@@ -0,0 +1,97 @@
+"""
+    Timing traces of boatswain runs
+
+    The trace records wall-clock spans of images, Dockerfile steps,
+    before commands and context uploads in the Chrome trace event
+    format, which can be opened in chrome://tracing or Perfetto.
+    Every image gets its own lane in the trace.
+"""
+from __future__ import absolute_import
+
+import contextlib
+import os
+import threading
+import time
+
+from .util import save_json
+
+
+class Trace(object):
+    """
+        Collects spans and writes them as Chrome trace event json
+
+        :param path: The file the trace is written to, when it is None
+                     nothing is recorded
+        :type path: string
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.start = time.time()
+        self.lock = threading.Lock()
+        self.events = []
+        # Lane number of each image, lane 0 is boatswain itself
+        self.lanes = {None: 0}
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    def now(self):
+        """
+            Microseconds since the start of the trace
+        """
+        return int((time.time() - self.start) * 1e6)
+
+    def lane(self, name):
+        """
+            The lane of an image, new lanes are named after their image
+        """
+        with self.lock:
+            if name not in self.lanes:
+                self.lanes[name] = len(self.lanes)
+                self.events.append({'name': 'thread_name', 'ph': 'M',
+                                    'pid': os.getpid(),
+                                    'tid': self.lanes[name],
+                                    'args': {'name': name}})
+            return self.lanes[name]
+
+    def complete(self, name, category, start, end=None, image=None,
+                 args=None):
+        """
+            Record a span that started at start and ended at end,
+            or now when end is None
+        """
+        if not self.enabled:
+            return
+        if end is None:
+            end = self.now()
+        event = {'name': name, 'cat': category, 'ph': 'X',
+                 'ts': start, 'dur': max(0, end - start),
+                 'pid': os.getpid(), 'tid': self.lane(image)}
+        if args:
+            event['args'] = args
+        with self.lock:
+            self.events.append(event)
+
+    @contextlib.contextmanager
+    def span(self, name, category, image=None, args=None):
+        """
+            Record the time spent in the with block as a span
+        """
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.complete(name, category, start, image=image, args=args)
+
+    def save(self):
+        """
+            Write the trace to its file
+        """
+        if not self.enabled:
+            return
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event.get('ts', -1))
+        save_json(self.path, {'traceEvents': events,
+                              'displayTimeUnit': 'ms'})
@@ -2,7 +2,11 @@
     Utility functions for working with docker-py
     and dictionaries
 """
+import json
 import logging
+import os
+
+from .errors import DependencyError
 
 
 def extract_step(line):
@@ -70,6 +74,52 @@ def extract_container_id_removal(line):
         raise Exception("Unrecognized docker removing line: " + line)
 
 
+def registry_host(tag):
+    """
+    Extracts the registry host from a full image tag
+
+    These tags look like:
+    myorg/image:1.0 (pushed to docker.io)
+    registry.example.com:5000/myorg/image:1.0
+    """
+    parts = tag.split('/', 1)
+    if len(parts) == 2 and ('.' in parts[0] or ':' in parts[0] or
+                            parts[0] == 'localhost'):
+        return parts[0]
+    return 'docker.io'
+
+
+def split_tag(tag):
+    """
+    Splits a full image tag in its repository and version
+
+    myorg/image:1.0 becomes ('myorg/image', '1.0') and
+    localhost:5000/myorg/image becomes ('localhost:5000/myorg/image', 'latest')
+    """
+    repository, _, version = tag.rpartition(':')
+    if not repository or '/' in version:
+        return tag, 'latest'
+    return repository, version
+
+
+def size_text(size):
+    """
+    A number of bytes as text with a binary unit, e.g. 1.5 GB
+
+    :param size: The number of bytes
+    :type size: int
+    """
+    for unit in ('B', 'kB', 'MB', 'GB'):
+        if abs(size) < 1024:
+            break
+        size /= 1024.0
+    else:
+        unit = 'TB'
+    if unit == 'B':
+        return '{} B'.format(int(size))
+    return '{:.1f} {}'.format(size, unit)
+
+
 def find_dependencies(name, images):
     """
     Finds the dependencies of name in the
@@ -85,12 +135,55 @@ def find_dependencies(name, images):
     # Should this check whether keys exists
     # or just throw KeyError exceptions?
     names = []
+    seen = set()
 
     curname = name
     while 'from' in images[curname]:
         names.append(curname)
+        seen.add(curname)
         curname = images[curname]['from']
+        if curname in seen:
+            raise DependencyError(
+                "Circular dependency between images: " +
+                " -> ".join(names[names.index(curname):] + [curname]))
 
     names.append(curname)
 
     return names
+
+
+def load_json(path, default=None):
+    """
+    Load a json file written by save_json
+
+    Returns default when the file does not exist or
+    cannot be read, so state files are always optional.
+
+    :param path: The path of the json file
+    :type path: string
+    """
+    try:
+        with open(path) as jsonfile:
+            return json.load(jsonfile)
+    except (IOError, OSError, ValueError) as error:
+        if os.path.exists(path):
+            logger = logging.getLogger("boatswain")
+            logger.warning("Ignoring unreadable file %s: %s", path, error)
+        return default
+
+
+def save_json(path, data):
+    """
+    Atomically write data to a json file
+
+    :param path: The path of the json file
+    :type path: string
+    """
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    temporary = path + '.tmp'
+    with open(temporary, 'w') as jsonfile:
+        json.dump(data, jsonfile, sort_keys=True)
+    os.replace(temporary, path)
@@ -24,7 +24,7 @@ setup(
     license='Apache Software License',
     author='Berend Weel',
     install_requires=[
-        'setuptools >= 30', 'docker>=3.0.0, <5.0.0', 'PyYAML>=4.2b1', 'progressbar2>=3.16.0, <4.0.0',
+        'setuptools >= 30', 'docker>=3.0.0, <5.0.0', 'PyYAML>=4.2b1',
         'six>=1.10.0, <2.0.0'
     ],
     extras_require={
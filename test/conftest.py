@@ -2,13 +2,15 @@
     Shared fixtures for testing
 """
 from io import StringIO
+import os
 import posixpath
 import pytest
 import yaml
 import docker
 import platform
 
-from boatswain import Boatswain
+from boatswain import Boatswain, context
+from fake_daemon import FakeDaemon
 
 
 def boatswain_file():
@@ -99,6 +101,35 @@ def boatswain_windows_failing_file():
     """
 
 
+@pytest.fixture
+def daemon(monkeypatch):
+    """
+        A fake daemon that DOCKER_HOST points to
+    """
+    with FakeDaemon() as fake:
+        monkeypatch.setenv('DOCKER_HOST', fake.url)
+        yield fake
+
+
+@pytest.fixture
+def unreadable(monkeypatch):
+    """
+        Makes the files of a context directory fail to read while they
+        are sent to the daemon
+    """
+    read_exactly = context._read_exactly
+    directories = []
+
+    def failing_read(path, size, chunk_size):
+        if any(path.startswith(directory + os.sep)
+               for directory in directories):
+            raise IOError('Permission denied: ' + path)
+        return read_exactly(path, size, chunk_size)
+
+    monkeypatch.setattr(context, '_read_exactly', failing_read)
+    return lambda directory: directories.append(os.path.abspath(directory))
+
+
 @pytest.fixture
 def bsfile():
     """
@@ -0,0 +1,606 @@
+"""
+    A fake docker daemon on a unix socket
+
+    It answers the few engine API calls boatswain makes: listing,
+    building, tagging, removing, pruning, pushing, pulling, saving and
+    loading images, and the disk usage of their layers. Pushed images
+    are kept in a fake registry they can be pulled from, FakeRegistry
+    serves their manifest digests. Builds only read the Dockerfile from
+    the context, every instruction is a step.
+    Build and push responses are streamed like the real daemon does,
+    spread out over the latency of the daemon.
+"""
+import hashlib
+import io
+import json
+import os
+import re
+import shutil
+import socketserver
+import tarfile
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+try:
+    from urllib.parse import parse_qs, unquote, urlparse
+except ImportError:  # pragma: no cover
+    from urllib import unquote
+    from urlparse import parse_qs, urlparse
+
+VERSION = re.compile(r'^/v[0-9.]+/')
+MANIFEST = re.compile(r'^/v2/(?P<name>.+)/manifests/(?P<reference>[^/]+)$')
+# The token the token service of FakeRegistry hands out
+TOKEN = 'fake-token'
+
+
+def manifest_digest(ident):
+    """
+        The digest of the manifest the fake pushes for an image
+    """
+    return 'sha256:' + hashlib.sha256(ident.encode()).hexdigest()
+
+
+class FakeDaemon(object):
+    """
+        Fake docker daemon serving on a unix socket in a temporary
+        directory, use url to connect to it
+
+        :param latency: Seconds every build or push takes
+        :type latency: float
+
+        :param output: Lines of output of every RUN instruction
+        :type output: int
+
+        :param layers: Number of layers of every pushed image
+        :type layers: int
+
+        :param require_parents: Fail builds from an image of an
+                                organisation the daemon does not have
+        :type require_parents: bool
+
+        :param size: Bytes of the layers of every built image
+        :type size: int
+    """
+
+    def __init__(self, latency=0, output=0, layers=1, require_parents=False,
+                 size=1024):
+        self.latency = latency
+        self.output = output
+        self.layers = layers
+        self.require_parents = require_parents
+        self.size = size
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'docker.sock')
+        self.url = 'unix://' + self.path
+        # Tag to image id
+        self.images = {}
+        # Image id to the repository@digest of its pushes
+        self.digests = {}
+        # Image id to the bytes of its layers and to the id of its parent
+        self.sizes = {}
+        self.parents = {}
+        # Tags in the order they were removed
+        self.removed = []
+        # Tag to image id of the pushed images
+        self.registry = {}
+        # Tag to the cache_from tags of its last build
+        self.cache_from = {}
+        # Tags whose build fails
+        self.failing = set()
+        self.requests = []
+        # Tags in the order their builds started
+        self.builds = []
+        self.lock = threading.Lock()
+        self.running = 0
+        self.most_running = 0
+        self.server = None
+
+    def start(self):
+        daemon = self
+
+        class Handler(FakeDaemonHandler):
+            fake = daemon
+
+        self.server = UnixServer(self.path, Handler)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+    def requested(self, method, path=''):
+        """
+            The paths of the requests with the given method
+            that start with path
+        """
+        return [url for requested, url in self.requests
+                if requested == method and url.startswith(path)]
+
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Like the real daemon, accept bursts of concurrent connections
+    request_queue_size = 128
+
+    def get_request(self):
+        # http.server expects a client address
+        request, _ = super(UnixServer, self).get_request()
+        return request, ('fake', 0)
+
+
+class FakeDaemonHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fake = None
+
+    def log_message(self, *args):
+        pass
+
+    def handle(self):
+        try:
+            BaseHTTPRequestHandler.handle(self)
+        except ConnectionError:
+            # The client stops reading a stream after an error message
+            pass
+
+    def route(self):
+        url = urlparse(self.path)
+        path = VERSION.sub('/', unquote(url.path))
+        params = dict((key, values[0])
+                      for key, values in parse_qs(url.query).items())
+        with self.fake.lock:
+            self.fake.requests.append((self.command, path))
+        return path, params
+
+    def do_GET(self):
+        path, params = self.route()
+        if path == '/_ping':
+            self.send_text(200, 'OK')
+        elif path == '/version':
+            self.send_json(200, {'ApiVersion': '1.40', 'Version': '19.03.0'})
+        elif path == '/images/json':
+            with self.fake.lock:
+                ids = {}
+                for tag, ident in self.fake.images.items():
+                    ids.setdefault(ident, []).append(tag)
+                if params.get('all') in ('1', 'true', 'True'):
+                    # The untagged images as well, like intermediates
+                    for ident in self.fake.sizes:
+                        ids.setdefault(ident, [])
+                images = [{'Id': 'sha256:' + ident, 'RepoTags': tags,
+                           'RepoDigests': sorted(self.fake.digests.get(
+                               ident, ())),
+                           'ParentId': self.image_id(
+                               self.fake.parents.get(ident)),
+                           'Size': self.total_size(ident)}
+                          for ident, tags in ids.items()]
+            self.send_json(200, images)
+        elif path.startswith('/images/') and path.endswith('/json'):
+            self.inspect(path[len('/images/'):-len('/json')])
+        elif path.startswith('/images/') and path.endswith('/get'):
+            self.save(path[len('/images/'):-len('/get')])
+        elif path == '/system/df':
+            with self.fake.lock:
+                used = sum(self.fake.sizes.values())
+            self.send_json(200, {'LayersSize': used, 'Images': [],
+                                 'Containers': [], 'Volumes': []})
+        else:
+            self.send_json(404, {'message': 'page not found'})
+
+    @staticmethod
+    def image_id(ident):
+        return 'sha256:' + ident if ident else ''
+
+    def total_size(self, ident):
+        """
+            The bytes of the layers of an image and of its parents, like
+            the size docker lists. Call with the lock held.
+        """
+        size = 0
+        while ident is not None:
+            size += self.fake.sizes.get(ident, 0)
+            ident = self.fake.parents.get(ident)
+        return size
+
+    def inspect(self, name):
+        name = name.split(':', 1)[-1] if name.startswith('sha256:') else name
+        with self.fake.lock:
+            tags = [tag for tag, ident in self.fake.images.items()
+                    if ident == name or tag == self.normalize(name)]
+            ident = self.fake.images.get(tags[0]) if tags else None
+            digests = sorted(self.fake.digests.get(ident, ()))
+        if ident is None:
+            self.send_json(404, {'message': 'No such image: ' + name})
+        else:
+            self.send_json(200, {'Id': 'sha256:' + ident, 'RepoTags': tags,
+                                 'RepoDigests': digests})
+
+    def do_DELETE(self):
+        path, _ = self.route()
+        tag = self.normalize(path[len('/images/'):])
+        with self.fake.lock:
+            ident = self.fake.images.pop(tag, None)
+            if ident is not None:
+                self.fake.removed.append(tag)
+                deleted = self.delete_unused([ident])
+        if ident is None:
+            self.send_json(404, {'message': 'No such image: ' + tag})
+        else:
+            self.send_json(200, [{'Untagged': tag}] + [
+                {'Deleted': 'sha256:' + ident} for ident in deleted])
+
+    def delete_unused(self, idents):
+        """
+            Delete the images without tags and children, and then
+            their parents that are left without tags and children,
+            like the daemon does. Call with the lock held.
+        """
+        deleted = []
+        while idents:
+            ident = idents.pop()
+            if ident in self.fake.images.values() or \
+                    ident in self.fake.parents.values():
+                continue
+            self.fake.sizes.pop(ident, None)
+            deleted.append(ident)
+            parent = self.fake.parents.pop(ident, None)
+            if parent is not None:
+                idents.append(parent)
+        return deleted
+
+    def do_POST(self):
+        path, params = self.route()
+        body = self.read_body()
+        if path == '/build':
+            with self.fake.lock:
+                self.fake.cache_from[params['t']] = json.loads(
+                    params.get('cachefrom', '[]'))
+            self.build(params['t'], body)
+        elif path == '/images/load':
+            self.load(body)
+        elif path == '/images/create':
+            self.pull(params['fromImage'] + ':' + params.get('tag', 'latest'))
+        elif path == '/images/prune':
+            with self.fake.lock:
+                sizes = dict(self.fake.sizes)
+                deleted = self.delete_unused(list(sizes))
+            self.send_json(200, {
+                'ImagesDeleted': [{'Deleted': 'sha256:' + ident}
+                                  for ident in deleted],
+                'SpaceReclaimed': sum(sizes[ident] for ident in deleted)})
+        elif path.startswith('/images/') and path.endswith('/tag'):
+            self.tag(path[len('/images/'):-len('/tag')],
+                     params['repo'] + ':' + params.get('tag', 'latest'))
+        elif path.startswith('/images/') and path.endswith('/push'):
+            self.push(path[len('/images/'):-len('/push')] + ':' +
+                      params.get('tag', 'latest'))
+        else:
+            self.send_json(404, {'message': 'page not found'})
+
+    def build(self, tag, body):
+        archive = tarfile.open(fileobj=io.BytesIO(body))
+        dockerfile = archive.extractfile('Dockerfile').read().decode('utf-8')
+        steps = [line for line in dockerfile.splitlines()
+                 if line.strip() and not line.startswith('#')]
+        ident = hashlib.sha256(body).hexdigest()[:12]
+        with self.fake.lock:
+            self.fake.builds.append(tag)
+            parent = steps[0].split()[1] if steps else ''
+            missing = self.fake.require_parents and '/' in parent and \
+                self.normalize(parent) not in self.fake.images
+
+        messages = []
+        for number, step in enumerate(steps, 1):
+            layer = hashlib.sha256(step.encode('utf-8') + body).hexdigest()
+            messages.append({'stream': 'Step {}/{} : {}\n'.format(
+                number, len(steps), step)})
+            if step.upper().startswith('RUN'):
+                messages.append({'stream': ' ---> Running in {}\n'.format(
+                    layer[12:24])})
+                for line in range(self.fake.output):
+                    messages.append({'stream': 'output line {}\n'.format(line)})
+                messages.append({'stream': 'Removing intermediate container '
+                                           '{}\n'.format(layer[12:24])})
+            messages.append({'stream': ' ---> {}\n'.format(layer[:12])})
+
+        if missing:
+            messages = [{'error': 'pull access denied for ' + parent}]
+        elif tag in self.fake.failing:
+            messages.append({'error': 'The command returned a non-zero '
+                                      'code: 127'})
+        else:
+            messages.append({'stream': 'Successfully built ' + ident + '\n'})
+            messages.append({'stream': 'Successfully tagged ' + tag + '\n'})
+
+        with self.busy():
+            self.send_stream(messages)
+
+        if tag not in self.fake.failing and not missing:
+            with self.fake.lock:
+                self.fake.images[self.normalize(tag)] = ident
+                self.fake.sizes[ident] = self.fake.size
+                if parent and self.normalize(parent) in self.fake.images:
+                    self.fake.parents[ident] = \
+                        self.fake.images[self.normalize(parent)]
+
+    def tag(self, source, tag):
+        with self.fake.lock:
+            ident = self.fake.images.get(self.normalize(source))
+            if ident is None:
+                for existing in self.fake.images.values():
+                    if existing.startswith(source):
+                        ident = existing
+            if ident is not None:
+                self.fake.images[self.normalize(tag)] = ident
+        if ident is None:
+            self.send_json(404, {'message': 'No such image: ' + source})
+        else:
+            self.send_text(201, '')
+
+    def push(self, tag):
+        with self.fake.lock:
+            ident = self.fake.images.get(self.normalize(tag))
+        if ident is None:
+            self.send_json(404, {'message': 'No such image: ' + tag})
+            return
+
+        repository, version = tag.rsplit(':', 1)
+        digest = manifest_digest(ident)
+        messages = [{'status': 'The push refers to repository '
+                               '[docker.io/{}]'.format(repository)}]
+        for number in range(self.fake.layers):
+            layer = '{}{:04d}'.format(ident[:8], number)
+            messages.append({'status': 'Preparing', 'id': layer,
+                             'progressDetail': {}})
+            for percent in (25, 50, 75, 100):
+                messages.append({
+                    'status': 'Pushing', 'id': layer,
+                    'progressDetail': {'current': percent * 1024,
+                                       'total': 100 * 1024},
+                    'progress': '[{:<50}] {}kB/100kB'.format(
+                        '=' * (percent // 2), percent)})
+            messages.append({'status': 'Pushed', 'id': layer,
+                             'progressDetail': {}})
+        messages.append({'status': '{}: digest: {} size: 1024'.format(
+            version, digest)})
+        messages.append({'progressDetail': {},
+                         'aux': {'Tag': version, 'Digest': digest,
+                                 'Size': 1024}})
+
+        with self.busy():
+            self.send_stream(messages)
+        with self.fake.lock:
+            self.fake.registry[self.normalize(tag)] = ident
+            self.fake.digests.setdefault(ident, set()).add(
+                repository + '@' + digest)
+
+    def pull(self, tag):
+        with self.fake.lock:
+            ident = self.fake.registry.get(self.normalize(tag))
+        if ident is None:
+            self.send_json(404, {'message': 'manifest for {} not found'.format(
+                tag)})
+            return
+
+        self.send_stream([{'status': 'Pulling from ' + tag.rsplit(':', 1)[0]},
+                          {'status': 'Pull complete', 'id': ident[:12]},
+                          {'status': 'Status: Downloaded newer image for ' +
+                                     tag}])
+        with self.fake.lock:
+            self.fake.images[self.normalize(tag)] = ident
+
+    def save(self, tag):
+        with self.fake.lock:
+            ident = self.fake.images.get(self.normalize(tag))
+        if ident is None:
+            self.send_json(404, {'message': 'No such image: ' + tag})
+            return
+
+        manifest = json.dumps([{'Config': ident + '.json',
+                                'RepoTags': [self.normalize(tag)]}])
+        body = io.BytesIO()
+        with tarfile.open(fileobj=body, mode='w') as archive:
+            info = tarfile.TarInfo('manifest.json')
+            info.size = len(manifest)
+            archive.addfile(info, io.BytesIO(manifest.encode('utf-8')))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-tar')
+        self.send_header('Content-Length', str(len(body.getvalue())))
+        self.end_headers()
+        self.wfile.write(body.getvalue())
+
+    def load(self, body):
+        archive = tarfile.open(fileobj=io.BytesIO(body))
+        manifest = json.loads(
+            archive.extractfile('manifest.json').read().decode('utf-8'))
+        messages = []
+        with self.fake.lock:
+            for image in manifest:
+                for tag in image['RepoTags']:
+                    self.fake.images[tag] = image['Config'][:-len('.json')]
+                    messages.append({'stream': 'Loaded image: ' + tag + '\n'})
+        self.send_stream(messages)
+
+    def busy(self):
+        """
+            Context manager that counts the running builds and pushes
+        """
+        fake = self.fake
+
+        class Busy(object):
+            def __enter__(self):
+                with fake.lock:
+                    fake.running += 1
+                    fake.most_running = max(fake.most_running, fake.running)
+
+            def __exit__(self, *args):
+                with fake.lock:
+                    fake.running -= 1
+
+        return Busy()
+
+    @staticmethod
+    def normalize(tag):
+        if ':' not in tag.rsplit('/', 1)[-1]:
+            tag += ':latest'
+        return tag
+
+    def read_body(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            chunks = []
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                if size == 0:
+                    self.rfile.readline()
+                    return b''.join(chunks)
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+        return self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+    def send_text(self, status, text):
+        body = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, content):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_stream(self, messages):
+        """
+            Send json messages in a chunked response, spread over
+            the latency of the daemon
+        """
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        delay = float(self.fake.latency) / len(messages)
+        for message in messages:
+            if delay:
+                time.sleep(delay)
+            data = json.dumps(message).encode('utf-8') + b'\r\n'
+            self.wfile.write('{:x}\r\n'.format(len(data)).encode('ascii') +
+                             data + b'\r\n')
+        self.wfile.write(b'0\r\n\r\n')
+
+
+class FakeRegistry(object):
+    """
+        Fake registry on localhost that answers manifest requests for
+        the images pushed to a fake daemon, use host in the tags
+
+        :param daemon: The fake daemon the images are pushed with
+        :type daemon: FakeDaemon
+
+        :param token: Only answer requests with a token of the token
+                      service of the registry, like dockerhub
+        :type token: bool
+    """
+
+    def __init__(self, daemon, token=False):
+        self.daemon = daemon
+        self.token = token
+        self.requests = []
+        # The scopes tokens were asked for
+        self.scopes = []
+        self.server = None
+        self.host = None
+
+    def start(self):
+        registry = self
+
+        class Handler(FakeRegistryHandler):
+            fake = registry
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.host = 'localhost:{}'.format(self.server.server_address[1])
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class FakeRegistryHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    fake = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = dict((key, values[0])
+                      for key, values in parse_qs(url.query).items())
+        if url.path != '/token' or params.get('service') != 'fake':
+            self.send_error(404)
+            return
+        with self.fake.daemon.lock:
+            self.fake.scopes.append(params.get('scope'))
+        body = json.dumps({'token': TOKEN}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        match = MANIFEST.match(urlparse(self.path).path)
+        if self.fake.token and \
+                self.headers.get('Authorization') != 'Bearer ' + TOKEN:
+            self.send_response(401)
+            self.send_header('WWW-Authenticate', (
+                'Bearer realm="http://{}/token",service="fake",'
+                'scope="repository:{}:pull"').format(
+                    self.fake.host, match.group('name') if match else ''))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        daemon = self.fake.daemon
+        ident = None
+        with daemon.lock:
+            self.fake.requests.append(self.path)
+            if match:
+                tag = '{}/{}:{}'.format(self.fake.host, match.group('name'),
+                                        match.group('reference'))
+                ident = daemon.registry.get(tag)
+        self.send_response(404 if ident is None else 200)
+        if ident is not None:
+            self.send_header('Docker-Content-Digest', manifest_digest(ident))
+        self.send_header('Content-Length', '0')
+        self.end_headers()
@@ -0,0 +1,127 @@
+"""
+    Tests for the asyncio engine against a fake docker daemon
+"""
+import asyncio
+
+import pytest
+
+from boatswain.aio import AsyncBoatswain, AsyncScheduler, DockerSocket
+from boatswain.errors import DaemonError
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def build(description, **kwargs):
+    async with AsyncBoatswain(description, verbose=0, **kwargs) as bosun:
+        return await bosun.build()
+
+
+def test_build(bsfile, daemon):
+    """
+        All images are built and tagged
+    """
+    result = run(build(bsfile, jobs=4))
+    assert result['success']
+    assert sorted(result['images']) == sorted(bsfile['images'])
+    assert sorted(daemon.images) == sorted([
+        'boatswain/image1:pytest', 'boatswain/image12:pytest',
+        'boatswain/image2:pytest', 'boatswain/image3:pytest'])
+    assert len(daemon.requested('POST', '/build')) == 4
+
+
+def test_build_order(bsfile, daemon):
+    """
+        An image is built after the image it is built from
+    """
+    run(build(bsfile, jobs=4))
+    builds = daemon.builds
+    assert builds.index('boatswain/image1:pytest') \
+        < builds.index('boatswain/image2:pytest') \
+        < builds.index('boatswain/image3:pytest')
+
+
+def test_build_failing(bsfile, daemon):
+    """
+        A failing build blocks the images built from it
+    """
+    daemon.failing.add('boatswain/image2:pytest')
+    result = run(build(bsfile, jobs=2, continue_building=True))
+    assert not result['success']
+    assert result['failed'] == ['image2:pytest']
+    assert sorted(result['images']) == ['image1:pytest', 'image4:pytest']
+    assert 'boatswain/image3:pytest' not in daemon.builds
+
+
+def test_build_unreadable_context(bsfile, daemon, unreadable):
+    """
+        An image whose context can not be sent fails
+    """
+    unreadable(bsfile['images']['image2:pytest']['context'])
+    result = run(build(bsfile, continue_building=True))
+    assert not result['success']
+    assert result['failed'] == ['image2:pytest']
+    assert sorted(result['images']) == ['image1:pytest', 'image4:pytest']
+
+
+def test_build_up_to(bsfile, daemon):
+    """
+        Only the image and its dependencies are built
+    """
+    async def build_up_to():
+        async with AsyncBoatswain(bsfile, verbose=0) as bosun:
+            return await bosun.build_up_to('image2:pytest')
+
+    result = run(build_up_to())
+    assert result['images'] == ['image1:pytest', 'image2:pytest']
+
+
+def test_clean_and_push(bsfile, daemon):
+    """
+        Built images can be pushed and removed
+    """
+    async def build_push_clean():
+        async with AsyncBoatswain(bsfile, verbose=0, jobs=4) as bosun:
+            await bosun.build()
+            pushed = await bosun.push()
+            cleaned = await bosun.clean()
+            return pushed, cleaned, dict(bosun.cache)
+
+    pushed, cleaned, cache = run(build_push_clean())
+    assert pushed['success']
+    assert len(daemon.requested('POST', '/images/boatswain/')) == 4
+    assert cleaned['success']
+    assert cleaned['reclaimed'] == 4 * daemon.size
+    assert daemon.images == {}
+    # Removed images are built again by a later build_up_to
+    assert cache == {}
+
+
+def test_daemon_error(daemon):
+    """
+        Error responses of the daemon raise a DaemonError
+    """
+    with pytest.raises(DaemonError) as error:
+        run(DockerSocket(daemon.url).request('DELETE', '/images/missing'))
+    assert 'No such image' in str(error.value)
+
+
+def test_async_scheduler():
+    """
+        Siblings run at the same time on the event loop
+    """
+    running = []
+
+    async def task(name):
+        running.append(name)
+        await asyncio.sleep(0.01)
+        return len(running) == 3 or name == 'c'
+
+    result = run(AsyncScheduler(jobs=3).run(['a', 'b', 'c', 'd'],
+                                            {'c': ['a', 'b']}, task))
+    assert sorted(result['done']) == ['a', 'b', 'c', 'd']
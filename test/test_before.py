@@ -0,0 +1,120 @@
+"""
+    Tests for the before commands of images
+"""
+import sys
+
+import pytest
+
+from boatswain import Boatswain
+
+
+def definition(tmpdir, *commands, **before):
+    before['command'] = list(commands)
+    return {'context': str(tmpdir), 'before': before}
+
+
+@pytest.fixture
+def bosun(bsfile, tmpdir):
+    with Boatswain(bsfile, verbose=1,
+                   state_dir=str(tmpdir.join('.boatswain'))) as bosun:
+        yield bosun
+
+
+def test_output(bosun, tmpdir, capsys):
+    """
+        The output of a command is printed, also when it fails
+    """
+    script = tmpdir.join('stage.py')
+    script.write('import sys\nprint("staged")\nsys.exit("copy failed")\n')
+    assert not bosun.before_command(
+        'image1:pytest', definition(tmpdir, '"{}" {}'.format(
+            sys.executable, script)), verbose=1)
+    output = capsys.readouterr().out
+    assert output.count('staged') == 2
+    assert output.count('copy failed') == 2
+
+
+def test_large_output(bosun, tmpdir, capsys):
+    """
+        Only the last lines of a failing command are kept
+    """
+    script = 'import sys; [print(i) for i in range(100000)]; sys.exit(1)'
+    assert not bosun.before_command(
+        'image1:pytest', definition(tmpdir, '"{}" -c \'{}\''.format(
+            sys.executable, script)), verbose=0)
+    output = capsys.readouterr().out
+    assert '99999' in output
+    assert '\n100\n' not in output
+
+
+def test_unchanged_inputs(bosun, tmpdir):
+    """
+        Commands are skipped when their inputs and outputs did not change
+    """
+    source = tmpdir.join('source.txt')
+    source.write('1')
+    copied = tmpdir.join('copied.txt')
+    runs = tmpdir.join('runs')
+    stage = definition(
+        tmpdir, 'cp {} {}'.format(source, copied),
+        'sh -c "echo run >> {}"'.format(runs),
+        inputs=[str(source)], outputs=[str(copied)])
+
+    assert bosun.before_command('image1:pytest', stage)
+    assert bosun.before_command('image1:pytest', stage)
+    assert runs.read() == 'run\n'
+
+    source.write('22')
+    assert bosun.before_command('image1:pytest', stage)
+    copied.remove()
+    assert bosun.before_command('image1:pytest', stage)
+    assert runs.read() == 'run\n' * 3
+    assert copied.read() == '22'
+
+
+def test_background(bsfile, tmpdir, daemon):
+    """
+        Before commands run ahead of the build of their image
+    """
+    staged = tmpdir.join('staged')
+    for name in ('image1:pytest', 'image3:pytest'):
+        bsfile['images'][name]['before'] = {'command': [
+            'sh -c "echo {} >> {}"'.format(name, staged)]}
+
+    with Boatswain(bsfile, verbose=0, jobs=2) as bosun:
+        assert bosun.build()['success']
+        assert bosun.before_futures == {}
+    assert sorted(staged.read().split()) == ['image1:pytest', 'image3:pytest']
+
+
+def test_after_parent(bsfile, tmpdir, daemon):
+    """
+        Before commands start once the parent of their image is built,
+        and never when the parent failed
+    """
+    for name in ('image2:pytest', 'image3:pytest', 'image4:pytest'):
+        bsfile['images'][name]['before'] = {'command': ['true']}
+    daemon.failing.add('boatswain/image2:pytest')
+    started = {}
+
+    with Boatswain(bsfile, verbose=0, jobs=4,
+                   continue_building=True) as bosun:
+        before_command = bosun.before_command
+
+        def record(name, *args, **kwargs):
+            started[name] = list(daemon.builds)
+            return before_command(name, *args, **kwargs)
+
+        bosun.before_command = record
+        assert not bosun.build()['success']
+    assert sorted(started) == ['image2:pytest', 'image4:pytest']
+    assert 'boatswain/image1:pytest' in started['image2:pytest']
+
+
+def test_no_jobs(bsfile, daemon):
+    """
+        Before commands run with less than one job, like the builds
+    """
+    bsfile['images']['image2:pytest']['before'] = {'command': ['true']}
+    with Boatswain(bsfile, verbose=0, jobs=0) as bosun:
+        assert bosun.build()['success']
@@ -235,3 +235,17 @@ def test_clean_up_to_dict(bsfile):
     with Boatswain(bsfile) as bosun:
         cleaned = bosun.clean_up_to_dict("image3:pytest", {})
         assert not cleaned['images']
+
+
+def test_identical_builds():
+    """
+        Images that only differ in their tag are grouped
+    """
+    images = {
+        'a': {'context': 'test/docker/linux/image1'},
+        'b': {'context': 'test/docker/linux/image1', 'tag': 'b:other'},
+        'c': {'context': 'test/docker/linux/image1', 'from': 'a'},
+        'd': {'context': 'test/docker/linux/image2'},
+    }
+    groups = Boatswain._identical_builds(['a', 'b', 'c', 'd'], images)
+    assert groups == {'a': ['b'], 'c': [], 'd': []}
@@ -0,0 +1,90 @@
+"""
+    Tests for the persistent image cache
+"""
+from boatswain import Boatswain
+from boatswain.cache import ImageCache
+from boatswain.index import ImageIndex
+
+
+class FakeApi(object):
+    def __init__(self, tags):
+        self.tags = tags
+
+    def images(self):
+        return [{'Id': 'sha256:' + ident, 'RepoTags': [tag]}
+                for tag, ident in self.tags.items()]
+
+
+class FakeClient(object):
+    def __init__(self, tags):
+        self.api = FakeApi(tags)
+
+
+def test_roundtrip(tmpdir):
+    """
+        Cached images are loaded again when they still exist
+    """
+    path = str(tmpdir.join('cache.json'))
+    cache = ImageCache(path)
+    cache['image1'] = 'ad8402983js9'
+    cache.tags['image1'] = 'org/image1'
+    cache['dryrun'] = 'testidentifier'
+    cache.save()
+
+    loaded = ImageCache(path)
+    client = FakeClient({'org/image1:latest': 'ad8402983js9' + 52 * '0'})
+    loaded.load(ImageIndex(client))
+    assert loaded == {'image1': 'ad8402983js9'}
+
+
+def test_stale_entries(tmpdir):
+    """
+        Images that were removed or rebuilt are dropped
+    """
+    path = str(tmpdir.join('cache.json'))
+    cache = ImageCache(path)
+    for name in ['removed', 'rebuilt']:
+        cache[name] = 'ad8402983js9'
+        cache.tags[name] = 'org/' + name + ':1.0'
+    cache.save()
+
+    loaded = ImageCache(path)
+    loaded.load(ImageIndex(FakeClient({'org/rebuilt:1.0': 64 * 'f'})))
+    assert loaded == {}
+
+
+def test_not_persistent():
+    """
+        Without a path the cache is an ordinary dictionary
+    """
+    cache = ImageCache()
+    cache.load(ImageIndex(FakeClient({})))
+    cache['image1'] = 'ad8402983js9'
+    cache.save()
+    assert cache == {'image1': 'ad8402983js9'}
+
+
+def test_changed_cached_parent(tmpdir, daemon):
+    """
+        An image waits for its changed parent even when the parent is
+        cached from an earlier run, and is built again on top of it
+    """
+    for name in ('a', 'b'):
+        tmpdir.mkdir(name).join('Dockerfile').write('FROM alpine\n')
+    description = {'version': 1.0, 'organisation': 'boatswain', 'images': {
+        'a:1': {'context': str(tmpdir.join('a'))},
+        'b:1': {'context': str(tmpdir.join('b')), 'from': 'a:1'}}}
+    state = str(tmpdir.join('state'))
+
+    def build():
+        with Boatswain(description, verbose=0, jobs=2, state_dir=state,
+                       persistent_cache=True) as bosun:
+            return bosun.build()
+
+    assert build()['success']
+    tmpdir.join('a', 'Dockerfile').write('FROM alpine\nRUN make\n')
+    result = build()
+    assert result['success']
+    assert sorted(result['images']) == ['a:1', 'b:1']
+    assert result['skipped'] == []
+    assert daemon.builds[2:] == ['boatswain/a:1', 'boatswain/b:1']
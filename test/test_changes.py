@@ -0,0 +1,95 @@
+"""
+    Tests for selecting the images that changed since a git ref
+"""
+import subprocess
+
+import pytest
+import yaml
+
+from boatswain import Boatswain
+from boatswain.changes import changed_images
+from boatswain.errors import GitError
+
+DESCRIPTION = {
+    'version': 1.0,
+    'organisation': 'boatswain',
+    'images': {
+        'base:pytest': {'context': 'base'},
+        'app:pytest': {'context': 'app', 'from': 'base:pytest'},
+        'tool:pytest': {'context': 'tool', 'from': 'app:pytest'},
+        'other:pytest': {'context': 'other'},
+    }
+}
+
+
+def git(*arguments):
+    subprocess.check_call(['git', '-c', 'user.name=pytest',
+                           '-c', 'user.email=pytest@example.com']
+                          + list(arguments), stdout=subprocess.DEVNULL)
+
+
+@pytest.fixture
+def repository(tmpdir, monkeypatch):
+    """
+        A git repository with a committed boatswain file and contexts
+    """
+    monkeypatch.chdir(tmpdir)
+    for definition in DESCRIPTION['images'].values():
+        tmpdir.join(definition['context'], 'Dockerfile').write(
+            u'FROM scratch\n', ensure=True)
+    tmpdir.join('boatswain.yml').write(yaml.safe_dump(DESCRIPTION))
+    git('init', '-q')
+    git('add', '.')
+    git('commit', '-q', '-m', 'initial')
+    return tmpdir
+
+
+def test_unchanged(repository):
+    assert changed_images('HEAD', DESCRIPTION['images']) == []
+
+
+def test_changed_context(repository):
+    """
+        Modified and untracked files select the image of their context
+    """
+    repository.join('app', 'Dockerfile').write(u'FROM alpine\n')
+    repository.join('other', 'new.txt').write(u'new')
+    assert sorted(changed_images('HEAD', DESCRIPTION['images'])) == [
+        'app:pytest', 'other:pytest']
+
+
+def test_state_directory(repository):
+    """
+        The untracked state of boatswain does not change any context
+    """
+    repository.join('.boatswain', 'manifest.json').write(u'{}', ensure=True)
+    images = {'root:pytest': {'context': '.'}}
+    assert changed_images('HEAD', images, excludes=['.boatswain']) == []
+    assert changed_images('HEAD', images) == ['root:pytest']
+
+
+def test_changed_definition(repository):
+    """
+        Images whose definition changed in the boatswain file are selected
+    """
+    description = yaml.safe_load(repository.join('boatswain.yml').read())
+    description['images']['tool:pytest']['tag'] = 'tool:latest'
+    repository.join('boatswain.yml').write(yaml.safe_dump(description))
+    assert changed_images('HEAD', description['images'],
+                          'boatswain.yml') == ['tool:pytest']
+
+
+def test_build_changed(repository):
+    """
+        The changed images and the images built from them are built
+    """
+    repository.join('app', 'Dockerfile').write(u'FROM alpine\n')
+    with Boatswain(DESCRIPTION, verbose=0) as bosun:
+        result = bosun.build_changed('HEAD', dryrun=True)
+    assert result['success']
+    assert sorted(result['images']) == ['app:pytest', 'tool:pytest']
+
+
+def test_unknown_ref(repository):
+    with pytest.raises(GitError):
+        changed_images('nonexistent', DESCRIPTION['images'])
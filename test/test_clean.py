@@ -0,0 +1,97 @@
+"""
+    Tests for removing images, children before their parents
+"""
+import pytest
+
+from boatswain import Boatswain
+import fake_daemon
+
+REMOVED = ['boatswain/image1:pytest', 'boatswain/image2:pytest',
+           'boatswain/image3:pytest']
+
+
+@pytest.fixture
+def daemon(bsfile, daemon):
+    """
+        A daemon that has the images of bsfile
+    """
+    with Boatswain(bsfile, verbose=0) as bosun:
+        assert bosun.build()['success']
+    return daemon
+
+
+def test_clean_order(bsfile, daemon):
+    """
+        Every image is removed after the images built from it, which
+        frees the layers of all of them
+    """
+    with Boatswain(bsfile, verbose=0, jobs=4) as bosun:
+        result = bosun.clean()
+    assert result['success']
+    assert daemon.images == {}
+    removed = [tag for tag in daemon.removed if tag in REMOVED]
+    assert removed == list(reversed(REMOVED))
+    assert daemon.sizes == {}
+    assert result['reclaimed'] == 4 * daemon.size
+    # The disk usage of the daemon is slow to ask for
+    assert daemon.requested('GET', '/system/df') == []
+
+
+def test_clean_dryrun(bsfile, daemon):
+    with Boatswain(bsfile, verbose=0, jobs=4) as bosun:
+        result = bosun.clean(dryrun=True)
+    assert result['success']
+    assert result['reclaimed'] == 0
+    assert len(daemon.images) == 4
+
+
+def test_prune(bsfile, daemon):
+    """
+        Pruning removes the dangling images as well
+    """
+    daemon.sizes['0123456789ab'] = 10000
+    with Boatswain(bsfile, verbose=0) as bosun:
+        assert bosun.clean_up_to('image3:pytest')['reclaimed'] == \
+            3 * daemon.size
+        result = bosun.clean_dict(
+            {'image4:pytest': bsfile['images']['image4:pytest']}, prune=True)
+    assert result['reclaimed'] == daemon.size + 10000
+    assert daemon.sizes == {}
+
+
+def test_clean_missing(bsfile, daemon):
+    """
+        The parent of a missing image is still removed when the clean
+        keeps going, the missing image is reported as failed
+    """
+    del daemon.images['boatswain/image3:pytest']
+    with Boatswain(bsfile, verbose=0, continue_building=True) as bosun:
+        result = bosun.clean()
+    assert not result['success']
+    assert result['failed'] == ['image3:pytest']
+    assert sorted(result['images']) == ['image1:pytest', 'image2:pytest',
+                                        'image4:pytest']
+    assert daemon.images == {}
+
+
+def test_images_not_listed(bsfile, daemon, monkeypatch, capsys):
+    """
+        The images are removed when the daemon does not list them, only
+        the reclaimed space is not known
+    """
+    get = fake_daemon.FakeDaemonHandler.do_GET
+
+    def failing_list(handler):
+        if '/images/json?' in handler.path and 'all=1' in handler.path:
+            handler.route()
+            handler.send_json(500, {'message': 'listing failed'})
+        else:
+            get(handler)
+
+    monkeypatch.setattr(fake_daemon.FakeDaemonHandler, 'do_GET', failing_list)
+    with Boatswain(bsfile, verbose=0) as bosun:
+        result = bosun.clean()
+    assert result['success']
+    assert daemon.images == {}
+    assert result['reclaimed'] == 0
+    assert 'listing failed' in capsys.readouterr().err
@@ -1,5 +1,11 @@
+import json
+import subprocess
+import sys
+
 import pytest
-from boatswain import argparser
+import yaml
+
+from boatswain import Boatswain, argparser
 from boatswain.cli import main
 
 
@@ -10,6 +16,24 @@ def test_image():
     assert args.imagename == 'image2'
 
 
+def test_downstream():
+    parser = argparser()
+    args = parser.parse_args(
+        'clean --downstream image1 --downstream image4'.split())
+    assert args.downstream == ['image1', 'image4']
+    assert parser.parse_args('push'.split()).downstream is None
+
+
+def test_downstream_with_image(bsfile, tmpdir, monkeypatch):
+    boatswain_file = tmpdir.join('boatswain.yml')
+    boatswain_file.write(yaml.safe_dump(bsfile))
+    monkeypatch.setattr(sys, 'argv', ['boatswain', 'build', '-b', str(boatswain_file),
+                                      '--downstream', 'image1:pytest', 'image2:pytest'])
+    with pytest.raises(SystemExit) as exit:
+        main()
+    assert exit.value.code == 2
+
+
 def test_no_image():
     parser = argparser()
     args = parser.parse_args('build'.split())
@@ -24,6 +48,89 @@ def test_verbose():
     assert args.verbose
 
 
+def test_registry_limit():
+    parser = argparser()
+    args = parser.parse_args(
+        'push -j 8 --registry-limit docker.io=2 --registry-limit localhost:5000=4'.split())
+
+    assert args.jobs == 8
+    assert dict(args.registry_limits) == {'docker.io': 2, 'localhost:5000': 4}
+
+
+def test_registry_limit_invalid():
+    parser = argparser()
+    with pytest.raises(SystemExit):
+        parser.parse_args('push --registry-limit docker.io'.split())
+
+
+@pytest.mark.parametrize('command', ['build', 'push', 'clean'])
+@pytest.mark.parametrize('jobs', ['0', '-2', 'many'])
+def test_jobs_invalid(command, jobs):
+    parser = argparser()
+    with pytest.raises(SystemExit):
+        parser.parse_args([command, '-j', jobs])
+
+
+def test_cache_contexts():
+    parser = argparser()
+    assert not parser.parse_args(['build']).cache_contexts
+    assert parser.parse_args(['build', '--cache-contexts']).cache_contexts
+
+
 def test_empty_args():
     with pytest.raises(SystemExit):
         main()
+
+
+def test_trace():
+    parser = argparser()
+    args = parser.parse_args('build --trace build.json'.split())
+
+    assert args.trace == 'build.json'
+
+
+def test_no_docker_import():
+    """
+        Importing the command line interface does not import docker
+    """
+    code = 'import sys, boatswain.cli; sys.exit("docker" in sys.modules)'
+    assert subprocess.call([sys.executable, '-c', code]) == 0
+
+
+def test_offline(bsfile, monkeypatch):
+    """
+        Dry runs do not connect to a docker daemon
+    """
+    monkeypatch.setenv('DOCKER_HOST', 'unix:///nonexistent/docker.sock')
+    with Boatswain(bsfile, verbose=0) as bosun:
+        assert bosun.build(dryrun=True)['success']
+        assert bosun.build_up_to('image3:pytest', dryrun=True)['success']
+        assert bosun.clients == {}
+
+
+def test_tree_offline(bsfile, tmpdir, monkeypatch, capsys):
+    """
+        The tree is printed without a docker daemon
+    """
+    monkeypatch.setenv('DOCKER_HOST', 'unix:///nonexistent/docker.sock')
+    boatswain_file = tmpdir.join('boatswain.yml')
+    boatswain_file.write(yaml.safe_dump(bsfile))
+    monkeypatch.setattr(sys, 'argv',
+                        ['boatswain', 'tree', '-b', str(boatswain_file)])
+    with pytest.raises(SystemExit) as exit:
+        main()
+    assert exit.value.code == 0
+    assert 'image3:pytest' in capsys.readouterr().out
+
+
+def test_tree_json(bsfile, tmpdir, monkeypatch, capsys):
+    """
+        The json tree is the only output
+    """
+    boatswain_file = tmpdir.join('boatswain.yml')
+    boatswain_file.write(yaml.safe_dump(bsfile))
+    monkeypatch.setattr(sys, 'argv', ['boatswain', 'tree', '--format', 'json',
+                                      '-b', str(boatswain_file)])
+    with pytest.raises(SystemExit):
+        main()
+    assert len(json.loads(capsys.readouterr().out)) == 4
@@ -0,0 +1,46 @@
+"""
+    Tests for the docker clients shared within a process
+"""
+from boatswain import Boatswain
+from boatswain.client import pool_size
+
+
+def test_pool_size():
+    assert pool_size(1) == 10
+    assert pool_size(16) == 34
+
+
+def test_shared(bsfile, daemon):
+    """
+        Boatswain objects share the clients of the same daemon
+    """
+    first = Boatswain(bsfile, verbose=0, jobs=8)
+    second = Boatswain(bsfile, verbose=0, jobs=8)
+    assert first.client is second.client
+    assert first.stream_client is second.stream_client
+    assert first.client is not first.stream_client
+
+    adapter = first.client.api._custom_adapter
+    assert adapter.max_pool_size == 18
+    assert first.client.api.timeout == 60
+    # Builds and pushes may be quiet for longer than the timeout
+    assert first.stream_client.api.timeout is None
+
+    assert Boatswain(bsfile, verbose=0, timeout=5).client.api.timeout == 5
+
+
+def test_old_docker(bsfile, daemon, monkeypatch):
+    """
+        docker-py releases before 4.4 do not take a pool size
+    """
+    import docker
+    monkeypatch.setattr(docker, 'version_info', (3, 7, 3))
+    from_env = docker.from_env
+
+    def old_from_env(**kwargs):
+        assert 'max_pool_size' not in kwargs
+        return from_env(**kwargs)
+
+    monkeypatch.setattr(docker, 'from_env', old_from_env)
+    bosun = Boatswain(bsfile, verbose=0, jobs=5)
+    assert bosun.client.api._custom_adapter.max_pool_size == 10
@@ -0,0 +1,68 @@
+"""
+    Tests for loading boatswain files
+"""
+import os
+
+import pytest
+
+from boatswain import description
+from boatswain.description import load_description, parse_description
+
+
+@pytest.fixture
+def boatswain_file(tmpdir):
+    path = tmpdir.join('boatswain.yml')
+    path.write(u"version: 1.0\n"
+               u"organisation: boatswain\n"
+               u"images:\n"
+               u"    image1:pytest:\n"
+               u"        context: image1\n")
+    return str(path)
+
+
+def test_parse():
+    assert parse_description(u'a: [1, b]') == {'a': [1, 'b']}
+
+
+def test_cached(boatswain_file, tmpdir, monkeypatch):
+    """
+        An unchanged file is loaded from the cache without parsing it
+    """
+    cache = str(tmpdir.join('state', 'description.json'))
+    loaded = load_description(boatswain_file, cache=cache)
+    assert loaded['images'] == {'image1:pytest': {'context': 'image1'}}
+
+    def fail(stream):
+        raise AssertionError('parsed again')
+
+    monkeypatch.setattr(description, 'parse_description', fail)
+    assert load_description(boatswain_file, cache=cache) == loaded
+
+
+def test_changed(boatswain_file, tmpdir):
+    """
+        A changed file is parsed again
+    """
+    cache = str(tmpdir.join('description.json'))
+    load_description(boatswain_file, cache=cache)
+
+    with open(boatswain_file, 'a') as yamlfile:
+        yamlfile.write(u'registries: {docker.io: 2}\n')
+    status = os.stat(boatswain_file)
+    os.utime(boatswain_file, (status.st_atime, status.st_mtime + 1))
+
+    assert load_description(boatswain_file, cache=cache)['registries'] == {
+        'docker.io': 2}
+
+
+def test_not_json(tmpdir):
+    """
+        Descriptions json can not represent are not cached
+    """
+    path = tmpdir.join('boatswain.yml')
+    path.write(u'version: 1.0\nreleased: 2019-01-01\n')
+    cache = tmpdir.join('description.json')
+
+    assert load_description(str(path), cache=str(cache))['released'].year \
+        == 2019
+    assert not cache.check()
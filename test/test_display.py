@@ -3,6 +3,8 @@
 
     Currently tests only very basic things
 """
+import json
+
 from boatswain import Tree
 
 
@@ -21,3 +23,57 @@ def test_find_child(bsfile):
 def test_print(bsfile):
     tree = Tree()
     tree.print_boatswain_tree(bsfile)
+
+
+def test_extract_missing_parent(bsfile):
+    del bsfile['images']['image1:pytest']
+    tree = Tree()
+    root = tree.extract_tree(bsfile)
+    assert not root.find_child('image2:pytest')
+    assert root.find_child('image4:pytest')
+
+
+def test_find(bsfile):
+    tree = Tree()
+    tree.extract_tree(bsfile)
+    assert tree.find('image3:pytest').label == 'image3:pytest'
+    assert tree.find('image2:pytest').children == [tree.find('image3:pytest')]
+    assert tree.find('missing') is None
+
+
+def test_render(bsfile):
+    tree = Tree()
+    tree.extract_tree(bsfile)
+    assert tree.render() == (
+        u'\u251c\u2500\u2500 image1:pytest\n'
+        u'\u2502   \u2514\u2500\u2500 image2:pytest\n'
+        u'\u2502       \u2514\u2500\u2500 image3:pytest\n'
+        u'\u2514\u2500\u2500 image4:pytest\n')
+
+
+def test_render_deep():
+    """
+        Long chains of images are rendered without recursion
+    """
+    images = dict(('image{}'.format(index), {'from': 'image{}'.format(index - 1)})
+                  for index in range(1, 5000))
+    images['image0'] = {}
+    tree = Tree()
+    tree.extract_tree({'images': images})
+    lines = tree.render().splitlines()
+    assert len(lines) == 5000
+    assert lines[-1].endswith(u'\u2514\u2500\u2500 image4999')
+
+
+def test_formats(bsfile, capsys):
+    tree = Tree()
+    tree.print_boatswain_tree(bsfile, output_format='json')
+    images = json.loads(capsys.readouterr().out)
+    assert images['image2:pytest'] == {'parent': 'image1:pytest',
+                                       'children': ['image3:pytest']}
+    assert images['image4:pytest']['parent'] is None
+
+    tree.print_boatswain_tree(bsfile, output_format='dot')
+    dot = capsys.readouterr().out
+    assert dot.startswith('digraph boatswain {')
+    assert '"image1:pytest" -> "image2:pytest";' in dot
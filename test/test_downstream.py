@@ -0,0 +1,41 @@
+"""
+    Tests for processing images and the images built from them
+"""
+
+from boatswain import Boatswain
+
+
+def test_build_downstream(bsfile, daemon):
+    """
+        The image and its descendants are built, missing ancestors too
+    """
+    with Boatswain(bsfile, verbose=0) as bosun:
+        result = bosun.build_downstream(['image2:pytest'])
+    assert result['success']
+    assert result['images'] == ['image1:pytest', 'image2:pytest',
+                                'image3:pytest']
+
+    del daemon.builds[:]
+    with Boatswain(bsfile, verbose=0) as bosun:
+        result = bosun.build_downstream(['image2:pytest'], force=True)
+    assert result['images'] == ['image2:pytest', 'image3:pytest']
+    assert daemon.builds == ['boatswain/image2:pytest',
+                             'boatswain/image3:pytest']
+
+
+def test_clean_downstream(bsfile, daemon):
+    with Boatswain(bsfile, verbose=0) as bosun:
+        assert bosun.build()['success']
+        result = bosun.clean_downstream(['image2:pytest'])
+    assert result['success']
+    assert sorted(result['images']) == ['image2:pytest', 'image3:pytest']
+    assert sorted(daemon.images) == ['boatswain/image12:pytest',
+                                     'boatswain/image1:pytest']
+
+
+def test_downstream_undefined(bsfile, daemon):
+    with Boatswain(bsfile, verbose=0) as bosun:
+        result = bosun.push_downstream(['image9:pytest'])
+    assert not result['success']
+    assert result['failed'] == ['image9:pytest']
+    assert daemon.requests == []
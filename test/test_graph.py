@@ -0,0 +1,131 @@
+"""
+    Tests for the boatswain image graph
+"""
+import pytest
+
+from boatswain import Boatswain, ImageGraph, find_dependencies
+from boatswain.errors import DependencyError
+
+
+def test_order(bsfile):
+    """
+        Parents are ordered before their children
+    """
+    order = ImageGraph(bsfile['images']).order()
+    assert sorted(order) == sorted(bsfile['images'])
+    assert order.index('image1:pytest') < order.index('image2:pytest')
+    assert order.index('image2:pytest') < order.index('image3:pytest')
+
+
+def test_order_subset(bsfile):
+    """
+        Parents outside of the names do not constrain the order
+    """
+    graph = ImageGraph(bsfile['images'], ['image3:pytest', 'image4:pytest'])
+    assert graph.order() == ['image3:pytest', 'image4:pytest']
+    assert graph.external() == {'image3:pytest': 'image2:pytest'}
+    assert not graph.undefined()
+
+
+def test_undefined(bsfile):
+    """
+        Parents that are not defined are reported
+    """
+    del bsfile['images']['image1:pytest']
+    graph = ImageGraph(bsfile['images'])
+    assert graph.undefined() == {'image2:pytest': 'image1:pytest'}
+
+
+def test_cycle(bsfile):
+    """
+        Circular dependencies are reported instead of looping forever
+    """
+    bsfile['images']['image1:pytest']['from'] = 'image3:pytest'
+    with pytest.raises(DependencyError) as error:
+        ImageGraph(bsfile['images']).order()
+    assert 'image2:pytest' in str(error.value)
+
+    with pytest.raises(DependencyError):
+        find_dependencies('image3:pytest', bsfile['images'])
+
+
+def test_large_chain():
+    """
+        Ordering a long chain does not requeue names
+    """
+    images = {'image0': {}}
+    for index in range(1, 10000):
+        images['image%d' % index] = {'from': 'image%d' % (index - 1)}
+    names = sorted(images, reverse=True)
+    order = ImageGraph(images, names).order()
+    assert order == ['image%d' % index for index in range(10000)]
+
+
+def test_subtree_sizes(bsfile):
+    """
+        The number of images built from an image, including itself
+    """
+    sizes = ImageGraph(bsfile['images']).subtree_sizes()
+    assert sizes == {'image1:pytest': 3, 'image2:pytest': 2,
+                     'image3:pytest': 1, 'image4:pytest': 1}
+
+
+def test_critical_paths(bsfile):
+    """
+        The longest weighted chain starting at each image
+    """
+    weights = {'image1:pytest': 10, 'image2:pytest': 1, 'image3:pytest': 5}
+    paths = ImageGraph(bsfile['images']).critical_paths(weights)
+    assert paths == {'image1:pytest': 16, 'image2:pytest': 6,
+                     'image3:pytest': 5, 'image4:pytest': 1}
+
+
+def test_descendants(bsfile):
+    """
+        The images built from the given images, directly or indirectly
+    """
+    graph = ImageGraph(bsfile['images'])
+    assert graph.descendants(['image2:pytest']) == [
+        'image2:pytest', 'image3:pytest']
+    assert sorted(graph.descendants(['image1:pytest', 'image4:pytest'])) == [
+        'image1:pytest', 'image2:pytest', 'image3:pytest', 'image4:pytest']
+
+
+def test_ancestors(bsfile):
+    """
+        The images the given images are built from, directly or indirectly
+    """
+    graph = ImageGraph(bsfile['images'])
+    assert graph.ancestors(['image3:pytest']) == [
+        'image3:pytest', 'image2:pytest', 'image1:pytest']
+    assert graph.ancestors(['image3:pytest', 'image2:pytest']) == [
+        'image3:pytest', 'image2:pytest', 'image1:pytest']
+    # Ancestors outside of the graph are left out
+    subset = ImageGraph(bsfile['images'], ['image3:pytest', 'image2:pytest'])
+    assert subset.ancestors(['image3:pytest']) == [
+        'image3:pytest', 'image2:pytest']
+
+
+def test_roots_and_leaves(bsfile):
+    graph = ImageGraph(bsfile['images'])
+    assert sorted(graph.roots()) == ['image1:pytest', 'image4:pytest']
+    assert sorted(graph.leaves()) == ['image3:pytest', 'image4:pytest']
+    subset = ImageGraph(bsfile['images'], ['image3:pytest', 'image2:pytest'])
+    assert subset.roots() == ['image2:pytest']
+
+
+def test_up_to_undefined_parent(bsfile, daemon):
+    """
+        An image built from an undefined image fails with its chain
+        before the daemon is contacted
+    """
+    bsfile['images']['image1:pytest']['from'] = 'image0:pytest'
+    with Boatswain(bsfile, verbose=0) as bosun:
+        result = bosun.build_up_to('image2:pytest')
+        assert not result['success']
+        assert result['failed'] == ['image2:pytest', 'image1:pytest']
+        assert not bosun.push_up_to('image9:pytest')['success']
+        with pytest.raises(DependencyError):
+            bsfile['images']['image0:pytest'] = {'from': 'image2:pytest'}
+            bosun.clean_up_to('image2:pytest')
+    assert daemon.requests == []
@@ -0,0 +1,94 @@
+"""
+    Tests for building on several docker hosts
+"""
+import pytest
+
+from boatswain import Boatswain, ImageGraph
+from boatswain.hosts import assign_hosts
+from fake_daemon import FakeDaemon
+
+FAN_OUT = {
+    'base:pytest': {'context': 'base'},
+    'a:pytest': {'context': 'a', 'from': 'base:pytest'},
+    'b:pytest': {'context': 'b', 'from': 'base:pytest'},
+    'c:pytest': {'context': 'c', 'from': 'base:pytest'},
+    'd:pytest': {'context': 'd', 'from': 'base:pytest'},
+}
+
+
+def test_single_host(bsfile):
+    graph = ImageGraph(bsfile['images'])
+    assert set(assign_hosts(graph, ['one']).values()) == {'one'}
+
+
+def test_subtrees(bsfile):
+    """
+        Subtrees that fit on a host are not split
+    """
+    images = bsfile['images']
+    assignment = assign_hosts(ImageGraph(images), ['one', 'two'])
+    assert assignment['image2:pytest'] == assignment['image1:pytest']
+    assert assignment['image3:pytest'] == assignment['image1:pytest']
+    assert assignment['image4:pytest'] != assignment['image1:pytest']
+
+
+def test_split():
+    """
+        A subtree larger than a share of the work is split over hosts
+    """
+    assignment = assign_hosts(ImageGraph(FAN_OUT), ['one', 'two'])
+    hosts = [assignment[name] for name in FAN_OUT]
+    assert sorted(hosts.count(host) for host in ('one', 'two')) == [2, 3]
+
+
+def test_located_parent():
+    """
+        Images start on the host that has their parent, the parent is
+        only moved once to spread the rest of the work
+    """
+    images = dict(FAN_OUT)
+    del images['base:pytest']
+    assignment = assign_hosts(ImageGraph(images), ['one', 'two'],
+                              located=lambda parent: ['two'])
+    assert sorted(assignment.values()) == ['one', 'one', 'two', 'two']
+
+
+@pytest.fixture
+def fan_out(tmpdir, monkeypatch):
+    monkeypatch.chdir(tmpdir)
+    for name, definition in FAN_OUT.items():
+        parent = definition.get('from')
+        tmpdir.join(definition['context'], 'Dockerfile').write(
+            u'FROM {}\nENV IMAGE={}\n'.format(
+                'boatswain/' + parent if parent else 'alpine:latest', name),
+            ensure=True)
+    return {'version': 1.0, 'organisation': 'boatswain',
+            'images': FAN_OUT}
+
+
+def test_build_on_hosts(fan_out):
+    """
+        Parents are moved to the hosts that build images from them
+    """
+    with FakeDaemon(require_parents=True) as one, \
+            FakeDaemon(require_parents=True) as two:
+        with Boatswain(fan_out, verbose=0, jobs=2,
+                       hosts=[one.url, two.url]) as bosun:
+            result = bosun.build()
+            assert result['success']
+            assert sorted(result['images']) == sorted(FAN_OUT)
+
+        assert len(one.builds) + len(two.builds) == len(FAN_OUT)
+        assert one.builds and two.builds
+        # The base image was moved once to the host without it
+        loads = one.requested('POST', '/images/load') + \
+            two.requested('POST', '/images/load')
+        assert len(loads) == 1
+        assert 'boatswain/base:pytest' in one.images
+        assert 'boatswain/base:pytest' in two.images
+
+        with Boatswain(fan_out, verbose=0, hosts=[one.url, two.url]) as bosun:
+            assert bosun.push()['success']
+            assert bosun.clean()['success']
+        assert len(one.registry) + len(two.registry) == len(FAN_OUT)
+        assert one.images == two.images == {}
@@ -0,0 +1,100 @@
+"""
+    Tests for the image index
+"""
+import docker
+
+from boatswain.index import ImageIndex, normalize_tag, short_id
+
+
+def fake_image(ident, tags, digests=()):
+    return {'Id': 'sha256:' + ident, 'RepoTags': tags,
+            'RepoDigests': list(digests)}
+
+
+class FakeApi(object):
+    def __init__(self, images):
+        self.listed = images
+        self.calls = 0
+
+    def images(self):
+        self.calls += 1
+        return self.listed
+
+
+class FakeClient(object):
+    def __init__(self, images):
+        self.api = FakeApi(images)
+
+
+def make_index():
+    return ImageIndex(FakeClient([
+        fake_image(64 * 'a', ['org/image1:pytest', 'org/image1:latest'],
+                   ['org/image1@sha256:' + 64 * 'd']),
+        fake_image(64 * 'b', ['org/image2:pytest']),
+        fake_image(64 * 'c', ['<none>:<none>']),
+    ]))
+
+
+def test_normalize_tag():
+    assert normalize_tag('org/image') == 'org/image:latest'
+    assert normalize_tag('docker.io/org/image:1.0') == 'org/image:1.0'
+    assert normalize_tag('localhost:5000/org/image') \
+        == 'localhost:5000/org/image:latest'
+
+
+def test_short_id():
+    assert short_id('sha256:' + 64 * 'a') == 12 * 'a'
+    assert short_id('ad8402983js9') == 'ad8402983js9'
+
+
+def test_single_listing():
+    """
+        The daemon is asked for its images only once
+    """
+    index = make_index()
+    assert index.exists('org/image1:pytest')
+    assert index.exists('org/image1')
+    assert not index.exists('org/image3:pytest')
+    assert index.get('org/image2:pytest') == 12 * 'b'
+    assert index.client.api.calls == 1
+    assert index.tags_of(12 * 'c') == set()
+
+
+def test_daemon_listing(daemon):
+    """
+        A snapshot is a single request, whatever the number of images
+    """
+    for number in range(50):
+        daemon.images['org/image{}:pytest'.format(number)] = \
+            '{:012x}'.format(number)
+    index = ImageIndex(docker.from_env())
+    assert index.exists('org/image7:pytest')
+    assert not index.exists('org/image50:pytest')
+    assert daemon.requested('GET', '/images') == ['/images/json']
+
+
+def test_updates():
+    """
+        Built and removed images are tracked
+    """
+    index = make_index()
+    index.add('org/image2:pytest', 'sha256:' + 64 * 'd')
+    assert index.matches('org/image2:pytest', 12 * 'd')
+    assert index.tags_of(12 * 'b') == set()
+
+    index.remove('org/image1:pytest')
+    assert not index.exists('org/image1:pytest')
+    assert index.tags_of(64 * 'a') == set(['org/image1:latest'])
+
+
+def test_digests():
+    """
+        The digest of an image is the one of the repository of the tag
+    """
+    index = make_index()
+    assert index.digest('org/image1:latest') == 'sha256:' + 64 * 'd'
+    assert index.digest('localhost/org/image1:pytest') is None
+    assert index.digest('org/image2:pytest') is None
+    index.add_digest('org/image2:pytest', 'sha256:' + 64 * 'e')
+    assert index.digest('org/image2') is None
+    assert index.digest('org/image2:pytest') == 'sha256:' + 64 * 'e'
@@ -0,0 +1,234 @@
+"""
+    Tests for the build manifest and build contexts
+"""
+import io
+import os
+import tarfile
+
+import pytest
+
+from boatswain import Boatswain
+from boatswain.context import ContextCache, context_files, hash_context, \
+    stream_context
+from boatswain.manifest import BuildManifest
+
+
+def make_context(tmpdir):
+    context = tmpdir.mkdir('context')
+    context.join('Dockerfile').write('FROM alpine\n')
+    context.join('data.txt').write('data')
+    context.join('ignored.log').write('log')
+    context.join('.dockerignore').write('# logs\n*.log\n')
+    return str(context)
+
+
+def test_context_files(tmpdir):
+    """
+        Files excluded by .dockerignore are not part of the context
+    """
+    context = make_context(tmpdir)
+    files = context_files(context)
+    assert 'Dockerfile' in files
+    assert 'data.txt' in files
+    assert 'ignored.log' not in files
+
+
+def test_hash_context(tmpdir):
+    """
+        The hash changes with the content of the files docker sends
+    """
+    context = make_context(tmpdir)
+    original = hash_context(context)
+
+    with open(os.path.join(context, 'ignored.log'), 'w') as logfile:
+        logfile.write('more log')
+    assert hash_context(context) == original
+
+    with open(os.path.join(context, 'data.txt'), 'w') as datafile:
+        datafile.write('other data')
+    assert hash_context(context) != original
+
+
+def test_hash_context_digests(tmpdir):
+    """
+        Digests of unchanged files are reused
+    """
+    context = make_context(tmpdir)
+    digests = {}
+    original = hash_context(context, digests)
+    assert len(digests) == 3
+
+    assert hash_context(context, digests) == original
+
+
+def test_manifest(tmpdir):
+    """
+        A recorded build is found again with the same inputs
+    """
+    context = make_context(tmpdir)
+    path = str(tmpdir.join('state', 'manifest.json'))
+    definition = {'context': context}
+
+    manifest = BuildManifest(path)
+    key = manifest.key(definition)
+    manifest.record('image', key, 'ad8402983js9')
+    manifest.record_duration('image', 12.5)
+    manifest.save()
+
+    manifest = BuildManifest(path)
+    assert manifest.lookup('image', manifest.key(definition)) == 'ad8402983js9'
+    assert manifest.durations == {'image': 12.5}
+    assert manifest.lookup('image', manifest.key(definition, 'parent')) is None
+    assert manifest.lookup('other', key) is None
+
+
+def test_manifest_unreadable(tmpdir):
+    """
+        A broken manifest file is ignored
+    """
+    path = tmpdir.join('manifest.json')
+    path.write('{not json')
+    manifest = BuildManifest(str(path))
+    assert manifest.images == {}
+
+
+def read_archive(chunks):
+    archive = tarfile.open(fileobj=io.BytesIO(b''.join(chunks)))
+    return dict((member.name, archive.extractfile(member).read())
+                for member in archive.getmembers() if member.isfile())
+
+
+def test_stream_context(tmpdir):
+    """
+        The streamed archive holds the files docker would send
+    """
+    context = make_context(tmpdir)
+    files = read_archive(stream_context(context, chunk_size=3))
+    assert files == {'Dockerfile': b'FROM alpine\n', 'data.txt': b'data',
+                     '.dockerignore': b'# logs\n*.log\n'}
+
+
+def test_context_cache(tmpdir):
+    """
+        An unchanged context is streamed from the cached archive
+    """
+    context = make_context(tmpdir)
+    cache = ContextCache(str(tmpdir.join('contexts')))
+    first = b''.join(cache.stream(context))
+    archives = tmpdir.join('contexts').listdir('*.tar')
+    assert len(archives) == 1
+
+    archives[0].write(b'cached')
+    assert b''.join(cache.stream(context)) == b'cached'
+
+    tmpdir.join('context', 'data.txt').write('changed data')
+    assert read_archive([b''.join(cache.stream(context))])['data.txt'] \
+        == b'changed data'
+    assert read_archive([first])['data.txt'] == b'data'
+
+
+def test_context_archive_read(tmpdir):
+    """
+        The archive can be read like a file of known length
+    """
+    context = make_context(tmpdir)
+    archive = stream_context(context, chunk_size=5)
+    blocks = []
+    block = archive.read(100)
+    while block:
+        blocks.append(block)
+        block = archive.read(100)
+    assert len(b''.join(blocks)) == len(archive)
+    assert read_archive(blocks)['data.txt'] == b'data'
+
+
+def test_state_directory_excluded(tmpdir):
+    """
+        The state of boatswain is never part of a context it is kept in
+    """
+    context = make_context(tmpdir)
+    state = os.path.join(context, '.boatswain')
+    manifest = BuildManifest(os.path.join(state, 'manifest.json'), [state])
+    cache = ContextCache(os.path.join(state, 'contexts'), [state])
+    key = manifest.key({'context': context})
+    first = b''.join(cache.stream(context))
+
+    manifest.save()
+    assert '.boatswain' not in context_files(context, [state])
+    assert manifest.key({'context': context}) == key
+    assert sorted(read_archive([b''.join(cache.stream(context))])) == \
+        sorted(read_archive([first]))
+    assert len(b''.join(cache.stream(context))) == len(first)
+
+
+def test_unchanged_current_directory(bsfile, tmpdir, monkeypatch, daemon):
+    """
+        An image whose context holds the state directory is unchanged
+        on the next run
+    """
+    monkeypatch.chdir(tmpdir)
+    tmpdir.join('Dockerfile').write('FROM alpine\n')
+    bsfile['images'] = {'image:pytest': {'context': '.'}}
+    state = str(tmpdir.join('.boatswain'))
+
+    for run in range(3):
+        with Boatswain(bsfile, verbose=0, state_dir=state) as bosun:
+            result = bosun.build()
+        assert result['success']
+    assert result['skipped'] == ['image:pytest']
+    assert daemon.builds == ['boatswain/image:pytest']
+
+
+def test_unreadable_context(bsfile, daemon, unreadable, capsys):
+    """
+        An image whose context can not be sent fails, the others are
+        still built
+    """
+    unreadable(bsfile['images']['image2:pytest']['context'])
+    with Boatswain(bsfile, verbose=0, continue_building=True) as bosun:
+        result = bosun.build()
+    assert not result['success']
+    assert result['failed'] == ['image2:pytest']
+    assert sorted(result['images']) == ['image1:pytest', 'image4:pytest']
+    assert 'could not send the context' in capsys.readouterr().err
+
+
+def test_identical_builds(tmpdir, daemon):
+    """
+        Images that only differ in their tag are built once, tagged
+        with the other tags and then known as unchanged on their own
+    """
+    tmpdir.mkdir('a').join('Dockerfile').write('FROM alpine\n')
+    tmpdir.mkdir('c').join('Dockerfile').write('FROM boatswain/a:2\n')
+    context = str(tmpdir.join('a'))
+    description = {'version': 1.0, 'organisation': 'boatswain', 'images': {
+        'a:1': {'context': context},
+        'a:2': {'context': context},
+        'a:3': {'context': context},
+        'c:1': {'context': str(tmpdir.join('c')), 'from': 'a:2'}}}
+    state = str(tmpdir.join('state'))
+
+    with Boatswain(description, verbose=0, state_dir=state) as bosun:
+        assert bosun.build()['success']
+    assert sorted(daemon.builds) == ['boatswain/a:1', 'boatswain/c:1']
+    assert len(daemon.requested('POST', '/images/')) == 2
+    assert all(path.endswith('/tag')
+               for path in daemon.requested('POST', '/images/'))
+
+    with Boatswain(description, verbose=0, state_dir=state) as bosun:
+        result = bosun.build_up_to('c:1')
+    assert result['success']
+    assert sorted(result['skipped']) == ['a:2', 'c:1']
+    assert len(daemon.builds) == 2
+
+
+@pytest.mark.parametrize('cache_contexts', [False, True])
+def test_cache_contexts(bsfile, tmpdir, daemon, cache_contexts):
+    """
+        The archives of the contexts are only kept when asked for
+    """
+    state = tmpdir.join('state')
+    with Boatswain(bsfile, verbose=0, state_dir=str(state),
+                   cache_contexts=cache_contexts) as bosun:
+        assert bosun.build()['success']
+    assert state.join('contexts').check() == cache_contexts
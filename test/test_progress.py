@@ -0,0 +1,82 @@
+# -*- coding: utf8 -*-
+"""
+    Tests for the progress renderer
+"""
+import io
+import sys
+
+from boatswain.progress import ProgressRenderer, format_bar, format_time
+
+
+class Terminal(io.StringIO):
+    def isatty(self):
+        return True
+
+
+def test_not_a_terminal():
+    """
+        Nothing is drawn and output is not redirected without a terminal
+    """
+    stream = io.StringIO()
+    renderer = ProgressRenderer(stream=stream)
+    renderer.start(2)
+    renderer.add('image1')
+    assert renderer.redirects is None
+    renderer.stop()
+    assert stream.getvalue() == ''
+    assert not renderer.enabled
+
+
+def test_disabled():
+    """
+        A disabled renderer does not draw on a terminal either
+    """
+    stream = Terminal()
+    renderer = ProgressRenderer(enabled=False, stream=stream)
+    renderer.start(2)
+    renderer.stop()
+    assert stream.getvalue() == ''
+
+
+def test_lines():
+    """
+        The total and every image in flight get a line
+    """
+    stream = Terminal()
+    renderer = ProgressRenderer(stream=stream, interval=0)
+    renderer.start(2)
+    renderer.add('image1')
+    renderer.add('image2')
+    renderer.update('image1', 1, 4, 'Step 1/4')
+    frame = stream.getvalue().rsplit('\x1b[J', 1)[-1].splitlines()
+    assert frame[0].startswith('Total')
+    assert 'image1' in frame[1] and 'Step 1/4' in frame[1]
+    assert 'image2' in frame[2]
+
+    renderer.remove('image1')
+    renderer.advance('image1')
+    frame = stream.getvalue().rsplit('\x1b[J', 1)[-1].splitlines()
+    assert len(frame) == 2
+    assert '1/2' in frame[0]
+    renderer.stop()
+
+
+def test_redirect():
+    """
+        Output is printed above the progress while it is shown
+    """
+    stream = Terminal()
+    stdout = sys.stdout
+    renderer = ProgressRenderer(stream=stream, interval=0)
+    renderer.start(1)
+    assert sys.stdout is not stdout
+    sys.stdout.write('partial ')
+    sys.stdout.write('line\n')
+    renderer.stop()
+    assert sys.stdout is stdout
+
+
+def test_format():
+    assert format_time(3725) == '1:02:05'
+    assert format_bar(1, 2, width=4) == u'│██  │'
+    assert format_bar(1, None, width=2) == u'│  │'
@@ -0,0 +1,112 @@
+"""
+    Tests for using pushed images as build cache on empty daemons
+"""
+import asyncio
+import time
+
+import pytest
+
+from boatswain import Boatswain
+from boatswain.aio import AsyncBoatswain
+import fake_daemon
+
+
+@pytest.fixture
+def pushed(bsfile, daemon):
+    """
+        A daemon whose registry has the images, but which has no images
+        itself, like a fresh build machine
+    """
+    with Boatswain(bsfile, verbose=0) as bosun:
+        assert bosun.build()['success']
+        assert bosun.push()['success']
+    daemon.images.clear()
+    return daemon
+
+
+CACHE_FROM = {
+    'boatswain/image1:pytest': ['boatswain/image1:pytest'],
+    'boatswain/image2:pytest': ['boatswain/image2:pytest',
+                                'boatswain/image1:pytest'],
+    'boatswain/image3:pytest': ['boatswain/image3:pytest',
+                                'boatswain/image2:pytest'],
+    'boatswain/image12:pytest': ['boatswain/image12:pytest'],
+}
+
+
+def test_cache_from(bsfile, pushed):
+    """
+        The pushed image and its parent are pulled and used as cache
+    """
+    with Boatswain(bsfile, verbose=0, jobs=2, cache_from=True) as bosun:
+        assert bosun.build()['success']
+    assert pushed.cache_from == CACHE_FROM
+    assert len(pushed.requested('POST', '/images/create')) == 4
+
+
+def test_cache_from_option(bsfile, pushed):
+    """
+        cache_from can be set per image, with extra tags
+    """
+    bsfile['images']['image1:pytest']['cache_from'] = ['boatswain/missing']
+    bsfile['images']['image3:pytest']['cache_from'] = True
+    with Boatswain(bsfile, verbose=0) as bosun:
+        assert bosun.build()['success']
+    # Tags that could not be pulled are not used
+    assert pushed.cache_from['boatswain/image1:pytest'] == [
+        'boatswain/image1:pytest']
+    assert pushed.cache_from['boatswain/image2:pytest'] == []
+    assert pushed.cache_from['boatswain/image3:pytest'] == CACHE_FROM[
+        'boatswain/image3:pytest']
+
+
+def test_no_jobs(bsfile, pushed):
+    """
+        The images are pulled with less than one job, like the builds
+    """
+    with Boatswain(bsfile, verbose=0, jobs=0, cache_from=True) as bosun:
+        assert bosun.build()['success']
+    assert pushed.cache_from == CACHE_FROM
+
+
+def test_never_pushed(bsfile, daemon):
+    with Boatswain(bsfile, verbose=0, cache_from=True) as bosun:
+        assert bosun.build()['success']
+    assert all(tags == [] for tags in daemon.cache_from.values())
+
+
+@pytest.mark.parametrize('jobs', [2, 0])
+def test_async_cache_from(bsfile, pushed, jobs):
+    async def build():
+        async with AsyncBoatswain(bsfile, verbose=0, jobs=jobs,
+                                  cache_from=True) as bosun:
+            return await bosun.build()
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(build())['success']
+    finally:
+        loop.close()
+    assert pushed.cache_from == CACHE_FROM
+
+
+def test_parent_not_pulled(bsfile, pushed, monkeypatch):
+    """
+        A parent built in this run is not pulled as cache of its child,
+        the pull could replace the new parent after its build
+    """
+    pull = fake_daemon.FakeDaemonHandler.pull
+
+    def slow_pull(handler, tag):
+        time.sleep(0.5)
+        pull(handler, tag)
+
+    monkeypatch.setattr(fake_daemon.FakeDaemonHandler, 'pull', slow_pull)
+    pushed.registry['boatswain/image2:pytest'] = 'stale0000000'
+    bsfile['images']['image3:pytest']['cache_from'] = True
+    with Boatswain(bsfile, verbose=0, jobs=2) as bosun:
+        assert bosun.build()['success']
+    assert pushed.images['boatswain/image2:pytest'] != 'stale0000000'
+    assert len(pushed.requested('POST', '/images/create')) == 1
+    assert pushed.cache_from['boatswain/image3:pytest'] == CACHE_FROM[
+        'boatswain/image3:pytest']
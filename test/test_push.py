@@ -1,8 +1,13 @@
 """
     Boatswain test files
 """
+import asyncio
+
 import pytest
 from boatswain import Boatswain
+from boatswain.aio import AsyncBoatswain
+from boatswain.registry import parse_challenge, repository_path
+from fake_daemon import FakeDaemon, FakeRegistry
 
 
 @pytest.mark.skip(reason="Automatic testing of pushing is difficult")
@@ -44,3 +49,140 @@ def test_push_up_to(bsfile):
         assert sorted(pushed, key=str.lower) \
             == sorted(["image3:pytest", "image2:pytest",
                        "image1:pytest"], key=str.lower)
+
+
+@pytest.fixture(params=[False, True], ids=['open', 'token'])
+def registry(bsfile, monkeypatch, request):
+    """
+        A fake registry on localhost the images of bsfile are pushed to,
+        open or only answering with a token like dockerhub
+    """
+    with FakeDaemon() as daemon, \
+            FakeRegistry(daemon, token=request.param) as registry:
+        monkeypatch.setenv('DOCKER_HOST', daemon.url)
+        bsfile['organisation'] = registry.host + '/boatswain'
+        with Boatswain(bsfile, verbose=0) as bosun:
+            assert bosun.build()['success']
+        yield registry
+
+
+def pushes(daemon):
+    return [url for url in daemon.requested('POST', '/images/')
+            if url.endswith('/push')]
+
+
+def test_repository_path():
+    assert repository_path('registry.example.com:5000/org/image:1.0') \
+        == ('org/image', '1.0')
+    assert repository_path('org/image') == ('org/image', 'latest')
+    assert repository_path('ubuntu:18.04') == ('library/ubuntu', '18.04')
+
+
+def test_push_skips_pushed(bsfile, registry):
+    """
+        Images whose digest matches the registry are not pushed again
+    """
+    with Boatswain(bsfile, verbose=0, jobs=4) as bosun:
+        first = bosun.push()
+    assert first['success']
+    assert len(pushes(registry.daemon)) == 4
+    # Nothing was pushed before, the registry is not asked
+    assert registry.requests == []
+
+    tag = registry.host + '/boatswain/image2:pytest'
+    registry.daemon.registry[tag] = 'outdated'
+    with Boatswain(bsfile, verbose=0, jobs=4) as bosun:
+        second = bosun.push()
+    assert second['success']
+    assert second['images'] == ['image2:pytest']
+    assert sorted(second['skipped']) == ['image1:pytest', 'image3:pytest',
+                                         'image4:pytest']
+    assert len(pushes(registry.daemon)) == 5
+    assert len(registry.requests) == 4
+
+
+def test_async_push_skips_pushed(bsfile, registry):
+    with Boatswain(bsfile, verbose=0) as bosun:
+        assert bosun.push()['success']
+
+    async def push():
+        async with AsyncBoatswain(bsfile, verbose=0, jobs=4) as bosun:
+            return await bosun.push()
+
+    loop = asyncio.new_event_loop()
+    try:
+        result = loop.run_until_complete(push())
+    finally:
+        loop.close()
+    assert result['success']
+    assert result['images'] == []
+    assert len(result['skipped']) == 4
+    assert len(pushes(registry.daemon)) == 4
+
+
+def test_push_dryrun(bsfile, registry):
+    """
+        A dry run does not ask the registry for digests
+    """
+    with Boatswain(bsfile, verbose=0) as bosun:
+        assert bosun.push()['success']
+    del registry.requests[:]
+    del registry.scopes[:]
+
+    async def push():
+        async with AsyncBoatswain(bsfile, verbose=0, jobs=4) as bosun:
+            return await bosun.push(dryrun=True)
+
+    with Boatswain(bsfile, verbose=0, jobs=4) as bosun:
+        assert len(bosun.push(dryrun=True)['images']) == 4
+    loop = asyncio.new_event_loop()
+    try:
+        assert len(loop.run_until_complete(push())['images']) == 4
+    finally:
+        loop.close()
+    assert registry.requests == []
+    assert registry.scopes == []
+    assert len(pushes(registry.daemon)) == 4
+
+
+def test_push_registry_unreachable(bsfile, registry, monkeypatch):
+    """
+        When the registry cannot be asked every image is pushed
+    """
+    monkeypatch.setattr('boatswain.registry.registry_url',
+                        lambda host: 'http://127.0.0.1:1')
+    for _ in range(2):
+        with Boatswain(bsfile, verbose=0) as bosun:
+            assert bosun.push()['images']
+    assert len(pushes(registry.daemon)) == 8
+    assert registry.requests == []
+
+
+def test_registry_token(bsfile, registry):
+    """
+        A token is asked once for every repository
+    """
+    if not registry.token:
+        pytest.skip("The registry does not need a token")
+    with Boatswain(bsfile, verbose=0) as bosun:
+        assert bosun.push()['success']
+    with Boatswain(bsfile, verbose=0, jobs=4) as bosun:
+        assert len(bosun.push()['skipped']) == 4
+        bosun.registry.digests.clear()
+        assert bosun.push()['images'] == []
+    assert sorted(registry.scopes) == [
+        'repository:boatswain/image12:pull',
+        'repository:boatswain/image1:pull',
+        'repository:boatswain/image2:pull',
+        'repository:boatswain/image3:pull']
+
+
+def test_parse_challenge():
+    assert parse_challenge(
+        'Bearer realm="https://auth.docker.io/token",'
+        'service="registry.docker.io",scope="repository:library/ubuntu:pull"'
+    ) == ('bearer', {'realm': 'https://auth.docker.io/token',
+                     'service': 'registry.docker.io',
+                     'scope': 'repository:library/ubuntu:pull'})
+    assert parse_challenge('Basic realm="Registry"') == \
+        ('basic', {'realm': 'Registry'})
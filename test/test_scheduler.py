@@ -0,0 +1,132 @@
+"""
+    Tests for the boatswain scheduler
+"""
+import threading
+import time
+
+from boatswain.scheduler import Scheduler
+
+
+def test_dependency_order():
+    """
+        Every name is started after its dependencies are done
+    """
+    order = []
+    dependencies = {'b': ['a'], 'c': ['b'], 'd': ['a']}
+
+    def task(name):
+        order.append(name)
+        return True
+
+    result = Scheduler(jobs=4).run(['c', 'd', 'b', 'a'], dependencies, task)
+    assert sorted(result['done']) == ['a', 'b', 'c', 'd']
+    assert order.index('a') < order.index('b') < order.index('c')
+    assert order.index('a') < order.index('d')
+
+
+def test_parallel_siblings():
+    """
+        Siblings without a shared dependency run at the same time
+    """
+    barrier = threading.Barrier(3, timeout=5)
+
+    def task(name):
+        barrier.wait()
+        return True
+
+    result = Scheduler(jobs=3).run(['a', 'b', 'c'], {}, task)
+    assert sorted(result['done']) == ['a', 'b', 'c']
+
+
+def test_jobs_limit():
+    """
+        No more than jobs tasks run at once
+    """
+    lock = threading.Lock()
+    running = [0, 0]
+
+    def task(name):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return True
+
+    Scheduler(jobs=2).run([str(i) for i in range(8)], {}, task)
+    assert running[1] == 2
+
+
+def test_failure_stops():
+    """
+        The first failure stops scheduling new names
+    """
+    result = Scheduler().run(['a', 'b', 'c'], {}, lambda name: name != 'a')
+    assert result['failed'] == ['a']
+    assert result['done'] == []
+
+
+def test_failure_keep_going():
+    """
+        Dependents of a failed name are blocked, others continue
+    """
+    dependencies = {'b': ['a'], 'c': ['b']}
+    result = Scheduler(keep_going=True).run(
+        ['a', 'b', 'c', 'd'], dependencies, lambda name: name != 'a')
+    assert result['failed'] == ['a']
+    assert result['done'] == ['d']
+    assert sorted(result['blocked']) == ['b', 'c']
+
+
+def test_missing_dependency():
+    """
+        Names depending on an unknown name are blocked
+    """
+    result = Scheduler().run(['a', 'b'], {'b': ['x']}, lambda name: True)
+    assert result['done'] == ['a']
+    assert result['blocked'] == ['b']
+
+
+def test_resource_limits():
+    """
+        No more tasks run at once per resource than its limit
+    """
+    lock = threading.Lock()
+    running = {'slow': 0, 'fast': 0}
+    highest = {'slow': 0, 'fast': 0}
+    resources = dict(('image%d' % index, 'slow' if index % 2 else 'fast')
+                     for index in range(12))
+
+    def task(name):
+        with lock:
+            running[resources[name]] += 1
+            highest[resources[name]] = max(highest[resources[name]],
+                                           running[resources[name]])
+        time.sleep(0.01)
+        with lock:
+            running[resources[name]] -= 1
+        return True
+
+    scheduler = Scheduler(jobs=4, limits={'slow': 1})
+    result = scheduler.run(sorted(resources), {}, task, resources=resources)
+    assert len(result['done']) == 12
+    assert highest['slow'] == 1
+    assert highest['fast'] == 3
+
+
+def test_priorities():
+    """
+        Ready names with a higher priority are started first
+    """
+    order = []
+    dependencies = {'chain2': ['chain1'], 'chain3': ['chain2']}
+    priorities = {'chain1': 3, 'chain2': 2, 'chain3': 1}
+
+    def task(name):
+        order.append(name)
+        return True
+
+    Scheduler().run(['leaf1', 'leaf2', 'chain1', 'chain2', 'chain3'],
+                    dependencies, task, priorities=priorities)
+    assert order == ['chain1', 'chain2', 'chain3', 'leaf1', 'leaf2']
@@ -0,0 +1,57 @@
+# -*- coding: utf8 -*-
+"""
+    Tests for the docker progress stream decoder
+"""
+import json
+
+import pytest
+
+from boatswain.errors import ParseError
+from boatswain.stream import JsonStreamDecoder
+
+
+def encode(*objects):
+    return b''.join(json.dumps(obj).encode('utf-8') + b'\r\n'
+                    for obj in objects)
+
+
+def test_aligned_chunks():
+    """
+        Chunks that contain whole objects
+    """
+    chunks = [encode({'stream': 'Step 1/2 : FROM alpine\n'}),
+              encode({'stream': 'Step 2/2 : ENV A=b\n'},
+                     {'stream': 'Successfully built ad8402983js9\n'})]
+    objects = list(JsonStreamDecoder().decode(chunks))
+    assert len(objects) == 3
+    assert objects[2]['stream'] == 'Successfully built ad8402983js9\n'
+
+
+def test_split_objects():
+    """
+        Objects and multi-byte characters split over chunks
+    """
+    data = encode({'stream': u'█' * 1000}, {'status': 'Pushing'})
+    chunks = [data[index:index + 7] for index in range(0, len(data), 7)]
+    objects = list(JsonStreamDecoder().decode(chunks))
+    assert objects == [{'stream': u'█' * 1000}, {'status': 'Pushing'}]
+
+
+def test_missing_final_newline():
+    """
+        The last object does not need a newline
+    """
+    objects = list(JsonStreamDecoder().decode([b'{"status": "a"}\n{"sta',
+                                               b'tus": "b"}']))
+    assert objects == [{'status': 'a'}, {'status': 'b'}]
+
+
+def test_invalid():
+    """
+        Invalid json is a parse error
+    """
+    with pytest.raises(ParseError):
+        list(JsonStreamDecoder().decode([b'{"status": \n']))
+
+    with pytest.raises(ParseError):
+        list(JsonStreamDecoder().decode([b'{"status": "a"']))
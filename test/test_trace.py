@@ -0,0 +1,60 @@
+"""
+    Tests for the timing trace
+"""
+import json
+import os
+
+from boatswain import Boatswain
+from boatswain.trace import Trace
+
+
+def test_span(tmpdir):
+    """
+        Spans are written as complete events in the lane of their image
+    """
+    path = str(tmpdir.join('trace.json'))
+    trace = Trace(path)
+    with trace.span('image1', 'build', image='image1'):
+        pass
+    trace.complete('Step 1/2 : FROM alpine', 'step', 0, 10, image='image1')
+    trace.save()
+
+    with open(path) as tracefile:
+        events = json.load(tracefile)['traceEvents']
+    spans = [event for event in events if event['ph'] == 'X']
+    assert sorted(span['name'] for span in spans) == [
+        'Step 1/2 : FROM alpine', 'image1']
+    assert all(span['tid'] == 1 for span in spans)
+    lanes = [event for event in events if event['ph'] == 'M']
+    assert lanes[0]['args'] == {'name': 'image1'}
+
+
+def test_disabled():
+    """
+        Without a file nothing is recorded
+    """
+    trace = Trace()
+    with trace.span('image1', 'build'):
+        pass
+    trace.save()
+    assert trace.events == []
+
+
+def test_build_trace(bsfile, tmpdir, daemon):
+    """
+        A build records the images, their steps and context uploads
+    """
+    path = str(tmpdir.join('trace.json'))
+    with Boatswain(bsfile, verbose=0, trace=path) as bosun:
+        assert bosun.build()['success']
+
+    assert os.path.exists(path)
+    with open(path) as tracefile:
+        events = json.load(tracefile)['traceEvents']
+    categories = {}
+    for event in events:
+        if event['ph'] == 'X':
+            categories.setdefault(event['cat'], []).append(event['name'])
+    assert sorted(categories['build']) == sorted(bsfile['images'])
+    assert len(categories['context']) == 8
+    assert 'Step 1/4 : FROM alpine:latest' in categories['step']
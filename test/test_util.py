@@ -2,7 +2,8 @@
     Tests for the boatswain util package
 """
 from boatswain.util import extract_step, extract_id, find_dependencies, \
-    extract_container_id_removal, extract_container_id
+    extract_container_id_removal, extract_container_id, registry_host, split_tag, \
+    size_text
 
 
 def test_extract_step():
@@ -46,3 +47,28 @@ def test_find_dependencies(bsfile):
     dependencies = find_dependencies("image3:pytest", bsfile['images'])
     assert sorted(dependencies, key=str.lower) == sorted(
         ["image3:pytest", "image2:pytest", "image1:pytest"], key=str.lower)
+
+
+def test_registry_host():
+    """
+        Test registry extraction
+    """
+    assert registry_host('myorg/image:1.0') == 'docker.io'
+    assert registry_host('localhost/myorg/image') == 'localhost'
+    assert registry_host('registry.example.com:5000/myorg/image:1.0') \
+        == 'registry.example.com:5000'
+
+
+def test_split_tag():
+    """
+        Test splitting a tag into repository and version
+    """
+    assert split_tag('myorg/image:1.0') == ('myorg/image', '1.0')
+    assert split_tag('myorg/image') == ('myorg/image', 'latest')
+    assert split_tag('localhost:5000/image') == ('localhost:5000/image', 'latest')
+
+
+def test_size_text():
+    assert size_text(512) == '512 B'
+    assert size_text(1536) == '1.5 kB'
+    assert size_text(3 * 1024 ** 3) == '3.0 GB'